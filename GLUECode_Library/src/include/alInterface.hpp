@@ -13,6 +13,17 @@
 #include <memory>
 #include <algorithm>
 
+/**
+ * @brief Table or view BGK results are read from
+ *
+ * The BGKALLRESULTS view also includes results the service has not merged into BGKRESULTS yet
+ */
+#ifdef GLUE_RESULTS_FROM_VIEW
+#define BGK_RESULTS_TABLE "BGKALLRESULTS"
+#else
+#define BGK_RESULTS_TABLE "BGKRESULTS"
+#endif
+
 /**
  * @brief Getter for monotonically increasing ID for GLUE requests for serial applications
  *
@@ -132,7 +143,7 @@ template <typename T> std::string getResultSQLStringReqRange(int mpiRank, char *
 template <> std::string getResultSQLStringReqRange<bgk_result_t>(int mpiRank, char * tag, std::tuple<int,int> reqRange)
 {
 	char sqlBuf[2048];
-	sprintf(sqlBuf, "SELECT * FROM BGKRESULTS WHERE REQ>=%d AND REQ <=%d  AND TAG=\'%s\' AND RANK=%d;", std::get<0>(reqRange), std::get<1>(reqRange), tag, mpiRank);
+	sprintf(sqlBuf, "SELECT * FROM " BGK_RESULTS_TABLE " WHERE REQ>=%d AND REQ <=%d  AND TAG=\'%s\' AND RANK=%d;", std::get<0>(reqRange), std::get<1>(reqRange), tag, mpiRank);
 	std::string retString(sqlBuf);
 	return retString;
 }
@@ -153,7 +164,7 @@ template <typename T> std::string getResultSQLString(int mpiRank, char * tag, in
 template <> std::string getResultSQLString<bgk_result_t>(int mpiRank, char * tag, int reqNum)
 {
 	char sqlBuf[2048];
-	sprintf(sqlBuf, "SELECT * FROM BGKRESULTS WHERE REQ=%d AND TAG=\'%s\' AND RANK=%d;", reqNum, tag, mpiRank);
+	sprintf(sqlBuf, "SELECT * FROM " BGK_RESULTS_TABLE " WHERE REQ=%d AND TAG=\'%s\' AND RANK=%d;", reqNum, tag, mpiRank);
 	std::string retString(sqlBuf);
 	return retString;
 }
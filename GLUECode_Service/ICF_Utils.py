@@ -1382,4 +1382,30 @@ def icfComparator(lhs, rhs, epsilon):
             return False
         if rhs.Charges[i] != 0.0 and (lhs.Charges[i] - rhs.Charges[i]) / rhs.Charges[i] > epsilon:
             return False
-    return retVal
\ No newline at end of file
+    return retVal
+
+
+def icfBatchComparator(lhs, rhs, epsilon, chunkElements=1 << 20):
+    """Batched icfComparator of many requests against many candidates.
+        Inputs are rows of Temperature, Density[0:4], Charges[0:4], and a pair matches under the same rules
+        as icfComparator: no input of the request exceeds the candidate by more than epsilon relative to it,
+        skipping inputs where the candidate is zero.
+        Requests are compared in chunks so temporaries hold about chunkElements values, or one request's
+        comparisons if there are more candidates than that.
+        Returns request and candidate indices of every matching pair, ordered by request then candidate.
+    """
+    lhs = np.asarray(lhs, dtype=np.float64).reshape(-1, 9)
+    rhs = np.asarray(rhs, dtype=np.float64).reshape(-1, 9)
+    skip = rhs == 0.0
+    chunkRows = max(1, chunkElements // max(1, rhs.size))
+    reqIndices = []
+    candIndices = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, len(lhs), chunkRows):
+            exceeds = (lhs[start:start + chunkRows, None, :] - rhs) / rhs > epsilon
+            (reqs, cands) = np.nonzero(~np.any(exceeds & ~skip, axis=2))
+            reqIndices.append(reqs + start)
+            candIndices.append(cands)
+    if len(reqIndices) == 0:
+        return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+    return (np.concatenate(reqIndices), np.concatenate(candIndices))
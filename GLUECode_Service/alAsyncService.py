@@ -0,0 +1,483 @@
+import asyncio
+import concurrent.futures
+import functools
+import sys
+from glueCodeTypes import ALInterfaceMode, SolverCode, ResultProvenance, SchedulerInterface, RequestScanMode, ResultMergeMode, GNDLookupMode
+from alDBHandlers import getDBHandle, getConnectionCounts
+from alInterface import getGNDCount, scanRequestsBatched, scanRequestsPerRank, getTaskMode, \
+    getFakeResult, getAnalyticModeResult, insertResult, insertALPrediction, lookupFGSResult, useAnalyticSolution, \
+    getAnalyticSolution, buildFGSJob, getFGSLaunchCommand, parseJobQueueOutput, mergeBufferTable, \
+    pullGlobalResultsToFastDB, addInFlightFGSJob, requeueExpiredFGSJobs, fanOutFinishedFGSJobs, getRequestArray, \
+    saveServiceCheckpoint, loadServiceCheckpoint, createGNDIndex, getGNDCache, updateGNDCache, getResultCache, getGNDFilter, updateGNDFilter, getMissCache
+from glueCaches import InFlightTable
+from alTrainers import ModelTrainer
+from alStatsHandlers import getStatsHandle
+
+async def launchJobScriptAsync(binary, script, wantReturn, extraArgs=[]):
+    """Launch fine grain simulation's job script without blocking the event loop
+
+    Args:
+        binary (str): Job scheduler binary to call
+        script (str): The path to the job script to run
+        wantReturn (bool): Indicate if the output of the job submission should be returned
+        extraArgs (list, optional): Additional arguments to pass to the job scheduler. Defaults to [].
+
+    Returns:
+        str: Empty strng or the output of the command
+    """
+    try:
+        runproc = await asyncio.create_subprocess_exec(
+            binary, *extraArgs, script,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        (stdout, stderr) = await runproc.communicate()
+        if runproc.returncode == 0:
+            if(wantReturn):
+                return str(stdout,"utf-8")
+            else:
+                return ""
+        else:
+            print(str(stderr,"utf-8"), file=sys.stderr)
+            return ""
+    except FileNotFoundError as err:
+        print(err, file=sys.stderr)
+        return ""
+
+async def getQueueUsabilityAsync(uname, configStruct):
+    """Check if queue is (over)saturated with jobs without blocking the event loop
+
+    Args:
+        uname (str): UID of user running GLUE Code
+        configStruct: Dictionary containing configuration data for simulation
+
+    Raises:
+        Exception: Using Unsupported Scheduler Mode
+
+    Returns:
+        bool: Bool indicating if the scheduler is not saturated
+    """
+    if configStruct['SchedulerInterface'] == SchedulerInterface.SLURM:
+        queueOut = await launchJobScriptAsync("squeue", uname, True, extraArgs=["-u"])
+        maxJobs = configStruct['SlurmScheduler']['MaxSlurmJobs']
+    elif configStruct['SchedulerInterface'] == SchedulerInterface.BLOCKING:
+        return True
+    elif configStruct['SchedulerInterface'] == SchedulerInterface.FLUX:
+        queueOut = await launchJobScriptAsync("flux", "jobs", True)
+        maxJobs = configStruct['FluxScheduler']['ConcurrentJobs']
+    else:
+        raise Exception('Using Unsupported Scheduler Mode')
+    queueState = parseJobQueueOutput(queueOut)
+    return queueState[0] < maxJobs
+
+class AsyncServiceState:
+    """Shared state for the stages of the asyncio service engine
+    """
+    def __init__(self, configStruct, uname):
+        """Constructor for AsyncServiceState
+
+        Args:
+            configStruct: Dictionary containing configuration data for simulation
+            uname (str): UID of user running GLUE Code
+        """
+        serviceSettings = configStruct['ServiceSettings']
+        queueSize = serviceSettings['AsyncQueueSize']
+        self.configStruct = configStruct
+        self.uname = uname
+        self.tag = configStruct['tag']
+        self.packetType = configStruct['solverCode']
+        self.defaultMode = configStruct['glueCodeMode']
+        # Bounded queues between stages so a slow stage applies backpressure
+        self.taskQueue = asyncio.Queue(maxsize=queueSize)
+        self.alQueue = asyncio.Queue(maxsize=queueSize)
+        self.jobQueue = asyncio.Queue(maxsize=queueSize)
+        self.writeQueue = asyncio.Queue(maxsize=queueSize)
+        self.killed = asyncio.Event()
+        # Array to handle missing requests
+        numALRequesters = configStruct['ActiveLearningVariables']['NumberOfRequestingActiveLearners']
+        self.reqArray = getRequestArray(-numALRequesters, configStruct['ExpectedMPIRanks'])
+        # Highest request ROWID seen for this tag if doing batched scans
+        self.scanHWM = 0
+        self.interpModel = None
+        # GND count the model was last retrained at
+        self.GNDcnt = 0
+        self.trainer = ModelTrainer(self.packetType, configStruct['alBackend'], configStruct['DatabaseSettings']['FineGrainDB'], serviceSettings['RetrainWorkers'])
+        # Cache for DB hits
+        self.dbCache = getResultCache(configStruct)
+        # Queued or running fine grain jobs that matching requests can wait on
+        self.inFlight = None
+        if serviceSettings['CoalesceFGSJobs']:
+            self.inFlight = InFlightTable(configStruct['ICFParameters']['RelativeError'], serviceSettings['FGSJobTimeout'])
+        #Set up database handles. Once the service runs these are only used from the database thread
+        self.cgDB = getDBHandle(configStruct['DatabaseSettings']['CoarseGrainDB'], True)
+        self.fgDB = getDBHandle(configStruct['DatabaseSettings']['FineGrainDB'])
+        if serviceSettings['GNDLookupMode'] == GNDLookupMode.RTREE:
+            createGNDIndex(self.fgDB, self.packetType)
+        # Or keep a copy of the GND table to look up results in
+        self.gndCache = getGNDCache(configStruct)
+        # And know which lookups would miss
+        self.gndFilter = getGNDFilter(configStruct)
+        self.missCache = getMissCache(configStruct)
+        # Stages run concurrently, so an iteration of the polling stage also
+        # includes whatever the other stages did in the meantime
+        self.stats = getStatsHandle(configStruct)
+        # Every database call runs on this one thread, so a busy database never stalls the
+        # event loop, and the handles and the tables and caches they fill are never used concurrently
+        self.dbExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="GLUE DB")
+
+async def runDB(state, dbFn, *args):
+    """Run a database call on the database thread without blocking the event loop
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+        dbFn: Function making the database call
+        *args: Arguments to pass to dbFn
+
+    Returns:
+        Whatever dbFn returns
+    """
+    return await asyncio.get_running_loop().run_in_executor(state.dbExecutor, functools.partial(dbFn, *args))
+
+def scanForTasks(state, newTasks):
+    """Scan for new requests and bring the copy or filter of the GND table up to date
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+        newTasks (list): List to append new requests and retried requests of expired jobs to
+    """
+    stats = state.stats
+    with stats.timer('scan'):
+        if state.configStruct['ServiceSettings']['RequestScanMode'] == RequestScanMode.BATCHED:
+            state.scanHWM = scanRequestsBatched(state.packetType, state.tag, state.reqArray, state.scanHWM, state.cgDB, newTasks)
+        else:
+            scanRequestsPerRank(state.packetType, state.tag, state.reqArray, state.cgDB, newTasks)
+    #And retry requests of jobs that seem to have failed
+    if state.inFlight is not None:
+        requeueExpiredFGSJobs(state.inFlight, newTasks)
+    #Bring our copy of the GND table up to date
+    if state.gndCache is not None:
+        with stats.timer('gndUpdate'):
+            updateGNDCache(state.gndCache, state.fgDB, state.packetType)
+    #Or our filter of it
+    if state.gndFilter is not None:
+        with stats.timer('gndUpdate'):
+            updateGNDFilter(state.gndFilter, state.fgDB, state.packetType)
+
+def syncResults(state):
+    """Answer requests waiting on finished jobs and synchronize result tables
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+    """
+    configStruct = state.configStruct
+    stats = state.stats
+    #Answer anything waiting on jobs that finished
+    if state.inFlight is not None:
+        with stats.timer('fanOut'):
+            fanOutFinishedFGSJobs(configStruct, state.inFlight, state.fgDB, state.cgDB)
+    #And now merge and purge buffer tables, which can wait if readers use a view of both
+    if configStruct['ServiceSettings']['ResultMergeMode'] == ResultMergeMode.COPY:
+        with stats.timer('merge'):
+            mergeBufferTable(SolverCode.BGK, state.cgDB)
+    else:
+        with stats.timer('resultInsert'):
+            state.cgDB.flushInserts(False)
+    with stats.timer('pull'):
+        pullGlobalResultsToFastDB(SolverCode.BGK, state.cgDB, state.fgDB)
+
+async def pollRequests(state):
+    """Stage that retrains models, polls for requests, and synchronizes result tables
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+    """
+    configStruct = state.configStruct
+    serviceSettings = configStruct['ServiceSettings']
+    GNDthreshold = configStruct['ActiveLearningVariables']['GNDthreshold']
+    minSleep = serviceSettings['IdleMinSleep']
+    maxSleep = serviceSettings['IdleMaxSleep']
+    checkpointInterval = serviceSettings['CheckpointInterval']
+    loop = asyncio.get_running_loop()
+
+    newTasks = []
+    # Pick up where a previous run left off
+    (state.scanHWM, state.dbCache, state.interpModel, state.GNDcnt) = \
+        await runDB(state, loadServiceCheckpoint, configStruct, state.reqArray, state.cgDB, state.fgDB, newTasks)
+    lastCheckpoint = loop.time()
+    sleepTime = minSleep
+    stats = state.stats
+    while not state.killed.is_set():
+        #Logic to not hammer DB/learner with unnecessary retraining requests
+        with stats.timer('retrain'):
+            nuGNDcnt = await runDB(state, getGNDCount, state.fgDB, state.packetType)
+            if state.defaultMode == ALInterfaceMode.ACTIVELEARNER and ((nuGNDcnt - state.GNDcnt) > GNDthreshold or state.GNDcnt == 0):
+                # Submitting only trains inline if background retraining is disabled, so keep it off the event loop
+                if await loop.run_in_executor(None, state.trainer.submit, nuGNDcnt):
+                    state.GNDcnt = nuGNDcnt
+            if state.defaultMode == ALInterfaceMode.ACTIVELEARNER:
+                # Keep using the current model until a newer one is done, but we need at least one
+                nuModel = await loop.run_in_executor(None, state.trainer.poll, state.interpModel is None)
+                if nuModel is not None:
+                    state.interpModel = nuModel
+        #Now populate the task queue
+        await runDB(state, scanForTasks, state, newTasks)
+        for task in newTasks:
+            await state.taskQueue.put(task)
+        didWork = len(newTasks) > 0
+        del(newTasks[:])
+        await runDB(state, syncResults, state)
+        #Save our place. Requests still queued have no result yet so are requeued on restart
+        if loop.time() - lastCheckpoint >= checkpointInterval:
+            await runDB(state, saveState, state)
+            lastCheckpoint = loop.time()
+        #And sleep if we are idle
+        with stats.timer('idle'):
+            if didWork:
+                sleepTime = minSleep
+                await asyncio.sleep(0)
+            else:
+                try:
+                    await asyncio.wait_for(state.killed.wait(), sleepTime)
+                except asyncio.TimeoutError:
+                    pass
+                sleepTime = min(2.0 * sleepTime, maxSleep)
+        # Writing stats may go to a database too
+        await runDB(state, stats.endIteration)
+
+def saveState(state):
+    """Write checkpoint of service state if checkpointing is enabled
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+    """
+    saveServiceCheckpoint(state.configStruct, state.reqArray, state.scanHWM, state.dbCache, state.interpModel, state.GNDcnt)
+
+async def processTasks(state):
+    """Stage that resolves requests into results or fine grain jobs
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+    """
+    while True:
+        task = await state.taskQueue.get()
+        try:
+            (rank, reqID, requestedMode, taskArgs) = task
+            modeSwitch = getTaskMode(requestedMode, state.defaultMode)
+            if modeSwitch == ALInterfaceMode.FGS or modeSwitch == ALInterfaceMode.FASTFGS:
+                await resolveFGSTask(state, rank, reqID, taskArgs, modeSwitch)
+            elif modeSwitch == ALInterfaceMode.ACTIVELEARNER:
+                # Batched with other active learning requests by `inferALTasks`
+                await state.alQueue.put(task)
+            elif modeSwitch == ALInterfaceMode.FAKE:
+                await queueResult(state, rank, reqID, getFakeResult(taskArgs, state.packetType), ResultProvenance.FAKE)
+            elif modeSwitch == ALInterfaceMode.ANALYTIC:
+                with state.stats.timer('analytic'):
+                    analyticResult = getAnalyticModeResult(taskArgs, state.packetType)
+                await queueResult(state, rank, reqID, analyticResult, ResultProvenance.ANALYTIC)
+            elif modeSwitch == ALInterfaceMode.KILL:
+                state.killed.set()
+        finally:
+            state.taskQueue.task_done()
+
+async def inferALTasks(state):
+    """Stage that evaluates the interpolation model on batches of active learning requests
+
+    Takes every active learning request that is queued when inference starts
+    and evaluates them with a single call to the model
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await state.alQueue.get()]
+        while not state.alQueue.empty():
+            batch.append(state.alQueue.get_nowait())
+        try:
+            # Inference can be slow so keep it off the event loop
+            with state.stats.timer('alInference'):
+                batchResults = await loop.run_in_executor(None, state.interpModel.batchCall, [task[3] for task in batch])
+            for (task, (isLegit, output)) in zip(batch, batchResults):
+                (rank, reqID, requestedMode, taskArgs) = task
+                await state.writeQueue.put(functools.partial(insertALPrediction, taskArgs, output, state.packetType, state.cgDB))
+                if isLegit:
+                    await queueResult(state, rank, reqID, output, ResultProvenance.ACTIVELEARNER)
+                else:
+                    await resolveFGSTask(state, rank, reqID, taskArgs, ALInterfaceMode.FGS)
+        finally:
+            for task in batch:
+                state.alQueue.task_done()
+
+async def queueResult(state, rank, reqID, result, resultProvenance):
+    """Hand result to the database writer stage
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+        rank: Identifier of job originator. Commonly MPI rank
+        reqID: Monotonically increasing ID to use as job ID to look up result later
+        result: Result to write
+        resultProvenance (ResultProvenance): Type of result being inserted
+    """
+    await state.writeQueue.put(functools.partial(insertResult, rank, state.tag, reqID, result, resultProvenance, state.cgDB))
+
+async def resolveFGSTask(state, rank, reqID, inArgs, modeSwitch):
+    """Asynchronous counterpart of `queueFGSJob`
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+        rank: Identifier of job originator. Commonly MPI rank
+        reqID: Monotonically increasing ID to use as job ID to look up result later
+        inArgs: Arguments for fine grain simulation
+        modeSwitch (ALInterfaceMode): Type of fine grain simulation to run
+    """
+    outFGS = await runDB(state, lookupFGSResult, state.configStruct, inArgs, state.fgDB, state.dbCache, state.stats, state.gndCache, state.gndFilter, state.missCache)
+    if outFGS != None:
+        await queueResult(state, rank, reqID, outFGS, ResultProvenance.DB)
+        return
+    with state.stats.timer('analytic'):
+        isAnalytic = useAnalyticSolution(inArgs)
+        if isAnalytic:
+            outFGS = getAnalyticSolution(inArgs)
+    if isAnalytic:
+        await queueResult(state, rank, reqID, outFGS, ResultProvenance.FGS)
+    elif state.inFlight is not None and await runDB(state, attachOrAddInFlight, state, inArgs, modeSwitch, rank, reqID):
+        # An equivalent job is already queued or running and we will share its result
+        pass
+    else:
+        await state.jobQueue.put((rank, reqID, inArgs, modeSwitch))
+
+def attachOrAddInFlight(state, inArgs, modeSwitch, rank, reqID):
+    """Attach request to a matching queued or running job, or record the job about to be queued for it
+
+    Done in one call on the database thread, which also fans out finished jobs,
+    so that other tasks cannot queue a matching job in between
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+        inArgs: Arguments for fine grain simulation
+        modeSwitch (ALInterfaceMode): Type of fine grain simulation to run
+        rank: Identifier of job originator. Commonly MPI rank
+        reqID: Monotonically increasing ID to use as job ID to look up result later
+
+    Returns:
+        bool: True if the request will be answered by a job that is already queued or running
+    """
+    if state.inFlight.attach(inArgs, modeSwitch, rank, reqID):
+        return True
+    addInFlightFGSJob(state.configStruct, state.inFlight, state.fgDB, inArgs, modeSwitch, rank, reqID)
+    return False
+
+async def submitJobs(state):
+    """Stage that builds and submits fine grain jobs once the scheduler has room
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+    """
+    configStruct = state.configStruct
+    maxSleep = configStruct['ServiceSettings']['IdleMaxSleep']
+    while True:
+        (rank, reqID, inArgs, modeSwitch) = await state.jobQueue.get()
+        try:
+            with state.stats.timer('jobSubmit'):
+                while not await getQueueUsabilityAsync(state.uname, configStruct):
+                    await asyncio.sleep(maxSleep)
+                print("Processing REQ=" + str(reqID))
+                scriptFPath = buildFGSJob(configStruct, rank, reqID, inArgs, modeSwitch)
+                if scriptFPath is not None:
+                    (binary, extraArgs, wantReturn) = getFGSLaunchCommand(scriptFPath, configStruct)
+                    await launchJobScriptAsync(binary, scriptFPath, wantReturn, extraArgs=extraArgs)
+        finally:
+            state.jobQueue.task_done()
+
+async def writeResults(state):
+    """Stage that performs database writes handed to it by other stages
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+    """
+    while True:
+        # Group commit everything that was queued together
+        writeFns = [await state.writeQueue.get()]
+        while not state.writeQueue.empty():
+            writeFns.append(state.writeQueue.get_nowait())
+        try:
+            with state.stats.timer('resultInsert'):
+                await runDB(state, writeBatch, state, writeFns)
+        finally:
+            for writeFn in writeFns:
+                state.writeQueue.task_done()
+
+def writeBatch(state, writeFns):
+    """Perform database writes and commit them together
+
+    Args:
+        state (AsyncServiceState): Shared state of the service engine
+        writeFns (list): Functions performing the writes
+    """
+    for writeFn in writeFns:
+        writeFn()
+    state.cgDB.flushInserts(False)
+
+async def runAsyncService(configStruct, uname):
+    """Run all stages of the asyncio service engine until a KILL request is processed
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        uname (str): UID of user running GLUE Code
+    """
+    serviceSettings = configStruct['ServiceSettings']
+    state = AsyncServiceState(configStruct, uname)
+    workers = []
+    for i in range(serviceSettings['AsyncTaskWorkers']):
+        workers.append(asyncio.create_task(processTasks(state)))
+    workers.append(asyncio.create_task(inferALTasks(state)))
+    for i in range(serviceSettings['AsyncJobSubmitters']):
+        workers.append(asyncio.create_task(submitJobs(state)))
+    workers.append(asyncio.create_task(writeResults(state)))
+    poller = asyncio.create_task(pollRequests(state))
+    # Wait for a KILL request, but surface any stage failing first
+    (done, pending) = await asyncio.wait([poller] + workers, return_when=asyncio.FIRST_COMPLETED)
+    for finished in done:
+        if finished.exception() is not None:
+            for worker in workers + [poller]:
+                worker.cancel()
+            state.dbExecutor.shutdown(wait=False)
+            raise finished.exception()
+    # Flush everything already queued before shutting down
+    await state.taskQueue.join()
+    await state.alQueue.join()
+    await state.jobQueue.join()
+    await state.writeQueue.join()
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await runDB(state, state.cgDB.flushInserts)
+    await runDB(state, mergeBufferTable, SolverCode.BGK, state.cgDB)
+    await runDB(state, saveState, state)
+    # Nothing else uses the databases from here on
+    state.dbExecutor.shutdown()
+    state.stats.close()
+    state.trainer.close()
+    #Close Database Connection
+    state.cgDB.closeDB()
+    state.fgDB.closeDB()
+    print("DB cache (entries, hits, misses, evictions): " + str(state.dbCache.getCounts()))
+    if state.gndFilter is not None:
+        print("GND filter (rows, passed, skipped): " + str(state.gndFilter.getCounts()))
+
+def asyncPollAndProcessFGSRequests(configStruct, uname):
+    """General service loop of GLUE Code using asyncio
+
+    Alternative to `pollAndProcessFGSRequests` that runs polling, request processing,
+    job submission, and database writes as concurrent tasks connected by bounded queues,
+    with every database call on a thread of its own, so that a slow scheduler call,
+    inference, or busy database does not stall results for other ranks.
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        uname (str): UID of user running GLUE Code
+    """
+    print("Starting Loop")
+    asyncio.run(runAsyncService(configStruct, uname))
+    print("Loop Done")
+    print("Database connections (opened, reused): " + str(getConnectionCounts()))
@@ -0,0 +1,81 @@
+import os
+import sys
+import pickle
+
+def writeCheckpoint(checkpointURL, checkpoint):
+    """Write service checkpoint so that it can be resumed after a restart
+
+    The checkpoint is written to a temporary file and then renamed so that a
+    crash while writing never leaves a partial checkpoint behind
+
+    Args:
+        checkpointURL (str): Path of checkpoint file
+        checkpoint (dict): Service state to persist
+    """
+    tmpURL = checkpointURL + ".tmp"
+    with open(tmpURL, 'wb') as checkpointFile:
+        pickle.dump(checkpoint, checkpointFile, protocol=pickle.HIGHEST_PROTOCOL)
+        checkpointFile.flush()
+        os.fsync(checkpointFile.fileno())
+    os.replace(tmpURL, checkpointURL)
+
+def readCheckpoint(checkpointURL, tag):
+    """Read service checkpoint if there is a usable one
+
+    Only load checkpoints written by the service itself as they are unpickled
+
+    Args:
+        checkpointURL (str): Path of checkpoint file
+        tag (str): Identifier for this set of data, which must match the checkpoint's
+
+    Returns:
+        dict: Persisted service state, or None if there is no usable checkpoint
+    """
+    if not os.path.exists(checkpointURL):
+        return None
+    try:
+        with open(checkpointURL, 'rb') as checkpointFile:
+            checkpoint = pickle.load(checkpointFile)
+    except Exception as ex:
+        print("Ignoring unreadable checkpoint " + checkpointURL + ": " + str(ex), file=sys.stderr)
+        return None
+    if checkpoint.get('tag') != tag:
+        print("Ignoring checkpoint " + checkpointURL + " written for tag " + str(checkpoint.get('tag')), file=sys.stderr)
+        return None
+    return checkpoint
+
+def packModel(interpModel):
+    """Serialize interpolation model separately from the rest of the checkpoint
+
+    Models that cannot be pickled are skipped and retrained on restart instead
+
+    Args:
+        interpModel (InterpModelWrapper): Function object for active learner, or None
+
+    Returns:
+        bytes: Serialized model, or None
+    """
+    if interpModel is None:
+        return None
+    try:
+        return pickle.dumps(interpModel, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as ex:
+        print("Not checkpointing model: " + str(ex), file=sys.stderr)
+        return None
+
+def unpackModel(modelBytes):
+    """Deserialize interpolation model written by `packModel`
+
+    Args:
+        modelBytes (bytes): Serialized model, or None
+
+    Returns:
+        InterpModelWrapper: Function object for active learner, or None if it could not be restored
+    """
+    if modelBytes is None:
+        return None
+    try:
+        return pickle.loads(modelBytes)
+    except Exception as ex:
+        print("Not restoring checkpointed model: " + str(ex), file=sys.stderr)
+        return None
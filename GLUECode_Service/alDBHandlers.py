@@ -1,3 +1,9 @@
+import os
+import sys
+import time
+import queue
+import threading
+import numpy as np
 from glueCodeTypes import DatabaseMode
 
 class ALDBHandle:
@@ -13,10 +19,21 @@ class ALDBHandle:
             dbConfig (dict): Configuration variables for run
             persistence (bool): Boolean to indicate if this should maintain a persistent database connection
         """
+        self.dbMode = dbConfig["DatabaseMode"]
         self.dbURL = dbConfig["DatabaseURL"]
         self.persistence = persistence
         self.cursor = None
         self.handle = None
+        # Rows waiting to be inserted, grouped by table
+        self.writeBuffer = {}
+        self.bufferedRows = 0
+        self.bufferStart = 0.0
+        self.maxBufferedRows = dbConfig.get("WriteBufferRows", 1024)
+        self.maxBufferAge = dbConfig.get("WriteBufferSeconds", 0.5)
+        # Thread committing flushed rows, started on the first flush if enabled
+        self.writer = None
+        self.writeBehindQueueSize = dbConfig.get("WriteBehindQueueSize", 0)
+        self.dbConfig = dbConfig
     def openCursor(self):
         """Reconnect to DB if needed and return cursor object
 
@@ -35,6 +52,115 @@ class ALDBHandle:
             Exception: Raises exception if not overriden through polymorphism
         """
         raise Exception("Use of Abstract Base Class for ALDBHandle")
+    def executemany(self, query: str, argsList: list):
+        """Submit the same request to database for each set of arguments
+
+        Args:
+            query (str): Query string formatted with args represented as '?'
+            argsList (list): Argument tuples to populate query string with
+
+        Raises:
+            Exception: Raises exception if not overriden through polymorphism
+        """
+        raise Exception("Use of Abstract Base Class for ALDBHandle")
+    def fetchArray(self, query: str, dtype=np.float64, args: tuple=None, sizeHint: int=0, chunkRows: int=4096):
+        """Submit query to database and collect all rows into a NumPy array
+
+        Rows are fetched a chunk at a time straight into an array that grows as needed,
+        so only one chunk of rows exists as Python objects at any point
+
+        Args:
+            query (str): Query string formatted with args represented as '?'
+            dtype (optional): Plain dtype to get a 2D array with a column per field, or structured
+                dtype to get a 1D array of records. NULL becomes NaN for floating point types. Defaults to np.float64.
+            args (tuple, optional): Arguments to populate query string. Defaults to None.
+            sizeHint (int, optional): Expected number of rows to allocate up front. Defaults to 0.
+            chunkRows (int, optional): Number of rows to fetch at a time. Defaults to 4096.
+
+        Returns:
+            numpy.ndarray: Array holding every row of the result
+        """
+        dtype = np.dtype(dtype)
+        self.openCursor()
+        cursor = self.execute(query, args)
+        if dtype.names is None:
+            rowShape = (len(cursor.description),)
+        else:
+            rowShape = ()
+        capacity = max(sizeHint, chunkRows)
+        resultArray = np.empty((capacity,) + rowShape, dtype=dtype)
+        numRows = 0
+        rows = cursor.fetchmany(chunkRows)
+        while len(rows) > 0:
+            if numRows + len(rows) > capacity:
+                # Grow in place where possible rather than copying into a new array
+                capacity = max(2 * capacity, numRows + len(rows))
+                resultArray.resize((capacity,) + rowShape, refcheck=False)
+            resultArray[numRows:numRows + len(rows)] = rows
+            numRows += len(rows)
+            rows = cursor.fetchmany(chunkRows)
+        self.closeCursor()
+        resultArray.resize((numRows,) + rowShape, refcheck=False)
+        return resultArray
+    def bufferInsert(self, table: str, args: tuple):
+        """Queue a row to be inserted with the next group commit
+
+        Rows are flushed once `WriteBufferRows` rows are pending or the oldest pending
+        row is older than `WriteBufferSeconds`, or when `flushInserts` is called
+
+        Args:
+            table (str): Table to insert row in to
+            args (tuple): Values of the row
+        """
+        if self.bufferedRows == 0:
+            self.bufferStart = time.monotonic()
+        self.writeBuffer.setdefault(table, []).append(args)
+        self.bufferedRows += 1
+        if self.bufferedRows >= self.maxBufferedRows or time.monotonic() - self.bufferStart >= self.maxBufferAge:
+            self.flushInserts(False)
+    def flushInserts(self, wait: bool=True):
+        """Insert all buffered rows in a single transaction
+
+        If `WriteBehindQueueSize` is set the rows are handed to a writer thread instead,
+        which holds us up only while its queue is full
+
+        Args:
+            wait (bool, optional): Also wait for the writer thread to commit everything handed to it. Defaults to True.
+        """
+        if self.bufferedRows > 0:
+            if self.writeBehindQueueSize > 0:
+                if self.writer is None:
+                    self.writer = WriteBehindWriter(self.dbConfig, self.writeBehindQueueSize)
+                self.writer.put(self.writeBuffer)
+            else:
+                # Keeps the rows so a later flush can retry the whole transaction if this fails
+                self.insertRows(self.writeBuffer)
+            self.writeBuffer = {}
+            self.bufferedRows = 0
+        if wait:
+            self.waitForWrites()
+    def waitForWrites(self):
+        """Wait for the writer thread to commit every row handed to it, if there is one
+        """
+        if self.writer is not None:
+            self.writer.join()
+    def insertRows(self, tableRows: dict):
+        """Insert rows in to several tables in a single transaction
+
+        Args:
+            tableRows (dict): Table name to list of row tuples
+        """
+        self.openCursor()
+        try:
+            for (table, rows) in tableRows.items():
+                insString = "INSERT INTO " + table + " VALUES(" + ", ".join(["?"] * len(rows[0])) + ");"
+                self.executemany(insString, rows)
+            self.commit()
+        except Exception:
+            self.rollback()
+            self.closeCursor()
+            raise
+        self.closeCursor()
     def closeCursor(self):
         """Closes cursor and, if needed, disconnects fromn DB
 
@@ -45,18 +171,220 @@ class ALDBHandle:
     def commit(self):
         """Calls commit/finalize/fence command for writes to databases
 
+        Raises:
+            Exception: Raises exception if not overriden through polymorphism
+        """
+        raise Exception("Use of Abstract Base Class for ALDBHandle")
+    def rollback(self):
+        """Discards uncommitted writes to database
+
+        Raises:
+            Exception: Raises exception if not overriden through polymorphism
+        """
+        raise Exception("Use of Abstract Base Class for ALDBHandle")
+    def dataVersion(self):
+        """Get a value that changes whenever another connection modifies the database
+
+        Raises:
+            Exception: Raises exception if not overriden through polymorphism
+        """
+        raise Exception("Use of Abstract Base Class for ALDBHandle")
+    def isBusyError(self, ex: Exception):
+        """Check if an exception only means another connection held a lock for too long
+
         Raises:
             Exception: Raises exception if not overriden through polymorphism
         """
         raise Exception("Use of Abstract Base Class for ALDBHandle")
     def closeDB(self):
-        """Disconnects from database
+        """Flushes buffered rows and disconnects from database
 
         Raises:
             Exception: Raises exception if not overriden through polymorphism
         """
         raise Exception("Use of Abstract Base Class for ALDBHandle")
 
+# Pragmas that may be set through the Pragmas block of database settings
+sqlitePragmas = ["busy_timeout", "journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store"]
+# Filesystems that cannot share the WAL index between nodes, so WAL is not safe on them
+networkFilesystems = ["nfs", "nfs4", "lustre", "gpfs", "cifs", "smb3", "beegfs", "fuse.sshfs"]
+# Databases we already warned about falling back from WAL for
+walFallbackURLs = set()
+
+def getFilesystemType(path):
+    """Get type of filesystem a path is on
+
+    Args:
+        path (str): Path of file, which need not exist yet
+
+    Returns:
+        str: Filesystem type from /proc/mounts, or None if it cannot be determined
+    """
+    dirPath = os.path.dirname(os.path.abspath(path))
+    fsType = None
+    mountLength = -1
+    try:
+        with open("/proc/mounts", 'r') as mountsFile:
+            for line in mountsFile:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mountPoint = fields[1]
+                # Longest mount point containing the path wins
+                if (dirPath == mountPoint or dirPath.startswith(mountPoint.rstrip("/") + "/")) and len(mountPoint) > mountLength:
+                    fsType = fields[2]
+                    mountLength = len(mountPoint)
+    except OSError:
+        return None
+    return fsType
+
+def applyPragmas(handle, dbURL, pragmas):
+    """Apply Pragmas block of database settings to a new SQLite connection
+
+    WAL is replaced by the default rollback journal on network filesystems, and
+    if SQLite refuses WAL the database keeps its current journal mode
+
+    Args:
+        handle: Connection to SQLite database
+        dbURL (str): Path of SQLite database
+        pragmas (dict): Pragma names to values
+
+    Raises:
+        Exception: If an unsupported pragma is requested
+    """
+    import sqlite3
+    if len(pragmas) == 0:
+        return
+    for name in pragmas:
+        if name not in sqlitePragmas:
+            raise Exception('Using Unsupported SQLite Pragma ' + str(name))
+    cursor = handle.cursor()
+    # In order so that we wait on locks before switching journal mode
+    for name in sqlitePragmas:
+        if name not in pragmas:
+            continue
+        value = str(pragmas[name])
+        if name == "journal_mode" and value.upper() == "WAL":
+            fsType = getFilesystemType(dbURL)
+            if fsType in networkFilesystems:
+                if dbURL not in walFallbackURLs:
+                    print("WAL is not safe on " + fsType + " so using rollback journal for " + dbURL, file=sys.stderr)
+                    walFallbackURLs.add(dbURL)
+                value = "DELETE"
+        try:
+            result = cursor.execute("PRAGMA " + name + "=" + value + ";").fetchone()
+        except sqlite3.OperationalError as ex:
+            if name != "journal_mode":
+                raise
+            print("Keeping journal mode of " + dbURL + ": " + str(ex), file=sys.stderr)
+            continue
+        if name == "journal_mode" and str(result[0]).upper() != value.upper() and dbURL not in walFallbackURLs:
+            print("SQLite kept " + str(result[0]) + " journal mode for " + dbURL + " instead of " + value, file=sys.stderr)
+            walFallbackURLs.add(dbURL)
+    cursor.close()
+
+class SQLiteConnectionPool:
+    """Idle SQLite connections kept open for reuse by non-persistent handles
+
+    Opening a connection and preparing its statements again for every query
+    dominates short lookups, so handles return connections here instead of
+    closing them. Connections idle for longer than their handle's lifetime are
+    closed rather than reused so a quiet service does not hold on to them
+    """
+    def __init__(self):
+        """Constructor for SQLiteConnectionPool
+        """
+        self.lock = threading.Lock()
+        # Database URL to list of (connection, time released) with the newest last
+        self.idle = {}
+        # Database URL to [connections opened, connections reused]
+        self.counts = {}
+    def connect(self, dbURL, cachedStatements, pragmas):
+        """Open a new connection and count it
+
+        Args:
+            dbURL (str): Path of SQLite database
+            cachedStatements (int): Number of prepared statements the connection keeps
+            pragmas (dict): Pragma names to values to apply to the connection
+
+        Returns:
+            Connection to SQLite database
+        """
+        import sqlite3
+        # Pooled connections may be released and reacquired by different threads, but never used concurrently
+        handle = sqlite3.connect(dbURL, timeout=45.0, cached_statements=cachedStatements, check_same_thread=False)
+        applyPragmas(handle, dbURL, pragmas)
+        with self.lock:
+            self.counts.setdefault(dbURL, [0, 0])[0] += 1
+        return handle
+    def acquire(self, dbURL, cachedStatements, pragmas, idleLifetime):
+        """Get an idle connection, or a new one if none is young enough
+
+        Args:
+            dbURL (str): Path of SQLite database
+            cachedStatements (int): Number of prepared statements a new connection keeps
+            pragmas (dict): Pragma names to values to apply to a new connection
+            idleLifetime (float): Seconds a connection may have been idle to be reused
+
+        Returns:
+            Connection to SQLite database
+        """
+        now = time.monotonic()
+        handle = None
+        expired = []
+        with self.lock:
+            idle = self.idle.get(dbURL, [])
+            while len(idle) > 0 and handle is None:
+                (idleHandle, released) = idle.pop()
+                if now - released <= idleLifetime:
+                    handle = idleHandle
+                    self.counts[dbURL][1] += 1
+                else:
+                    expired.append(idleHandle)
+            # Anything older than what we popped has expired too
+            expired += [idleHandle for (idleHandle, released) in idle]
+            idle.clear()
+        for idleHandle in expired:
+            idleHandle.close()
+        if handle is None:
+            handle = self.connect(dbURL, cachedStatements, pragmas)
+        return handle
+    def release(self, dbURL, handle, idleLifetime):
+        """Return connection for reuse, or close it if connections are not kept
+
+        Args:
+            dbURL (str): Path of SQLite database
+            handle: Connection to SQLite database
+            idleLifetime (float): Seconds the connection may be idle to be reused
+        """
+        if idleLifetime <= 0.0:
+            handle.close()
+            return
+        # Writes that were not committed are dropped as they would be by closing
+        if handle.in_transaction:
+            handle.rollback()
+        with self.lock:
+            self.idle.setdefault(dbURL, []).append((handle, time.monotonic()))
+    def getCounts(self):
+        """Get number of connections opened and reused so far
+
+        Returns:
+            dict: Database URL to tuple of (connections opened, connections reused)
+        """
+        with self.lock:
+            return {dbURL: tuple(counts) for (dbURL, counts) in self.counts.items()}
+
+# Shared by every SQLiteHandle in this process
+sqlitePool = SQLiteConnectionPool()
+
+def getConnectionCounts():
+    """Get number of database connections opened and reused by this process
+
+    Returns:
+        dict: Database URL to tuple of (connections opened, connections reused)
+    """
+    return sqlitePool.getCounts()
+
 class SQLiteHandle(ALDBHandle):
     """Implementation of ALDBHandle for SQLite
     """
@@ -71,19 +399,27 @@ class SQLiteHandle(ALDBHandle):
         ALDBHandle.__init__(self, dbConfig, persistence)
         # And import headers for later
         import sqlite3
+        self.cachedStatements = dbConfig.get("CachedStatements", 256)
+        self.idleLifetime = dbConfig.get("ConnectionIdleSeconds", 30.0)
+        self.pragmas = dbConfig.get("Pragmas", {})
     def openCursor(self):
         """Reconnect to SQLite if needed and return cursor object
 
+        Non-persistent handles take a pooled connection, which `closeCursor` gives back
+
         Returns:
             Cursor object to write directly to SQLite DB
         """
-        # Hopefully duplicate import mostly for linting purposes
-        import sqlite3
-        #Always try/except as we may have closed the DB
+        if self.handle is None:
+            if self.persistence:
+                self.handle = sqlitePool.connect(self.dbURL, self.cachedStatements, self.pragmas)
+            else:
+                self.handle = sqlitePool.acquire(self.dbURL, self.cachedStatements, self.pragmas, self.idleLifetime)
+        #Always try/except as the DB may have been closed under us
         try:
             self.cursor = self.handle.cursor()
         except Exception as ex:
-            self.handle = sqlite3.connect(self.dbURL, timeout=45.0)
+            self.handle = sqlitePool.connect(self.dbURL, self.cachedStatements, self.pragmas)
             self.cursor = self.handle.cursor()
         return self.cursor
     def execute(self, query, args=None):
@@ -101,20 +437,135 @@ class SQLiteHandle(ALDBHandle):
             return self.cursor.execute(procQuery)
         else:
             return self.cursor.execute(procQuery, args)
+    def executemany(self, query, argsList):
+        """Submit the same query to SQLite database for each set of arguments
+
+        Args:
+            query (str): Query string formatted with args represented as '?'
+            argsList (list): Argument tuples to populate query string with
+
+        Returns:
+            Returns result of query for error checking
+        """
+        return self.cursor.executemany(query, argsList)
     def closeCursor(self):
-        """Closes cursor to SQLite database and DB itself if not persistent
+        """Closes cursor to SQLite database and returns DB to pool if not persistent
         """
         self.cursor.close()
         if not self.persistence:
-            self.handle.close()
+            sqlitePool.release(self.dbURL, self.handle, self.idleLifetime)
+            self.handle = None
     def commit(self):
         """Call commit/fence on SQLite database
         """
         self.handle.commit()
+    def rollback(self):
+        """Discard uncommitted writes to SQLite database
+        """
+        self.handle.rollback()
+    def dataVersion(self):
+        """Get SQLite data version of database
+
+        Only meaningful for persistent handles, as the value is tied to the connection
+
+        Returns:
+            int: Value of 'PRAGMA data_version' which changes when other connections commit
+        """
+        self.openCursor()
+        version = self.execute("PRAGMA data_version;").fetchone()[0]
+        self.closeCursor()
+        return version
+    def isBusyError(self, ex):
+        """Check if an exception only means another connection held a lock past the busy timeout
+
+        Args:
+            ex (Exception): Exception raised by a query
+
+        Returns:
+            bool: True if the query can simply be retried
+        """
+        import sqlite3
+        return isinstance(ex, sqlite3.OperationalError) and "locked" in str(ex)
     def closeDB(self):
-        """Close SQLite database
+        """Flush buffered rows and close SQLite database
+        """
+        self.flushInserts()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        # Non-persistent handles already gave their connection back to the pool
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+class WriteBehindWriter:
+    """Thread with its own database connection that commits rows handed to it
+
+    Lets the service keep scanning requests and launching jobs while inserts wait on
+    locks held by other connections. Batches of rows wait in a bounded queue, so the
+    service is held up once `WriteBehindQueueSize` batches are pending. Batches failing
+    on a lock are retried until they go through, so nothing handed over is lost
+    """
+    def __init__(self, dbConfig, queueSize):
+        """Constructor for WriteBehindWriter
+
+        Args:
+            dbConfig (dict): Configuration variables of database to write to
+            queueSize (int): Number of batches that may wait to be committed
+        """
+        writerConfig = dict(dbConfig)
+        writerConfig["WriteBehindQueueSize"] = 0
+        self.dbHandle = getDBHandle(writerConfig, True)
+        self.batches = queue.Queue(queueSize)
+        # First exception that was not a lock timeout, raised on the service thread
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="WriteBehind " + self.dbHandle.dbURL, daemon=True)
+        self.thread.start()
+    def run(self):
+        """Commit batches until told to stop
+        """
+        while True:
+            tableRows = self.batches.get()
+            if tableRows is None:
+                self.batches.task_done()
+                return
+            # After a failure batches are dropped so that joining does not hang
+            while self.error is None:
+                try:
+                    self.dbHandle.insertRows(tableRows)
+                    break
+                except Exception as ex:
+                    if not self.dbHandle.isBusyError(ex):
+                        self.error = ex
+            self.batches.task_done()
+    def checkError(self):
+        """Raise on the calling thread if committing a batch failed
+
+        Raises:
+            Exception: Committing a batch failed
+        """
+        if self.error is not None:
+            raise Exception('Write Behind Insert Into ' + self.dbHandle.dbURL + ' Failed') from self.error
+    def put(self, tableRows):
+        """Hand a batch of rows to the writer, waiting while the queue is full
+
+        Args:
+            tableRows (dict): Table name to list of row tuples
+        """
+        self.checkError()
+        self.batches.put(tableRows)
+    def join(self):
+        """Wait until every batch handed over is committed
+        """
+        self.batches.join()
+        self.checkError()
+    def close(self):
+        """Commit every batch handed over and stop the writer
         """
-        self.handle.close()
+        self.batches.put(None)
+        self.thread.join()
+        self.dbHandle.closeDB()
+        self.checkError()
 
 def getDBHandle(dbConfigDict, persistence=False):
     """Factory to provide desired DBHandle implementation
@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+from glueCodeTypes import IdleStrategy
+from alDBHandlers import getDBHandle
+
+class IdleHandle:
+    """Base Class to Provide Idle Strategies for the Service Loop
+
+    The service loop calls `wait()` once per iteration. Implementations
+    decide how long to sleep based on whether the last iteration did work
+    """
+    def __init__(self, serviceSettings: dict):
+        """Constructor for IdleHandle
+
+        Args:
+            serviceSettings (dict): ServiceSettings block of configuration
+        """
+        self.minSleep = serviceSettings['IdleMinSleep']
+        self.maxSleep = serviceSettings['IdleMaxSleep']
+        self.sleepTime = self.minSleep
+    def wait(self, didWork: bool):
+        """Block until there may be more work to do
+
+        Args:
+            didWork (bool): Indicates if the previous loop iteration processed any requests
+        """
+        pass
+    def close(self):
+        """Release any resources held by the idle handle
+        """
+        pass
+
+class SpinIdleHandle(IdleHandle):
+    """Implementation of IdleHandle that never sleeps
+    """
+    pass
+
+class BackoffIdleHandle(IdleHandle):
+    """Implementation of IdleHandle using adaptive exponential backoff
+    """
+    def wait(self, didWork):
+        """Sleep with exponentially increasing intervals while idle
+
+        Args:
+            didWork (bool): Indicates if the previous loop iteration processed any requests
+        """
+        if didWork:
+            self.sleepTime = self.minSleep
+            return
+        time.sleep(self.sleepTime)
+        self.sleepTime = min(2.0 * self.sleepTime, self.maxSleep)
+
+class DataVersionIdleHandle(IdleHandle):
+    """Implementation of IdleHandle that watches SQLite's data version
+
+    Checking 'PRAGMA data_version' does not read any tables, so it is cheap
+    enough to do every `IdlePollInterval` seconds. Waits return as soon as any other
+    connection commits to either database, or after `IdleMaxSleep` regardless
+    """
+    def __init__(self, serviceSettings, cgDB, fgDBSettings):
+        """Constructor for DataVersionIdleHandle
+
+        Args:
+            serviceSettings (dict): ServiceSettings block of configuration
+            cgDB (ALDBHandle): Persistent handle the service uses for the coarse grain database
+            fgDBSettings (dict): Configuration of the fine grain database
+        """
+        IdleHandle.__init__(self, serviceSettings)
+        self.pollInterval = serviceSettings['IdlePollInterval']
+        # data_version ignores commits made through the same connection, so watching
+        # the service's own coarse grain handle skips wakeups from our own writes.
+        # The fine grain handle is not persistent so we need our own connection there
+        self.fgDB = getDBHandle(fgDBSettings, True)
+        self.dbHandles = [cgDB, self.fgDB]
+        self.versions = self.getVersions()
+    def getVersions(self):
+        """Get current data versions of all watched databases
+
+        Returns:
+            list: Data version of each database
+        """
+        return [dbHandle.dataVersion() for dbHandle in self.dbHandles]
+    def wait(self, didWork):
+        """Sleep until a database changes or the maximum sleep time is reached
+
+        Args:
+            didWork (bool): Indicates if the previous loop iteration processed any requests
+        """
+        if didWork:
+            self.versions = self.getVersions()
+            return
+        deadline = time.monotonic() + self.maxSleep
+        while time.monotonic() < deadline:
+            time.sleep(self.pollInterval)
+            nuVersions = self.getVersions()
+            if nuVersions != self.versions:
+                self.versions = nuVersions
+                return
+    def close(self):
+        """Close watcher database connection
+        """
+        self.fgDB.closeDB()
+
+class InotifyIdleHandle(DataVersionIdleHandle):
+    """Implementation of IdleHandle using inotify on the database directories
+
+    Uses libc directly through ctypes so no additional packages are required.
+    Our own writes also generate events, so pending events are discarded before
+    sleeping and the data version is checked to catch commits made in the meantime.
+    Remote writes on network filesystems (NFS, Lustre) may not generate events,
+    so waits still time out after `IdleMaxSleep`
+    """
+    # Values from <sys/inotify.h>
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    def __init__(self, serviceSettings, cgDB, dbSettingsList):
+        """Constructor for InotifyIdleHandle
+
+        Args:
+            serviceSettings (dict): ServiceSettings block of configuration
+            cgDB (ALDBHandle): Persistent handle the service uses for the coarse grain database
+            dbSettingsList (list): Configuration of coarse and fine grain databases, in that order
+
+        Raises:
+            Exception: inotify is not available on this platform
+        """
+        import ctypes
+        import ctypes.util
+        libcName = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or libcName is None:
+            raise Exception('inotify Is Not Available On This Platform')
+        libc = ctypes.CDLL(libcName, use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK)
+        if self.fd < 0:
+            raise Exception('Failed to Initialize inotify: ' + os.strerror(ctypes.get_errno()))
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        # Watch directories as SQLite also writes journal and WAL files next to the DB
+        watchDirs = set(os.path.dirname(os.path.realpath(dbSettings["DatabaseURL"])) for dbSettings in dbSettingsList)
+        for watchDir in watchDirs:
+            if libc.inotify_add_watch(self.fd, watchDir.encode(), mask) < 0:
+                os.close(self.fd)
+                raise Exception('Failed to Watch ' + watchDir + ': ' + os.strerror(ctypes.get_errno()))
+        DataVersionIdleHandle.__init__(self, serviceSettings, cgDB, dbSettingsList[1])
+    def drain(self):
+        """Discard all pending inotify events
+        """
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+    def wait(self, didWork):
+        """Sleep until a file in a database directory changes or the maximum sleep time is reached
+
+        Args:
+            didWork (bool): Indicates if the previous loop iteration processed any requests
+        """
+        import select
+        # Events caused by our own writes are stale by now
+        self.drain()
+        nuVersions = self.getVersions()
+        if didWork or nuVersions != self.versions:
+            self.versions = nuVersions
+            return
+        select.select([self.fd], [], [], self.maxSleep)
+        self.drain()
+        self.versions = self.getVersions()
+    def close(self):
+        """Close inotify file descriptor and watcher database connection
+        """
+        os.close(self.fd)
+        DataVersionIdleHandle.close(self)
+
+def getIdleHandle(configStruct, cgDB):
+    """Factory to provide desired IdleHandle implementation
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        cgDB (ALDBHandle): Persistent handle the service uses for the coarse grain database
+
+    Raises:
+        Exception: If unsupported idle strategy is selected
+
+    Returns:
+        An object implementing the IdleHandle base class for the specified strategy
+    """
+    serviceSettings = configStruct['ServiceSettings']
+    fgDBSettings = configStruct['DatabaseSettings']['FineGrainDB']
+    dbSettingsList = [
+        configStruct['DatabaseSettings']['CoarseGrainDB'],
+        fgDBSettings
+    ]
+    strategy = serviceSettings['IdleStrategy']
+    if strategy == IdleStrategy.SPIN:
+        return SpinIdleHandle(serviceSettings)
+    elif strategy == IdleStrategy.BACKOFF:
+        return BackoffIdleHandle(serviceSettings)
+    elif strategy == IdleStrategy.DATAVERSION:
+        return DataVersionIdleHandle(serviceSettings, cgDB, fgDBSettings)
+    elif strategy == IdleStrategy.INOTIFY:
+        try:
+            return InotifyIdleHandle(serviceSettings, cgDB, dbSettingsList)
+        except Exception as ex:
+            print(ex, file=sys.stderr)
+            print("Falling back to data version idle strategy", file=sys.stderr)
+            return DataVersionIdleHandle(serviceSettings, cgDB, fgDBSettings)
+    else:
+        raise Exception('Using Unsupported Idle Strategy')
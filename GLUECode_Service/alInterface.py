@@ -6,11 +6,21 @@ import numpy as np
 import subprocess
 import getpass
 import sys
-from glueCodeTypes import ALInterfaceMode, SolverCode, ResultProvenance, LearnerBackend, BGKInputs, BGKMassesInputs, BGKOutputs, BGKMassesOutputs, SchedulerInterface, ProvisioningInterface
-from contextlib import redirect_stdout
-from ICF_Utils import ICFAnalytical_solution, check_zeros_trace_elements, icfComparator
+import bisect
+import contextlib
+import time
+import math
+from glueCodeTypes import ALInterfaceMode, SolverCode, ResultProvenance, LearnerBackend, BGKInputs, BGKMassesInputs, BGKOutputs, BGKMassesOutputs, SchedulerInterface, ProvisioningInterface, RequestScanMode, ServiceEngine, DatabaseMode, ResultMergeMode, GNDLookupMode
+from contextlib import redirect_stdout, redirect_stderr
+from ICF_Utils import ICFAnalytical_solution, check_zeros_trace_elements
 from glueArgParser import processGlueCodeArguments
-from alDBHandlers import getDBHandle
+from glueSQLHelpers import getSyncCursorTableString, getRTreeIndexStrings
+from alDBHandlers import getDBHandle, getConnectionCounts
+from alIdleHandlers import getIdleHandle
+from alTrainers import ModelTrainer
+from alStatsHandlers import getStatsHandle
+from alCheckpoint import writeCheckpoint, readCheckpoint, packModel, unpackModel
+from glueCaches import InFlightTable, GNDCache, ResultCache, GNDFilter, MissCache, getInputValues
 
 def getGroundishTruthVersion(packetType):
     """Get version number associated with packet type
@@ -33,16 +43,109 @@ def getGroundishTruthVersion(packetType):
     else:
         raise Exception('Using Unsupported Solver Code')
 
-def getSelString(packetType, latestID, missingIDs):
+class MissingRequestIDs:
+    """Set of request IDs a rank has made but we have not received, stored as intervals
+
+    IDs go missing in contiguous runs and are usually received in order,
+    so the number of intervals stays small however many requests a rank makes
+    """
+    def __init__(self, intervals=[]):
+        """Constructor for MissingRequestIDs
+
+        Args:
+            intervals (list, optional): Sorted, disjoint (lo, hi) inclusive intervals to start with. Defaults to [].
+        """
+        self.los = [lo for (lo, hi) in intervals]
+        self.his = [hi for (lo, hi) in intervals]
+        self.count = sum(hi - lo + 1 for (lo, hi) in intervals)
+    def __len__(self):
+        return self.count
+    def __contains__(self, reqID):
+        i = bisect.bisect_right(self.los, reqID) - 1
+        return i >= 0 and reqID <= self.his[i]
+    def addRange(self, lo, hi):
+        """Mark IDs lo through hi (inclusive) as missing
+
+        Args:
+            lo (int): First missing ID. Must be greater than all currently missing IDs
+            hi (int): Last missing ID
+
+        Raises:
+            Exception: Range overlaps or precedes currently missing IDs
+        """
+        if hi < lo:
+            return
+        if len(self.his) > 0 and lo <= self.his[-1]:
+            raise Exception('Missing Request IDs Must Be Added In Increasing Order')
+        if len(self.his) > 0 and lo == self.his[-1] + 1:
+            self.his[-1] = hi
+        else:
+            self.los.append(lo)
+            self.his.append(hi)
+        self.count += hi - lo + 1
+    def remove(self, reqID):
+        """Mark ID as received
+
+        Args:
+            reqID (int): ID to remove
+
+        Raises:
+            Exception: ID was not missing
+        """
+        i = bisect.bisect_right(self.los, reqID) - 1
+        if i < 0 or reqID > self.his[i]:
+            raise Exception('Request ID ' + str(reqID) + ' Is Not Missing')
+        lo = self.los[i]
+        hi = self.his[i]
+        if lo == hi:
+            del self.los[i]
+            del self.his[i]
+        elif reqID == lo:
+            self.los[i] = lo + 1
+        elif reqID == hi:
+            self.his[i] = hi - 1
+        else:
+            # Split the interval around the received ID
+            self.his[i] = reqID - 1
+            self.los.insert(i + 1, reqID + 1)
+            self.his.insert(i + 1, hi)
+        self.count -= 1
+    def intervals(self):
+        """Get missing IDs as intervals
+
+        Returns:
+            list: Sorted, disjoint (lo, hi) inclusive intervals
+        """
+        return list(zip(self.los, self.his))
+
+def getRequestArray(firstRank, endRank):
+    """Create bookkeeping entries for every rank we expect requests from
+
+    Active learners that also make requests use negative ranks, so the
+    full range is usually from -NumberOfRequestingActiveLearners to ExpectedMPIRanks
+
+    Args:
+        firstRank (int): Lowest rank to expect requests from
+        endRank (int): One past the highest rank to expect requests from
+
+    Returns:
+        list: Entries of the form [rank, latestID, missingIDs] ordered by rank
+    """
+    return [[rank, -1, MissingRequestIDs()] for rank in range(firstRank, endRank)]
+
+def getSelString(packetType, latestID, missingIDs, maxRanges=32):
     """Generate 'SELECT' string for SQL query on missing results
 
     Generates a 'SELECT' string to pass to SQL in the event that not all data points
-    were available when the previous 'SELECT' command returned.
+    were available when the previous 'SELECT' command returned. Only rows that are
+    missing or newer than `latestID` are requested.
 
     Args:
         packetType (SolverCode): SolverCode enum corresponding to application
         latestID (int): Highest ID value of currently received results
-        missingIDs (list): List of currently missing ID values
+        missingIDs (MissingRequestIDs): Currently missing ID values
+        maxRanges (int, optional): Most missing intervals to list in the query before
+            reading everything past them. Defaults to 32.
 
     Raises:
         Exception: If using unsupported SolverCode enum
@@ -50,20 +153,79 @@ def getSelString(packetType, latestID, missingIDs):
     Returns:
         str: 'SELECT' string to request missing IDs
     """
-    # TODO: Make this smarter
-    minID = 0
-    if len(missingIDs) == 0:
-        minID = latestID + 1
+    intervals = missingIDs.intervals()
+    reqClauses = []
+    for (lo, hi) in intervals[:maxRanges]:
+        reqClauses.append("REQ BETWEEN " + str(lo) + " AND " + str(hi))
+    if len(intervals) > maxRanges:
+        # Too many gaps to list so read everything from the next gap on
+        reqClauses.append("REQ>=" + str(intervals[maxRanges][0]))
+    else:
+        reqClauses.append("REQ>" + str(latestID))
+    if packetType == SolverCode.BGK:
+        return "SELECT * FROM BGKREQS WHERE RANK=? AND (" + " OR ".join(reqClauses) + ") AND TAG=?;"
     else:
-        minID = min(missingIDs)
+        raise Exception('Using Unsupported Solver Code')
+
+def getBatchSelString(packetType):
+    """Generate 'SELECT' string for SQL query on all new requests
+
+    Generates a 'SELECT' string to pass to SQL to pull every request for a tag,
+    across a range of ranks, that was inserted after the last row we have already seen.
+    The first column of each returned row is the ROWID of the request.
+
+    Args:
+        packetType (SolverCode): SolverCode enum corresponding to application
+
+    Raises:
+        Exception: If using unsupported SolverCode enum
+
+    Returns:
+        str: 'SELECT' string to request new rows past the high-water mark
+    """
     if packetType == SolverCode.BGK:
-        return "SELECT * FROM BGKREQS WHERE RANK=? AND REQ>=" + str(minID) + "  AND TAG=?;"
+        return "SELECT ROWID, * FROM BGKREQS WHERE ROWID>? AND TAG=? AND RANK>=? AND RANK<? ORDER BY ROWID;"
     else:
         raise Exception('Using Unsupported Solver Code')
 
+# Inputs of GND tables with an R*Tree index, which takes at most 5 of them
+bgkGNDIndexColumns = ["TEMPERATURE", "DENSITY_0", "DENSITY_1", "DENSITY_2", "DENSITY_3"]
+
+def createGNDIndex(dbHandle, solverCode):
+    """Make sure the GND table has an up to date R*Tree index of its inputs
+
+    Triggers keep the index up to date once it exists. Rows from before it
+    existed are added to it here
+
+    Args:
+        dbHandle (ALDBHandle): Object to access database with the GND table
+        solverCode (SolverCode): SolverCode enum corresponding to simulation
+
+    Raises:
+        Exception: Using Unsupported Solver Code
+    """
+    if solverCode == SolverCode.BGK:
+        # Negative inputs pass the relative error check of any request
+        idxStrings = getRTreeIndexStrings("BGKGND", bgkGNDIndexColumns, True)
+    else:
+        raise Exception('Using Unsupported Solver Code')
+    dbHandle.openCursor()
+    # Other services may be doing the same
+    dbHandle.execute("BEGIN IMMEDIATE;")
+    for idxString in idxStrings:
+        dbHandle.execute(idxString)
+    dbHandle.commit()
+    dbHandle.closeCursor()
+
 def getGNDStringAndTuple(fgsArgs, configStruct):
     """Generate 'SELECT' request for GND truth within specified tolerances
 
+    With the RTREE GND lookup mode, only rows whose indexed inputs are in range of
+    a match are checked. A row matches when the relative error of every nonzero
+    input is below the threshold, which for positive inputs g and input x means
+    x / (1 + relError) < g < x / (1 - relError). Negative inputs always pass, and
+    are indexed with a box spanning every value so that they are always in range
+
     Args:
         fgsArgs: Arguments for fine grain simulation
         configStruct: Dictionary containing configuration data for simulation
@@ -80,7 +242,17 @@ def getGNDStringAndTuple(fgsArgs, configStruct):
         # Percent error acceptable for a match
         relError = configStruct['ICFParameters']['RelativeError']
         # TODO: DRY this for later use
-        selString += "SELECT * FROM BGKGND WHERE "
+        if configStruct['ServiceSettings']['GNDLookupMode'] == GNDLookupMode.RTREE:
+            selString += "SELECT BGKGND.* FROM BGKGND_RTREE, BGKGND WHERE BGKGND.ROWID=BGKGND_RTREE.ID AND "
+            for (column, value) in zip(bgkGNDIndexColumns, [fgsArgs.Temperature] + list(fgsArgs.Density)):
+                if value > 0.0:
+                    # Widened a little so rounding never drops a match at the edge of the range
+                    lower = value / (1.0 + relError) * (1.0 - 1e-9)
+                    upper = value / (1.0 - relError) * (1.0 + 1e-9) if relError < 1.0 else math.inf
+                    selString += column + "_HI>=? AND " + column + "_LO<=? AND "
+                    selTup += (lower, upper)
+        else:
+            selString += "SELECT * FROM BGKGND WHERE "
         #Temperature
         if(fgsArgs.Temperature != 0.0):
             selString += "ABS(? - TEMPERATURE) / TEMPERATURE < ?"
@@ -99,8 +271,12 @@ def getGNDStringAndTuple(fgsArgs, configStruct):
                 selTup += (fgsArgs.Charges[i], relError)
                 selString += " AND "
         #Version
-        selString += "INVERSION=?;"
+        selString += "INVERSION=?"
         selTup += (getGroundishTruthVersion(SolverCode.BGK),)
+        if configStruct['ServiceSettings']['GNDLookupMode'] == GNDLookupMode.RTREE:
+            # The last match is used, so keep the order of a scan
+            selString += " ORDER BY BGKGND.ROWID"
+        selString += ";"
     else:
         raise Exception('Using Unsupported Solver Code')
     return (selString, selTup)
@@ -128,6 +304,23 @@ def processReqRow(sqlRow, packetType):
     else:
         raise Exception('Using Unsupported Solver Code')
 
+def getUnansweredSelString(packetType):
+    """Generate 'SELECT' string for SQL query on requests without a result
+
+    Args:
+        packetType (SolverCode): SolverCode enum corresponding to application
+
+    Raises:
+        Exception: If using unsupported SolverCode enum
+
+    Returns:
+        str: 'SELECT' string to request rows of a tag that have no matching result
+    """
+    if packetType == SolverCode.BGK:
+        return "SELECT q.* FROM BGKREQS q LEFT JOIN BGKRESULTS r ON r.TAG=q.TAG AND r.RANK=q.RANK AND r.REQ=q.REQ WHERE q.TAG=? AND r.REQ IS NULL ORDER BY q.ROWID;"
+    else:
+        raise Exception('Using Unsupported Solver Code')
+
 def writeBGKLammpsInputs(fgsArgs, dirPath, glueMode):
     """Write files for LAMMPS runs for ICF Simulations
 
@@ -314,13 +507,7 @@ def getNumberOfJobsInSlurmQueue(uname):
         int: Number of slurm jobs in queue
     """
     slurmOut = checkSlurmQueue(uname)
-    if slurmOut == "":
-        return (sys.maxsize, [])
-    strList = slurmOut.splitlines()
-    if len(strList) > 1:
-        return (len(strList) - 1, strList[1:])
-    else:
-        return (0, [])
+    return parseJobQueueOutput(slurmOut)
 
 def getNumberOfJobsInFluxQueue():
     """Get the number of active jobs in the flux queue
@@ -329,9 +516,20 @@ def getNumberOfJobsInFluxQueue():
         int: Number of flux jobs in queue
     """
     fluxOut = checkFluxQueue()
-    if fluxOut == "":
+    return parseJobQueueOutput(fluxOut)
+
+def parseJobQueueOutput(queueOut):
+    """Count jobs listed in the output of a scheduler queue command
+
+    Args:
+        queueOut (str): Output of `squeue` or `flux jobs`, or empty string on failure
+
+    Returns:
+        tuple: Number of jobs in queue (sys.maxsize on failure) and the list of job lines
+    """
+    if queueOut == "":
         return (sys.maxsize, [])
-    strList = fluxOut.splitlines()
+    strList = queueOut.splitlines()
     if len(strList) > 1:
         return (len(strList) - 1, strList[1:])
     else:
@@ -355,17 +553,115 @@ def getAllGNDData(dbHandle, solverCode):
         selString = "SELECT * FROM BGKGND;"
     else:
         raise Exception('Using Unsupported Solver Code')
-    dbHandle.openCursor()
-    gndResults = []
-    for row in dbHandle.execute(selString):
-        # Add row to numpy array
-        gndResults.append(row)
-    dbHandle.closeCursor()
-    return np.array(gndResults)
+    # Rows go straight into the array, and the GND count saves growing it along the way
+    return dbHandle.fetchArray(selString, np.float64, sizeHint=getGNDCount(dbHandle, solverCode))
+
+def getGNDCache(configStruct):
+    """Get in-memory copy of GND table if GND lookups are done in memory
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+
+    Returns:
+        GNDCache: Empty in-memory GND table to fill with `updateGNDCache`, or None
+    """
+    if configStruct['ServiceSettings']['GNDLookupMode'] != GNDLookupMode.MEMORY:
+        return None
+    return GNDCache(configStruct['ICFParameters']['RelativeError'])
+
+def readGNDRows(dbHandle, solverCode, rowHWM):
+    """Read GND entries written after a ROWID
+
+    Args:
+        dbHandle (ALDBHandle): Object to access database with the GND table
+        solverCode (SolverCode): SolverCode enum corresponding to simulation
+        rowHWM (int): Highest ROWID already read
+
+    Raises:
+        Exception: Using Unsupported Solver Code
+
+    Returns:
+        tuple: Highest ROWID read, and inputs and outputs of entries of the current version, or None if there are no new entries
+    """
+    if solverCode == SolverCode.BGK:
+        selString = "SELECT ROWID, * FROM BGKGND WHERE ROWID>? ORDER BY ROWID;"
+        # Columns after the ROWID
+        (inputCols, outputCols, versionCols) = (slice(1, 10), slice(11, 23), [10, 23])
+    else:
+        raise Exception('Using Unsupported Solver Code')
+    gndRows = dbHandle.fetchArray(selString, np.float64, args=(rowHWM,))
+    if len(gndRows) == 0:
+        return None
+    # Entries of other versions never match
+    isCurrent = np.all(gndRows[:, versionCols] == getGroundishTruthVersion(solverCode), axis=1)
+    return (int(gndRows[-1, 0]), gndRows[isCurrent, inputCols], gndRows[isCurrent, outputCols])
+
+def updateGNDCache(gndCache, dbHandle, solverCode):
+    """Add GND entries written since the last update to the in-memory GND table
+
+    Args:
+        gndCache (GNDCache): In-memory copy of GND table
+        dbHandle (ALDBHandle): Object to access database with the GND table
+        solverCode (SolverCode): SolverCode enum corresponding to simulation
+    """
+    newRows = readGNDRows(dbHandle, solverCode, gndCache.rowHWM)
+    if newRows is not None:
+        gndCache.add(newRows[0], newRows[1], newRows[2])
+
+def getGNDFilter(configStruct):
+    """Get Bloom filter of GND inputs if it is enabled and GND lookups are done in the database
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+
+    Returns:
+        GNDFilter: Empty filter to fill with `updateGNDFilter`, or None
+    """
+    serviceSettings = configStruct['ServiceSettings']
+    if not serviceSettings['GNDBloomFilter'] or serviceSettings['GNDLookupMode'] == GNDLookupMode.MEMORY:
+        return None
+    return GNDFilter(configStruct['ICFParameters']['RelativeError'], serviceSettings['GNDFilterFalsePositiveRate'])
+
+def updateGNDFilter(gndFilter, dbHandle, solverCode):
+    """Add GND entries written since the last update to the filter, or rebuild it from the whole table if needed
+
+    Args:
+        gndFilter (GNDFilter): Bloom filter of GND inputs
+        dbHandle (ALDBHandle): Object to access database with the GND table
+        solverCode (SolverCode): SolverCode enum corresponding to simulation
+    """
+    if gndFilter.needsRebuild():
+        allRows = readGNDRows(dbHandle, solverCode, 0)
+        if allRows is None:
+            gndFilter.rebuild(0, np.empty((0, 0)))
+        else:
+            gndFilter.rebuild(allRows[0], allRows[1])
+        return
+    newRows = readGNDRows(dbHandle, solverCode, gndFilter.rowHWM)
+    if newRows is not None:
+        gndFilter.add(newRows[0], newRows[1])
+
+def getMissCache(configStruct):
+    """Get cache of inputs that just missed in the GND table if it is enabled
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+
+    Returns:
+        MissCache: Empty cache, or None
+    """
+    lifetime = configStruct['ServiceSettings']['GNDMissCacheLifetime']
+    if lifetime <= 0.0:
+        return None
+    return MissCache(lifetime)
 
 def getGNDCount(dbHandle, solverCode):
     """Get number of GND entries in table for simulation
 
+    GND entries are only ever appended, so the largest ROWID tracks the number of
+    entries. SQLite finds it with a single B-tree lookup instead of counting every row,
+    so this stays cheap enough to call every iteration however large the table gets
+
     Args:
         dbHandle (ALDBHandle): Object to access database
         solverCode (SolverCode): SolverCode enum corresponding to simulation
@@ -378,14 +674,15 @@ def getGNDCount(dbHandle, solverCode):
     """
     selString = ""
     if solverCode == SolverCode.BGK:
-        selString = "SELECT COUNT(*)  FROM BGKGND;"
+        selString = "SELECT MAX(ROWID) FROM BGKGND;"
     else:
         raise Exception('Using Unsupported Solver Code')
     dbHandle.openCursor()
     numGND = 0
     for row in dbHandle.execute(selString):
-        # Should just be one row with one value
-        numGND = row[0]
+        # Should just be one row with one value, which is NULL for an empty table
+        if row[0] is not None:
+            numGND = row[0]
     dbHandle.closeCursor()
     return numGND
 
@@ -486,20 +783,23 @@ def lammpsProvisioningBoilerplate(jobFile, configStruct):
     else:
         raise Exception('Using Unsupported Provisioning Mode')
 
-def launchFGSJob(jobFile, configStruct):
-    """Launch/queue fine grain simulation
+def getFGSLaunchCommand(jobFile, configStruct):
+    """Get command used to launch/queue fine grain simulation
 
     Args:
-        jobFile: File handle to write job script to
+        jobFile: Path to job script
         configStruct: Dictionary containing configuration data for simulation
 
     Raises:
         Exception: Unsupported SchedulerInterface specified
+
+    Returns:
+        tuple: Job scheduler binary, extra arguments to pass it, and if its output should be returned
     """
     if configStruct['SchedulerInterface'] == SchedulerInterface.SLURM:
-        launchJobScript("sbatch", jobFile, True)
+        return ("sbatch", [], True)
     elif configStruct['SchedulerInterface'] == SchedulerInterface.BLOCKING:
-        launchJobScript("bash", jobFile, False)
+        return ("bash", [], False)
     elif configStruct['SchedulerInterface'] == SchedulerInterface.FLUX:
         argList = ["mini", "batch"]
         argList += ["-n"]
@@ -508,10 +808,23 @@ def launchFGSJob(jobFile, configStruct):
         argList += [str(configStruct['FluxScheduler']['CoresPerSlotForFlux'])]
         argList += ["-N"]
         argList += [str(configStruct['FluxScheduler']['NodesPerJobForFlux'])]
-        launchJobScript("flux", jobFile, True, extraArgs=argList)
+        return ("flux", argList, True)
     else:
         raise Exception('Using Unsupported Scheduler Mode')
 
+def launchFGSJob(jobFile, configStruct):
+    """Launch/queue fine grain simulation
+
+    Args:
+        jobFile: File handle to write job script to
+        configStruct: Dictionary containing configuration data for simulation
+
+    Raises:
+        Exception: Unsupported SchedulerInterface specified
+    """
+    (binary, extraArgs, wantReturn) = getFGSLaunchCommand(jobFile, configStruct)
+    launchJobScript(binary, jobFile, wantReturn, extraArgs=extraArgs)
+
 def buildAndLaunchFGSJob(configStruct, rank, reqid, fgsArgs, glueMode):
     """Build and launch fine grain simulation for specified arguments
 
@@ -525,6 +838,28 @@ def buildAndLaunchFGSJob(configStruct, rank, reqid, fgsArgs, glueMode):
     Raises:
         Exception: Using unsupported SolverCode
     """
+    scriptFPath = buildFGSJob(configStruct, rank, reqid, fgsArgs, glueMode)
+    if scriptFPath is not None:
+        # either syscall or subprocess.run slurm with the script
+        launchFGSJob(scriptFPath, configStruct)
+        # Then do nothing because the script itself will write the result
+
+def buildFGSJob(configStruct, rank, reqid, fgsArgs, glueMode):
+    """Build run directory and job script for fine grain simulation
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        rank: Identifier of job originator. Commonly MPI rank
+        reqid: Monotonically increasing ID to use as job ID to look up result later
+        fgsArgs: Arguments for fine grain simulation
+        glueMode (ALInterfaceMode): Type of fine grain simulation to run
+
+    Raises:
+        Exception: Using unsupported SolverCode
+
+    Returns:
+        str: Path to job script, or None if the run directory already existed
+    """
     solverCode = configStruct['solverCode']
     tag = configStruct['tag']
     # Fine grain so want to use the slower shared DB
@@ -583,9 +918,8 @@ def buildAndLaunchFGSJob(configStruct, rank, reqid, fgsArgs, glueMode):
             #Chmod+x that script
             st = os.stat(scriptFPath)
             os.chmod(scriptFPath, st.st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
-            # either syscall or subprocess.run slurm with the script
-            launchFGSJob(scriptFPath, configStruct)
-            # Then do nothing because the script itself will write the result
+            return scriptFPath
+        return None
     else:
         raise Exception('Using Unsupported Solver Code')
 
@@ -651,6 +985,22 @@ def getInterpModel(packetType, alBackend, dbHandle):
     else:
         raise Exception('Using Unsupported Active Learning Backend')
 
+def trainInterpModel(packetType, alBackend, dbHandle, logName='alLog'):
+    """Get interpolation model while logging training output to `logName`.out and `logName`.err
+
+    Args:
+        packetType (SolverCode): Enum corresponding to simulation
+        alBackend (LearnerBackend): Machine learning backend to use with active learning
+        dbHandle (ALDBHandle): Object to access database
+        logName (str, optional): Path of log files without extension. Defaults to 'alLog'.
+
+    Returns:
+        InterpModelWrapper: Function object for active learner
+    """
+    with open(logName + '.out', 'w') as alOut, open(logName + '.err', 'w') as alErr:
+        with redirect_stdout(alOut), redirect_stderr(alErr):
+            return getInterpModel(packetType, alBackend, dbHandle)
+
 def insertALPrediction(inFGS, outFGS, solverCode, dbHandle):
     """Insert Active Learning Prediction into appropriate database
 
@@ -664,12 +1014,9 @@ def insertALPrediction(inFGS, outFGS, solverCode, dbHandle):
         Exception: Using Unsupported SolverCode
     """
     if solverCode == SolverCode.BGK:
-        dbHandle.openCursor()
-        insString = "INSERT INTO BGKALLOGS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"
         insArgs = (inFGS.Temperature,) + tuple(inFGS.Density) + tuple(inFGS.Charges) + (getGroundishTruthVersion(solverCode),) + (outFGS.Viscosity, outFGS.ThermalConductivity) + tuple(outFGS.DiffCoeff) + (getGroundishTruthVersion(solverCode),)
-        dbHandle.execute(insString, insArgs)
-        dbHandle.commit()
-        dbHandle.closeCursor()
+        # Group committed with other writes
+        dbHandle.bufferInsert("BGKALLOGS", insArgs)
     else:
         raise Exception("Using Unsupported Solver Code")
 
@@ -721,6 +1068,16 @@ class InterpModelWrapper:
         (err, output) = self.model(inputStruct)
         isLegit = self.uq(err)
         return (isLegit, output)
+    def batchCall(self, inputList):
+        """Generate results for a batch of inputs and indicate validity of each
+
+        Args:
+            inputList (list): Fine grain simulation input arguments
+
+        Returns:
+            list: Tuple of bool indicating if generated result is valid and the result itself for each input
+        """
+        return [self(inputStruct) for inputStruct in inputList]
 
 class MLModelWrapper(InterpModelWrapper):
     """Implementation of InterpModelWrapper for more advanced machine learning models
@@ -748,6 +1105,25 @@ class MLModelWrapper(InterpModelWrapper):
         modErr = self.model.iserrok(err)
         isLegit = simpleALErrorChecker(modErr)
         return (isLegit, output)
+    def batchCall(self, inputList):
+        """Generate results for a batch of inputs with a single ensemble evaluation
+
+        Packs all inputs into one array so the model and uncertainty quantification
+        are evaluated once for the whole batch instead of once per input
+
+        Args:
+            inputList (list): Fine grain simulation input arguments
+
+        Returns:
+            list: Tuple of bool indicating if generated result is valid and the result itself for each input
+        """
+        if len(inputList) == 0:
+            return []
+        packedInputs = np.stack([self.model.pack_inputs(inputStruct) for inputStruct in inputList])
+        (means, errs) = self.model.process(packedInputs)
+        # Same per field check as `iserrok` but on every row at once
+        isLegit = np.all(self.model.process_iserrok(errs), axis=1)
+        return [(bool(isLegit[i]), self.model.unpack_outputs(means[i])) for i in range(len(inputList))]
 
 def insertResultSlow(rank, tag, reqid, fgsResult, resultProvenance, dbHandle):
     """Insert result into slower/primary results table
@@ -765,12 +1141,9 @@ def insertResultSlow(rank, tag, reqid, fgsResult, resultProvenance, dbHandle):
     """
     #TODO: Merge this with `insertResult`
     if isinstance(fgsResult, BGKOutputs):
-        dbHandle.openCursor()
-        insString = "INSERT INTO BGKRESULTS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
         insArgs = (tag, rank, reqid, fgsResult.Viscosity, fgsResult.ThermalConductivity) + tuple(fgsResult.DiffCoeff) + (resultProvenance,)
-        dbHandle.execute(insString, insArgs)
-        dbHandle.commit()
-        dbHandle.closeCursor()
+        # Group committed with other writes
+        dbHandle.bufferInsert("BGKRESULTS", insArgs)
     else:
         raise Exception('Using Unsupported Solver Code')
 
@@ -789,39 +1162,45 @@ def insertResult(rank, tag, reqid, fgsResult, resultProvenance, dbHandle):
         Exception: _description_
     """
     if isinstance(fgsResult, BGKOutputs):
-        dbHandle.openCursor()
-        insString = "INSERT INTO BGKFASTRESULTS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
         insArgs = (tag, rank, reqid, fgsResult.Viscosity, fgsResult.ThermalConductivity) + tuple(fgsResult.DiffCoeff) + (resultProvenance,)
-        dbHandle.execute(insString, insArgs)
-        dbHandle.commit()
-        dbHandle.closeCursor()
+        # Group committed with other writes
+        dbHandle.bufferInsert("BGKFASTRESULTS", insArgs)
     else:
         raise Exception('Using Unsupported Solver Code')
 
+def getResultCache(configStruct):
+    """Get empty cache for results found in the GND table
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+
+    Returns:
+        ResultCache: Cache holding up to `DBCacheEntries` results
+    """
+    return ResultCache(configStruct['ICFParameters']['RelativeError'], configStruct['ServiceSettings']['DBCacheEntries'])
+
 def cacheCheck(inArgs, configStruct, dbCache):
     """Check local in-memory cache for similar requests
 
     Args:
         inArgs: Fine grain simulation arguments
         configStruct: Dictionary containing configuration data for simulation
-        dbCache: Container used for local cache of requests and results
+        dbCache (ResultCache): Local cache of requests and results
 
     Returns:
         Result if found. None otherwise
     """
     if isinstance(inArgs, BGKInputs):
-        #TODO: Make this cleaner
-        epsilon = configStruct['ICFParameters']['RelativeError']
-        for entry in dbCache:
-            if icfComparator(inArgs, entry[0], epsilon):
-                return entry[1]
-        return None
+        return dbCache.lookup(inArgs)
     else:
         return None
 
 def mergeBufferTable(solverCode, cgDB):
     """Merge FAST and normal result tables in database
 
+    Rows are moved by ROWID range in one transaction. Finding out that nothing is
+    pending only takes a read, so readers are not held up by needless write locks
+
     Args:
         solverCode (SolverCode): Enum corresponding to simulation
         cgDB (ALDBHandle): Object to access (coarse grain) database
@@ -830,22 +1209,78 @@ def mergeBufferTable(solverCode, cgDB):
         Exception: Using Unsupported SolverCode
     """
     if solverCode == SolverCode.BGK:
-        cgDB.openCursor()
-        mergeStr = "INSERT INTO BGKRESULTS SELECT * FROM BGKFASTRESULTS;"
-        delStr = "DELETE FROM BGKFASTRESULTS;"
-        cgDB.execute(mergeStr)
-        cgDB.execute(delStr)
-        cgDB.commit()
-        cgDB.closeCursor()
+        topStr = "SELECT MAX(ROWID) FROM BGKFASTRESULTS;"
+        mergeStr = "INSERT INTO BGKRESULTS SELECT * FROM BGKFASTRESULTS WHERE ROWID<=? ORDER BY ROWID;"
+        delStr = "DELETE FROM BGKFASTRESULTS WHERE ROWID<=?;"
     else:
         raise Exception('Using Unsupported Solver Code')
+    # Make sure everything buffered is on its way, rows still being written are moved next time
+    cgDB.flushInserts(False)
+    cgDB.openCursor()
+    fastTop = cgDB.execute(topStr).fetchone()[0]
+    if fastTop is not None:
+        # Rows added since are left for the next merge
+        cgDB.execute(mergeStr, (fastTop,))
+        cgDB.execute(delStr, (fastTop,))
+        cgDB.commit()
+    cgDB.closeCursor()
+
+def beginResultSync(dstDB, srcURL, srcTable, srcTop):
+    """Start copying rows of a table in another database that were not copied yet
+
+    The ROWID of the last row copied is kept as a sync cursor in the destination, and
+    is only moved forward in the same transaction as the copy. A pass that dies part way
+    is therefore rolled back as a whole and repeated. Taking the write lock is skipped
+    when there is nothing new. If the source has fewer rows than the cursor, the source
+    table was recreated and everything in it is copied again
+
+    Args:
+        dstDB (ALDBHandle): Object to access database to copy into, with an open cursor
+        srcURL (str): Absolute path of database to copy from
+        srcTable (str): Table to copy from
+        srcTop (int): Largest ROWID of source table, or 0 if it is empty
+
+    Returns:
+        int: ROWID to copy rows after within a new transaction, or None if there is nothing to copy
+    """
+    cursorQuery = "SELECT HWM FROM SYNCCURSORS WHERE SRCURL=? AND SRCTABLE=?;"
+    dstDB.execute(getSyncCursorTableString())
+    row = dstDB.execute(cursorQuery, (srcURL, srcTable)).fetchone()
+    if row is not None and row[0] == srcTop:
+        return None
+    # Our own results still being written need to be in to be skipped. This has to happen
+    # before taking the write lock, which the writer thread needs too
+    dstDB.waitForWrites()
+    # Check again holding the write lock in case someone else synced in between
+    dstDB.execute("BEGIN IMMEDIATE;")
+    row = dstDB.execute(cursorQuery, (srcURL, srcTable)).fetchone()
+    if row is not None and row[0] == srcTop:
+        dstDB.rollback()
+        return None
+    syncHWM = 0 if row is None else row[0]
+    if syncHWM > srcTop:
+        syncHWM = 0
+    return syncHWM
+
+def endResultSync(dstDB, srcURL, srcTable, srcTop):
+    """Move sync cursor past the rows copied and commit them together
+
+    Args:
+        dstDB (ALDBHandle): Object to access database copied into, with an open cursor
+        srcURL (str): Absolute path of database copied from
+        srcTable (str): Table copied from
+        srcTop (int): Largest ROWID that was copied, or 0 if the source is empty
+    """
+    dstDB.execute("INSERT OR REPLACE INTO SYNCCURSORS VALUES(?, ?, ?);", (srcURL, srcTable, srcTop))
+    dstDB.commit()
 
 def pullGlobalResultsToFastDBPython(solverCode, cgDB, fgDB):
     """Synchronize global results table to more local results table
 
     To account for contention with file-system databases, a multi-tier approach
     is suggested. This synchronizes results from the higher level database to
-    the lower one for the purpose of successful look ups.
+    the lower one for the purpose of successful look ups. Only results past the
+    sync cursor are read, so the cost follows the number of new results.
 
     Args:
         solverCode (SolverCode): Enum corresponding to simulation
@@ -858,38 +1293,241 @@ def pullGlobalResultsToFastDBPython(solverCode, cgDB, fgDB):
     #TODO: Evaluate if it makes sense to also synchronize GND tables
     # Manually copy data in by opening the DB, reading it, and then writing results
     if solverCode == SolverCode.BGK:
-        # Open Fine Grain DB
-        fgDB.openCursor()
-        # Copy out results
-        resultList = []
-        # TODO: Add logic to reduce number of reads later...
-        #   Might be able to do an SQL query to find the gap
-        resQuery = "SELECT * FROM BGKRESULTS;"
-        for row in fgDB.execute(resQuery):
-            # Basically just copy the result verbatim into list
-            resultList.append(row)
-        # Close FGDB
-        fgDB.closeCursor()
-        # Write results to fastDB (CGDB)
-        if len(resultList) > 0:
-            cgDB.openCursor()
-            # TODO: Update to do bulk insertions once this works
-            for result in resultList:
-                insString = "INSERT INTO BGKRESULTS (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);"
-                cgDB.execute(insString, tuple(result))
-            cgDB.commit()
-            cgDB.closeCursor()
+        srcTable = "BGKRESULTS"
+        resQuery = "SELECT * FROM BGKRESULTS WHERE ROWID>? AND ROWID<=?;"
+        # Results the coarse grain DB already has, say from before it had a sync cursor or not merged yet, are skipped
+        insString = "INSERT INTO BGKRESULTS SELECT " + ", ".join(["?"] * 16) + " WHERE NOT EXISTS (SELECT 1 FROM BGKRESULTS WHERE TAG=?1 AND RANK=?2 AND REQ=?3) AND NOT EXISTS (SELECT 1 FROM BGKFASTRESULTS WHERE TAG=?1 AND RANK=?2 AND REQ=?3);"
     else:
         raise Exception('pullGlobalResultsToFastDBPython: Using Unsupported Solver Code')
+    srcURL = os.path.abspath(fgDB.dbURL)
+    # Find how far the fine grain results go
+    fgDB.openCursor()
+    srcTop = fgDB.execute("SELECT MAX(ROWID) FROM " + srcTable + ";").fetchone()[0] or 0
+    fgDB.closeCursor()
+    cgDB.flushInserts(False)
+    cgDB.openCursor()
+    try:
+        syncHWM = beginResultSync(cgDB, srcURL, srcTable, srcTop)
+        if syncHWM is not None:
+            # Copy out new results
+            fgDB.openCursor()
+            resultList = fgDB.execute(resQuery, (syncHWM, srcTop)).fetchall()
+            fgDB.closeCursor()
+            # Write results to fastDB (CGDB)
+            cgDB.executemany(insString, resultList)
+            endResultSync(cgDB, srcURL, srcTable, srcTop)
+    except Exception:
+        cgDB.rollback()
+        raise
+    finally:
+        cgDB.closeCursor()
 
 def pullGlobalResultsToFastDBAttach(solverCode, cgDB, fgDB):
-    raise Exception('pullGlobalResultsToFastDBAttach: Currently Unsupported')
-    # Might need to add to fine grain db path  because of different dirs?
-    #TODO: Probably do two approaches
-    #  1. If both DB types are the same, attach?
-    #  2. if DB types differ... we take a memory hit?
+    """Synchronize global results table to more local results table within SQLite
+
+    Same as `pullGlobalResultsToFastDBPython`, but attaches the lower level database
+    so that new results are copied with a single statement and never pass through Python
+
+    Args:
+        solverCode (SolverCode): Enum corresponding to simulation
+        cgDB (ALDBHandle): Object to access higher level (coarse grain) SQLite database
+        fgDB (ALDBHandle): Object to access lower level (fine grain) SQLite database
+
+    Raises:
+        Exception: Using Unsupported SolverCode
+    """
+    if solverCode == SolverCode.BGK:
+        srcTable = "BGKRESULTS"
+        insString = "INSERT INTO BGKRESULTS SELECT * FROM FGDB.BGKRESULTS AS f WHERE f.ROWID>? AND f.ROWID<=? AND NOT EXISTS (SELECT 1 FROM main.BGKRESULTS AS r WHERE r.TAG=f.TAG AND r.RANK=f.RANK AND r.REQ=f.REQ) AND NOT EXISTS (SELECT 1 FROM main.BGKFASTRESULTS AS r WHERE r.TAG=f.TAG AND r.RANK=f.RANK AND r.REQ=f.REQ);"
+    else:
+        raise Exception('pullGlobalResultsToFastDBAttach: Using Unsupported Solver Code')
+    srcURL = os.path.abspath(fgDB.dbURL)
+    # Both tiers are the same database so there is nothing to copy
+    if os.path.abspath(cgDB.dbURL) == srcURL:
+        return
+    # Databases can only be attached outside of a transaction
+    cgDB.flushInserts(False)
+    cgDB.openCursor()
+    cgDB.execute("ATTACH DATABASE ? AS FGDB;", (fgDB.dbURL,))
+    try:
+        srcTop = cgDB.execute("SELECT MAX(ROWID) FROM FGDB." + srcTable + ";").fetchone()[0] or 0
+        syncHWM = beginResultSync(cgDB, srcURL, srcTable, srcTop)
+        if syncHWM is not None:
+            cgDB.execute(insString, (syncHWM, srcTop))
+            endResultSync(cgDB, srcURL, srcTable, srcTop)
+    except Exception:
+        cgDB.rollback()
+        raise
+    finally:
+        cgDB.execute("DETACH DATABASE FGDB;")
+        cgDB.closeCursor()
+
+def pullGlobalResultsToFastDB(solverCode, cgDB, fgDB):
+    """Synchronize global results table to more local results table
+
+    Copies within the database engine when both tiers are SQLite and through Python otherwise
+
+    Args:
+        solverCode (SolverCode): Enum corresponding to simulation
+        cgDB (ALDBHandle): Object to access higher level (coarse grain) database
+        fgDB (ALDBHandle): Object to access lower level (fine grain) database
+    """
+    if cgDB.dbMode == DatabaseMode.SQLITE and fgDB.dbMode == DatabaseMode.SQLITE:
+        pullGlobalResultsToFastDBAttach(solverCode, cgDB, fgDB)
+    else:
+        pullGlobalResultsToFastDBPython(solverCode, cgDB, fgDB)
+
+def lookupFGSResult(configStruct, inArgs, fgDB, dbCache, stats, gndCache=None, gndFilter=None, missCache=None):
+    """Look for an existing fine grain result in the cache and then the GND table
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        inArgs: Arguments for fine grain simulation
+        fgDB (ALDBHandle): Object to access lower level (fine grain) database
+        dbCache (ResultCache): Local cache of requests and results
+        stats (StatsHandle): Object to record stage timings to
+        gndCache (GNDCache, optional): In-memory copy of GND table to look in instead of
+            the cache and the GND table. Defaults to None.
+        gndFilter (GNDFilter, optional): Bloom filter of GND inputs to skip lookups that
+            cannot match. Defaults to None.
+        missCache (MissCache, optional): Inputs that just missed, to skip looking them up
+            again. Defaults to None.
+
+    Returns:
+        Result if found. None otherwise
+    """
+    outFGS = None
+    if gndCache is not None:
+        with stats.timer('gndLookup'):
+            gndOutputs = gndCache.lookup(getInputValues(inArgs))
+        if gndOutputs is not None:
+            stats.record('gndHit')
+            gndOutputs = gndOutputs.tolist()
+            outFGS = BGKOutputs(Viscosity=gndOutputs[0], ThermalConductivity=gndOutputs[1], DiffCoeff=gndOutputs[2:12])
+        return outFGS
+    # So first, check if we have already found a DB hit on a previous query
+    with stats.timer('cacheLookup'):
+        outFGS = cacheCheck(inArgs, configStruct, dbCache)
+    # If no hit, we check the DB
+    if outFGS != None:
+        stats.record('cacheHit')
+    else:
+        values = getInputValues(inArgs)
+        # Skip the database if we know it has nothing for us
+        with stats.timer('gndFilter'):
+            if missCache is not None and missCache.contains(values):
+                stats.record('gndMissCached')
+                return None
+            if gndFilter is not None and not gndFilter.mayMatch(values):
+                stats.record('gndFiltered')
+                return None
+        with stats.timer('gndLookup'):
+            selQuery = getGNDStringAndTuple(inArgs, configStruct)
+            fgDB.openCursor()
+            for row in fgDB.execute(selQuery[0], selQuery[1]):
+                if isinstance(inArgs, BGKInputs):
+                    if row[22] == getGroundishTruthVersion(SolverCode.BGK):
+                        outFGS = BGKOutputs(Viscosity=row[10], ThermalConductivity=row[11], DiffCoeff=row[12:22])
+                elif isinstance(inArgs, BGKMassesInputs):
+                    if row[26] == getGroundishTruthVersion(SolverCode.BGKMASSES):
+                        outFGS = BGKMassesOutputs(Viscosity=row[14], ThermalConductivity=row[15], DiffCoeff=row[16:26])
+            fgDB.closeCursor()
+        # Did we get a hit?
+        if outFGS != None:
+            stats.record('gndHit')
+            # Put it in the DBCache for later
+            dbCache.add(inArgs, outFGS)
+        elif missCache is not None:
+            missCache.add(values)
+    return outFGS
+
+def getMaxResultRowID(solverCode, dbHandle):
+    """Get ROWID of the most recently inserted result
+
+    Args:
+        solverCode (SolverCode): Enum corresponding to simulation
+        dbHandle (ALDBHandle): Object to access database
+
+    Raises:
+        Exception: Using Unsupported SolverCode
+
+    Returns:
+        int: Highest ROWID in results table, or 0 if it is empty
+    """
+    if solverCode == SolverCode.BGK:
+        selString = "SELECT MAX(ROWID) FROM BGKRESULTS;"
+    else:
+        raise Exception('Using Unsupported Solver Code')
+    dbHandle.openCursor()
+    maxRowID = dbHandle.execute(selString).fetchone()[0]
+    dbHandle.closeCursor()
+    if maxRowID is None:
+        return 0
+    return maxRowID
+
+def addInFlightFGSJob(configStruct, inFlight, fgDB, inArgs, glueMode, rank, reqID):
+    """Record a launched fine grain job so later matching requests can share its result
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        inFlight (InFlightTable): Running jobs to attach matching requests to
+        fgDB (ALDBHandle): Object to access lower level (fine grain) database
+        inArgs: Arguments for fine grain simulation
+        glueMode (ALInterfaceMode): Type of fine grain simulation launched
+        rank: Identifier of job originator. Commonly MPI rank
+        reqID: Monotonically increasing ID to use as job ID to look up result later
+    """
+    if len(inFlight) == 0:
+        # Nothing is waiting on older results so we can skip past them
+        inFlight.resultHWM = getMaxResultRowID(configStruct['solverCode'], fgDB)
+    inFlight.add(inArgs, glueMode, rank, reqID)
+
+def requeueExpiredFGSJobs(inFlight, taskQueue):
+    """Retry requests of fine grain jobs that did not return a result in time
+
+    Every request of an expired job is queued again, so the first one looks
+    up or launches the job once more and the others attach to it
+
+    Args:
+        inFlight (InFlightTable): Running jobs and the requests attached to them
+        taskQueue (list): Task queue to append (rank, reqID, alMode, inputTuple) tuples to
+    """
+    for (inArgs, glueMode, requests) in inFlight.expire():
+        print("Retrying " + str(len(requests)) + " requests of REQ=" + str(requests[0][1]))
+        for (rank, reqID) in requests:
+            taskQueue.append((rank, reqID, glueMode, inArgs))
+
+def fanOutFinishedFGSJobs(configStruct, inFlight, fgDB, cgDB):
+    """Answer requests that were waiting on fine grain jobs that have now finished
 
-def queueFGSJob(configStruct, uname, reqID, inArgs, rank, modeSwitch, cgDB, fgDB, dbCache):
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        inFlight (InFlightTable): Running jobs and the requests attached to them
+        fgDB (ALDBHandle): Object to access lower level (fine grain) database
+        cgDB (ALDBHandle): Object to access higher level (coarse grain) database
+
+    Raises:
+        Exception: Using Unsupported SolverCode
+    """
+    if len(inFlight) == 0:
+        return
+    tag = configStruct['tag']
+    if configStruct['solverCode'] == SolverCode.BGK:
+        selString = "SELECT ROWID, * FROM BGKRESULTS WHERE ROWID>? AND TAG=? ORDER BY ROWID;"
+    else:
+        raise Exception('Using Unsupported Solver Code')
+    fgDB.openCursor()
+    newResults = fgDB.execute(selString, (inFlight.resultHWM, tag)).fetchall()
+    fgDB.closeCursor()
+    for row in newResults:
+        inFlight.resultHWM = row[0]
+        waiters = inFlight.complete(row[2], row[3])
+        if waiters:
+            result = BGKOutputs(Viscosity=row[4], ThermalConductivity=row[5], DiffCoeff=list(row[6:16]))
+            for (rank, reqID) in waiters:
+                insertResult(rank, tag, reqID, result, ResultProvenance(row[16]), cgDB)
+
+def queueFGSJob(configStruct, uname, reqID, inArgs, rank, modeSwitch, cgDB, fgDB, dbCache, stats, inFlight=None, jobLock=None, gndCache=None, gndFilter=None, missCache=None):
     """Perform fine grain simulation
 
     Args:
@@ -901,51 +1539,60 @@ def queueFGSJob(configStruct, uname, reqID, inArgs, rank, modeSwitch, cgDB, fgDB
         modeSwitch (ALInterfaceMode): Type of fine grain simulation to run
         cgDB (ALDBHandle): Object to access higher level (coarse grain) database
         fgDB (ALDBHandle): Object to access lower level (fine grain) database
-        dbCache: Container used for local cache of requests and results
+        dbCache (ResultCache): Local cache of requests and results
+        stats (StatsHandle): Object to record stage timings to
+        inFlight (InFlightTable, optional): Running jobs to attach matching requests to. Defaults to None.
+        jobLock (optional): Lock shared by the workers of a sharded service so that they launch
+            jobs one at a time and cannot overrun the scheduler's job limit together. Defaults to None.
+        gndCache (GNDCache, optional): In-memory copy of GND table to look up results in. Defaults to None.
+        gndFilter (GNDFilter, optional): Bloom filter of GND inputs to skip lookups that cannot match. Defaults to None.
+        missCache (MissCache, optional): Inputs that just missed, to skip looking them up again. Defaults to None.
     """
     tag = configStruct['tag']
+    if jobLock is None:
+        jobLock = contextlib.nullcontext()
     # This is a brute force call. We only want an exact LAMMPS result
-    outFGS = None
-    # So first, check if we have already found a DB hit on a previous query
-    outFGS = cacheCheck(inArgs, configStruct, dbCache)
-    # If no hit, we check the DB
-    if outFGS == None:
-        selQuery = getGNDStringAndTuple(inArgs, configStruct)
-        fgDB.openCursor()
-        for row in fgDB.execute(selQuery[0], selQuery[1]):
-            if isinstance(inArgs, BGKInputs):
-                if row[22] == getGroundishTruthVersion(SolverCode.BGK):
-                    outFGS = BGKOutputs(Viscosity=row[10], ThermalConductivity=row[11], DiffCoeff=row[12:22])
-            elif isinstance(inArgs, BGKMassesInputs):
-                if row[26] == getGroundishTruthVersion(SolverCode.BGKMASSES):
-                    outFGS = BGKMassesOutputs(Viscosity=row[14], ThermalConductivity=row[15], DiffCoeff=row[16:26])
-        fgDB.closeCursor()
-        # Did we get a hit?
-        if outFGS != None:
-            # Put it in the DBCache for later
-            #TODO: Cap the size of this cache
-            dbCache.append((inArgs, outFGS))
+    outFGS = lookupFGSResult(configStruct, inArgs, fgDB, dbCache, stats, gndCache, gndFilter, missCache)
     #Did we get a hit from either?
     if outFGS != None:
         # We had a hit, so send that
-        insertResult(rank, tag, reqID, outFGS, ResultProvenance.DB, cgDB)
+        with stats.timer('resultInsert'):
+            insertResult(rank, tag, reqID, outFGS, ResultProvenance.DB, cgDB)
     else:
         # Nope, so now we see if we need an FGS job
-        if useAnalyticSolution(inArgs):
-            # It was, so let's get that solution
-            results = getAnalyticSolution(inArgs)
-            insertResult(rank, tag, reqID, results, ResultProvenance.FGS, cgDB)
+        with stats.timer('analytic'):
+            isAnalytic = useAnalyticSolution(inArgs)
+            if isAnalytic:
+                # It was, so let's get that solution
+                results = getAnalyticSolution(inArgs)
+        if isAnalytic:
+            with stats.timer('resultInsert'):
+                insertResult(rank, tag, reqID, results, ResultProvenance.FGS, cgDB)
             # TODO: Evaluate if we want to insert valid analytic results to GND table
+        elif inFlight is not None and inFlight.attach(inArgs, modeSwitch, rank, reqID):
+            # An equivalent job is already running and we will share its result
+            pass
         else:
+            if inFlight is not None:
+                # Before launching, as a blocking launch returns with the result already written
+                addInFlightFGSJob(configStruct, inFlight, fgDB, inArgs, modeSwitch, rank, reqID)
             # Call fgs with args as scheduled job
             # job will write result back
             launchedJob = False
-            while(launchedJob == False):
-                queueJob = getQueueUsability(uname, configStruct)
-                if queueJob == True:
-                    print("Processing REQ=" + str(reqID))
-                    buildAndLaunchFGSJob(configStruct, rank, reqID, inArgs, modeSwitch)
-                    launchedJob = True
+            retrySleep = configStruct['ServiceSettings']['IdleMinSleep']
+            with stats.timer('jobSubmit'):
+                while(launchedJob == False):
+                    # Nobody else may launch between our check and our launch
+                    with jobLock:
+                        queueJob = getQueueUsability(uname, configStruct)
+                        if queueJob == True:
+                            print("Processing REQ=" + str(reqID))
+                            buildAndLaunchFGSJob(configStruct, rank, reqID, inArgs, modeSwitch)
+                            launchedJob = True
+                    if launchedJob == False:
+                        # Back off while the scheduler is full instead of polling it and the lock flat out
+                        time.sleep(retrySleep)
+                        retrySleep = min(2.0 * retrySleep, configStruct['ServiceSettings']['IdleMaxSleep'])
 
 def useAnalyticSolution(inputStruct):
     """Determine if analytic solution is sufficient
@@ -991,7 +1638,262 @@ def getAnalyticSolution(inArgs):
     else:
         raise Exception('Using Unsupported Analytic Solver')
 
-def pollAndProcessFGSRequests(configStruct, uname):
+def getTaskMode(requestedMode, defaultMode):
+    """Resolve how a request should be processed
+
+    Args:
+        requestedMode (ALInterfaceMode): Mode requested by the coarse grain solver
+        defaultMode (ALInterfaceMode): Mode the GLUE Code was configured with
+
+    Returns:
+        ALInterfaceMode: Mode to process the request with
+    """
+    if requestedMode != ALInterfaceMode.DEFAULT:
+        return requestedMode
+    return defaultMode
+
+def getFakeResult(taskArgs, packetType):
+    """Generate placeholder result for testing infrastructure
+
+    Args:
+        taskArgs: Arguments for fine grain simulation
+        packetType (SolverCode): Enum corresponding to simulation
+
+    Raises:
+        Exception: Using Unsupported SolverCode
+
+    Returns:
+        Fake result
+    """
+    if packetType == SolverCode.BGK:
+        # Simplest stencil imaginable
+        bgkInput = taskArgs
+        bgkOutput = BGKOutputs(Viscosity=0.0, ThermalConductivity=0.0, DiffCoeff=[0.0]*10)
+        bgkOutput.DiffCoeff[7] = (bgkInput.Temperature + bgkInput.Density[0] +  bgkInput.Charges[3]) / 3
+        return bgkOutput
+    else:
+        raise Exception('Using Unsupported Solver Code')
+
+def getAnalyticModeResult(taskArgs, packetType):
+    """Compute result for a request made in ANALYTIC mode
+
+    Args:
+        taskArgs: Arguments for fine grain simulation
+        packetType (SolverCode): Enum corresponding to simulation
+
+    Raises:
+        Exception: Using Analytic ICF with more than two species
+        Exception: Using Unsupported Analytic Solution
+
+    Returns:
+        Results of analytic solution
+    """
+    if packetType == SolverCode.BGK:
+        if taskArgs.Density[2] != 0.0 or taskArgs.Density[3] != 0.0:
+            raise Exception('Using Analytic ICF with more than two species')
+        (cond, visc, diffCoeff) = ICFAnalytical_solution(taskArgs.Density, taskArgs.Charges, taskArgs.Temperature)
+        bgkOutput = BGKOutputs(Viscosity=visc, ThermalConductivity=cond, DiffCoeff=diffCoeff)
+        return bgkOutput
+    else:
+        raise Exception('Using Unsupported Analytic Solution')
+
+def predictALTasks(taskQueue, defaultMode, interpModel):
+    """Evaluate interpolation model on all active learning tasks in a single batch
+
+    Args:
+        taskQueue (list): Tasks of the form (rank, reqID, alMode, inputTuple)
+        defaultMode (ALInterfaceMode): Mode the GLUE Code was configured with
+        interpModel (InterpModelWrapper): Function object for active learner
+
+    Returns:
+        list: (isLegit, output) tuple for each active learning task and None for all other tasks
+    """
+    alIndices = [i for (i, task) in enumerate(taskQueue) if getTaskMode(task[2], defaultMode) == ALInterfaceMode.ACTIVELEARNER]
+    alPredictions = [None] * len(taskQueue)
+    if len(alIndices) > 0:
+        batchResults = interpModel.batchCall([taskQueue[i][3] for i in alIndices])
+        for (i, prediction) in zip(alIndices, batchResults):
+            alPredictions[i] = prediction
+    return alPredictions
+
+def processRequestRows(reqEntry, resultQueue, taskQueue):
+    """Update bookkeeping for a rank and queue any newly received requests
+
+    Args:
+        reqEntry (list): Bookkeeping entry for the rank of the form [rank, latestID, missingIDs]
+        resultQueue (list): List of (reqID, alMode, inputTuple) tuples read from the database
+        taskQueue (list): Task queue to append (rank, reqID, alMode, inputTuple) tuples to
+    """
+    rank = reqEntry[0]
+    latestID = reqEntry[1]
+    missingIDs = reqEntry[2]
+    #Get latest received request ID
+    if len(resultQueue) > 0:
+        newLatestID = max(resultQueue, key=lambda i: i[0])[0]
+        #If that latest ID is more laterest than our old latest
+        if newLatestID > latestID:
+            # Add what we were missing
+            missingIDs.addRange(latestID+1, newLatestID)
+            # And update latestID
+            reqEntry[1] = newLatestID
+        #And then process those results
+        for result in resultQueue:
+            # Were we looking for this?
+            if result[0] in missingIDs:
+                # We were, so lets queue it
+                #Format is (rank, reqID, alMode, inputTuple)
+                newTask = (rank, result[0], result[1], result[2])
+                taskQueue.append(newTask)
+                missingIDs.remove(result[0])
+
+def scanRequestsPerRank(packetType, tag, reqArray, cgDB, taskQueue):
+    """Poll database for new requests with one query per rank
+
+    Args:
+        packetType (SolverCode): SolverCode enum corresponding to application
+        tag (str): Identifier for this set of data
+        reqArray (list): Per rank bookkeeping entries of the form [rank, latestID, missingIDs]
+        cgDB (ALDBHandle): Object to access (coarse grain) database
+        taskQueue (list): Task queue to append (rank, reqID, alMode, inputTuple) tuples to
+    """
+    for reqEntry in reqArray:
+        rank = reqEntry[0]
+        selString = getSelString(packetType, reqEntry[1], reqEntry[2])
+        selArgs = (rank, tag)
+        resultQueue = []
+        # SELECT request
+        cgDB.openCursor()
+        for row in cgDB.execute(selString, selArgs):
+            # Process row for later
+            (solverInput, reqType) = processReqRow(row, packetType)
+            # (reqID, alMode, inputTuple)
+            resultQueue.append((row[2], reqType, solverInput))
+        cgDB.closeCursor()
+        processRequestRows(reqEntry, resultQueue, taskQueue)
+
+def scanRequestsBatched(packetType, tag, reqArray, scanHWM, cgDB, taskQueue):
+    """Poll database for new requests from all ranks with a single query
+
+    Only rows past the high-water mark are read, so the cost of a scan scales
+    with the number of new requests rather than the number of ranks.
+
+    Args:
+        packetType (SolverCode): SolverCode enum corresponding to application
+        tag (str): Identifier for this set of data
+        reqArray (list): Per rank bookkeeping entries of the form [rank, latestID, missingIDs]
+        scanHWM (int): Highest request ROWID already processed for this tag
+        cgDB (ALDBHandle): Object to access (coarse grain) database
+        taskQueue (list): Task queue to append (rank, reqID, alMode, inputTuple) tuples to
+
+    Returns:
+        int: Updated high-water mark
+    """
+    # Ranks are stored contiguously starting from the lowest AL requester
+    firstRank = reqArray[0][0]
+    rankQueues = {}
+    selString = getBatchSelString(packetType)
+    # Ignore ranks we were not told to expect, as a per rank scan would
+    selArgs = (scanHWM, tag, firstRank, firstRank + len(reqArray))
+    cgDB.openCursor()
+    for row in cgDB.execute(selString, selArgs):
+        scanHWM = row[0]
+        reqRow = row[1:]
+        index = reqRow[1] - firstRank
+        (solverInput, reqType) = processReqRow(reqRow, packetType)
+        rankQueues.setdefault(index, []).append((reqRow[2], reqType, solverInput))
+    cgDB.closeCursor()
+    for index, resultQueue in rankQueues.items():
+        processRequestRows(reqArray[index], resultQueue, taskQueue)
+    return scanHWM
+
+def saveServiceCheckpoint(configStruct, reqArray, scanHWM, dbCache, interpModel, GNDcnt):
+    """Write checkpoint of service state if checkpointing is enabled
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        reqArray (list): Per rank bookkeeping entries of the form [rank, latestID, missingIDs]
+        scanHWM (int): Highest request ROWID already processed for this tag
+        dbCache (ResultCache): Local cache of requests and results
+        interpModel (InterpModelWrapper): Function object for active learner, or None
+        GNDcnt (int): GND count the model was last retrained at
+    """
+    checkpointURL = configStruct['ServiceSettings']['CheckpointURL']
+    if checkpointURL is None:
+        return
+    checkpoint = {
+        'tag': configStruct['tag'],
+        # Plain data so the checkpoint does not depend on how this module was imported
+        'requests': [(reqEntry[0], reqEntry[1], reqEntry[2].intervals()) for reqEntry in reqArray],
+        'scanHWM': scanHWM,
+        'dbCache': dbCache.items(),
+        'model': packModel(interpModel),
+        'GNDcnt': GNDcnt
+    }
+    writeCheckpoint(checkpointURL, checkpoint)
+
+def loadServiceCheckpoint(configStruct, reqArray, cgDB, fgDB, taskQueue, pullResults=True):
+    """Restore service state from checkpoint if checkpointing is enabled and one exists
+
+    The checkpoint is reconciled against the results table: requests it marks as
+    received that still have no result, such as requests whose jobs were lost,
+    are added to the task queue again. Requests it marks as missing or that are
+    newer than it will be picked up by the usual scans
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        reqArray (list): Per rank bookkeeping entries of the form [rank, latestID, missingIDs] to restore into
+        cgDB (ALDBHandle): Object to access (coarse grain) database
+        fgDB (ALDBHandle): Object to access (fine grain) database
+        taskQueue (list): Task queue to append (rank, reqID, alMode, inputTuple) tuples to
+        pullResults (bool, optional): Pull fine grain results before reconciling, unless
+            someone else is responsible for that. Defaults to True.
+
+    Returns:
+        tuple: Restored request ROWID high-water mark, cache, interpolation model, and GND count of the model
+    """
+    checkpointURL = configStruct['ServiceSettings']['CheckpointURL']
+    dbCache = getResultCache(configStruct)
+    if checkpointURL is None:
+        return (0, dbCache, None, 0)
+    checkpoint = readCheckpoint(checkpointURL, configStruct['tag'])
+    if checkpoint is None:
+        return (0, dbCache, None, 0)
+    # Least recently used first, so entries are dropped in the same order as before
+    for (inArgs, outFGS) in checkpoint['dbCache']:
+        dbCache.add(inArgs, outFGS)
+    packetType = configStruct['solverCode']
+    firstRank = reqArray[0][0]
+    for (rank, latestID, intervals) in checkpoint['requests']:
+        index = rank - firstRank
+        if index >= 0 and index < len(reqArray):
+            reqArray[index][1] = latestID
+            reqArray[index][2] = MissingRequestIDs(intervals)
+    # Make sure every result that was already produced is in the results table
+    mergeBufferTable(packetType, cgDB)
+    if pullResults:
+        pullGlobalResultsToFastDB(packetType, cgDB, fgDB)
+    numRequeued = 0
+    cgDB.openCursor()
+    for row in cgDB.execute(getUnansweredSelString(packetType), (configStruct['tag'],)):
+        index = row[1] - firstRank
+        if index < 0 or index >= len(reqArray):
+            continue
+        reqEntry = reqArray[index]
+        if row[2] > reqEntry[1] or row[2] in reqEntry[2]:
+            continue
+        (solverInput, reqType) = processReqRow(row, packetType)
+        # KILL requests never get a result and were already handled
+        if reqType == ALInterfaceMode.KILL:
+            continue
+        taskQueue.append((row[1], row[2], reqType, solverInput))
+        numRequeued += 1
+    cgDB.closeCursor()
+    interpModel = unpackModel(checkpoint['model'])
+    GNDcnt = checkpoint['GNDcnt'] if interpModel is not None else 0
+    print("Resumed from checkpoint " + checkpointURL + " and requeued " + str(numRequeued) + " unanswered requests")
+    return (checkpoint['scanHWM'], dbCache, interpModel, GNDcnt)
+
+def pollAndProcessFGSRequests(configStruct, uname, shard=None):
     """General service loop of GLUE Code
 
     Primary function that creates a loop to run as a service to repeatedly poll databases for requests,
@@ -1000,6 +1902,8 @@ def pollAndProcessFGSRequests(configStruct, uname):
     Args:
         configStruct: Dictionary containing configuration data for simulation
         uname (str): UID of user running GLUE Code
+        shard (ServiceShard, optional): Ranks to serve when running as one worker of a sharded
+            service, in which case the coordinator retrains models and pulls fine grain results. Defaults to None.
 
     Raises:
         Exception: Use of unsupported SolverCode and ALInterfaceMode combination
@@ -1011,82 +1915,108 @@ def pollAndProcessFGSRequests(configStruct, uname):
     alBackend = configStruct['alBackend']
     GNDthreshold = configStruct['ActiveLearningVariables']['GNDthreshold']
     numALRequesters = configStruct['ActiveLearningVariables']['NumberOfRequestingActiveLearners']
+    scanMode = configStruct['ServiceSettings']['RequestScanMode']
+    mergeMode = configStruct['ServiceSettings']['ResultMergeMode']
 
     # One task queue to rule them (the ranks) all
     taskQueue = []
     # Array to handle missing requests
-    reqArray = [[i-numALRequesters, -1, []] for i in range(0, numRanks + numALRequesters)]
-    # Cache for DB hits
-    dbCache = []
+    if shard is None:
+        reqArray = getRequestArray(-numALRequesters, numRanks)
+    else:
+        reqArray = getRequestArray(shard.firstRank, shard.endRank)
+    # Only needed to keep workers of a sharded service within the scheduler's job limit
+    jobLock = None if shard is None else shard.jobLock
+    # Running fine grain jobs that matching requests can wait on
+    inFlight = None
+    if configStruct['ServiceSettings']['CoalesceFGSJobs']:
+        inFlight = InFlightTable(configStruct['ICFParameters']['RelativeError'], configStruct['ServiceSettings']['FGSJobTimeout'])
 
     #Set up database handles
     cgDBSettings = configStruct['DatabaseSettings']['CoarseGrainDB']
     cgDB = getDBHandle(cgDBSettings, True)
     fgDBSettings = configStruct['DatabaseSettings']['FineGrainDB']
     fgDB = getDBHandle(fgDBSettings)
-
-    #Get starting GNDCount of 0
-    GNDcnt = 0
+    if configStruct['ServiceSettings']['GNDLookupMode'] == GNDLookupMode.RTREE:
+        createGNDIndex(fgDB, packetType)
+    # Or keep a copy of the GND table to look up results in
+    gndCache = getGNDCache(configStruct)
+    # And know which lookups would miss
+    gndFilter = getGNDFilter(configStruct)
+    missCache = getMissCache(configStruct)
+    # And decide how to wait when there is nothing to do
+    idleHandle = getIdleHandle(configStruct, cgDB)
+    # And whether to record where the time goes
+    stats = getStatsHandle(configStruct)
+
+    # Pick up where a previous run left off. This restores the highest request ROWID seen
+    # for this tag if doing batched scans, the cache for DB hits, and the active learning
+    # model with the GND count it was trained at. Otherwise these start out empty
+    (scanHWM, dbCache, interpModel, GNDcnt) = loadServiceCheckpoint(configStruct, reqArray, cgDB, fgDB, taskQueue, shard is None)
+    checkpointInterval = configStruct['ServiceSettings']['CheckpointInterval']
+    lastCheckpoint = time.monotonic()
+    # Only trained when running as an active learner
+    trainer = None
+    if shard is None:
+        trainer = ModelTrainer(packetType, alBackend, fgDBSettings, configStruct['ServiceSettings']['RetrainWorkers'])
     #And start the glue loop
     keepSpinning = True
     print("Starting Loop")
     while keepSpinning:
         #Logic to not hammer DB/learner with unnecessary retraining requests
-        nuGNDcnt = getGNDCount(fgDB, packetType)
-        if defaultMode == ALInterfaceMode.ACTIVELEARNER and ((nuGNDcnt - GNDcnt) > GNDthreshold or GNDcnt == 0):
-            with open('alLog.out', 'w') as alOut, open('alLog.err', 'w') as alErr:
-                with redirect_stdout(alOut), redirect_stdout(alErr):
-                    interpModel = getInterpModel(packetType, alBackend, fgDB)
-            GNDcnt = nuGNDcnt
+        with stats.timer('retrain'):
+            if shard is not None:
+                # The coordinator retrains and hands us its models
+                if defaultMode == ALInterfaceMode.ACTIVELEARNER:
+                    nuModel = shard.pollModel(interpModel is None)
+                    if nuModel is not None:
+                        interpModel = nuModel
+            else:
+                nuGNDcnt = getGNDCount(fgDB, packetType)
+                if defaultMode == ALInterfaceMode.ACTIVELEARNER and ((nuGNDcnt - GNDcnt) > GNDthreshold or GNDcnt == 0):
+                    if trainer.submit(nuGNDcnt):
+                        GNDcnt = nuGNDcnt
+                if defaultMode == ALInterfaceMode.ACTIVELEARNER:
+                    # Keep using the current model until a newer one is done, but we need at least one
+                    nuModel = trainer.poll(interpModel is None)
+                    if nuModel is not None:
+                        interpModel = nuModel
+        if shard is not None and shard.killed.is_set():
+            # Another worker received the KILL request, so answer what our ranks asked for before it one last time
+            keepSpinning = False
         #Now populate the task queue
-        for i in range(0, numRanks + numALRequesters):
-            rank = reqArray[i][0]
-            latestID = reqArray[i][1]
-            missingIDs = reqArray[i][2]
-            selString = getSelString(packetType, latestID, missingIDs)
-            selArgs = (rank, tag)
-            resultQueue = []
-            # SELECT request
-            cgDB.openCursor()
-            for row in cgDB.execute(selString, selArgs):
-                # Process row for later
-                (solverInput, reqType) = processReqRow(row, packetType)
-                # (reqID, alMode, inputTuple)
-                resultQueue.append((row[2], reqType, solverInput))
-            cgDB.closeCursor()
-            #Get latest received request ID
-            if len(resultQueue) > 0:
-                newLatestID = max(resultQueue, key=lambda i: i[0])[0]
-                #If that latest ID is more laterest than our old latest
-                if newLatestID > latestID:
-                    # Add what we were missing
-                    missingIDs += range(latestID+1, newLatestID+1)
-                    # And update latestID
-                    reqArray[i][1] = newLatestID
-                #And then process those results
-                for result in resultQueue:
-                    # Were we looking for this?
-                    if result[0] in missingIDs:
-                        # We were, so lets queue it
-                        #Format is (rank, reqID, alMode, inputTuple)
-                        newTask = (rank, result[0], result[1], result[2])
-                        taskQueue.append(newTask)
-                        missingIDs.remove(result[0])
+        with stats.timer('scan'):
+            if scanMode == RequestScanMode.BATCHED:
+                scanHWM = scanRequestsBatched(packetType, tag, reqArray, scanHWM, cgDB, taskQueue)
+            else:
+                scanRequestsPerRank(packetType, tag, reqArray, cgDB, taskQueue)
+        #And retry requests of jobs that seem to have failed
+        if inFlight is not None:
+            requeueExpiredFGSJobs(inFlight, taskQueue)
+        #Bring our copy of the GND table up to date
+        if gndCache is not None:
+            with stats.timer('gndUpdate'):
+                updateGNDCache(gndCache, fgDB, packetType)
+        #Or our filter of it
+        if gndFilter is not None:
+            with stats.timer('gndUpdate'):
+                updateGNDFilter(gndFilter, fgDB, packetType)
         #And now we process that task queue
+        # Evaluate all active learning requests at once
+        with stats.timer('alInference'):
+            alPredictions = predictALTasks(taskQueue, defaultMode, interpModel)
         #TODO: Refactor slurm/flux queue logic up to here for throttling active jobs
-        for task in taskQueue:
+        for (task, alPrediction) in zip(taskQueue, alPredictions):
             # A shim to reuse old logic
             rank = task[0]
             reqID = task[1]
             requestedMode = task[2]
             taskArgs = task[3]
             # Process tasks based on mode
-            modeSwitch = defaultMode
-            if requestedMode != ALInterfaceMode.DEFAULT:
-                modeSwitch = requestedMode
+            modeSwitch = getTaskMode(requestedMode, defaultMode)
             if modeSwitch == ALInterfaceMode.FGS or modeSwitch == ALInterfaceMode.FASTFGS:
                 # Submit as LAMMPS job
-                queueFGSJob(configStruct, uname, reqID, taskArgs, rank, modeSwitch, cgDB, fgDB, dbCache)
+                queueFGSJob(configStruct, uname, reqID, taskArgs, rank, modeSwitch, cgDB, fgDB, dbCache, stats, inFlight, jobLock, gndCache, gndFilter, missCache)
             elif modeSwitch == ALInterfaceMode.ACTIVELEARNER:
                 # General (Active) Learner
                 #  model = getLatestModelFromLearners()
@@ -1097,45 +2027,69 @@ def pollAndProcessFGSRequests(configStruct, uname):
                 #      outputs = fineScaleSim(inputs)
                 #      queueUpdateModel(inputs, outputs)
                 #      return outputs
-                (isLegit, output) = interpModel(taskArgs)
-                insertALPrediction(taskArgs, output, packetType, cgDB)
-                if isLegit:
-                    insertResult(rank, tag, reqID, output, ResultProvenance.ACTIVELEARNER, cgDB)
-                else:
-                    queueFGSJob(configStruct, uname, reqID, taskArgs, rank, ALInterfaceMode.FGS, cgDB, fgDB, dbCache)
+                (isLegit, output) = alPrediction
+                with stats.timer('resultInsert'):
+                    insertALPrediction(taskArgs, output, packetType, cgDB)
+                    if isLegit:
+                        insertResult(rank, tag, reqID, output, ResultProvenance.ACTIVELEARNER, cgDB)
+                if not isLegit:
+                    queueFGSJob(configStruct, uname, reqID, taskArgs, rank, ALInterfaceMode.FGS, cgDB, fgDB, dbCache, stats, inFlight, jobLock, gndCache, gndFilter, missCache)
             elif modeSwitch == ALInterfaceMode.FAKE:
-                if packetType == SolverCode.BGK:
-                    # Simplest stencil imaginable
-                    bgkInput = taskArgs
-                    bgkOutput = BGKOutputs(Viscosity=0.0, ThermalConductivity=0.0, DiffCoeff=[0.0]*10)
-                    bgkOutput.DiffCoeff[7] = (bgkInput.Temperature + bgkInput.Density[0] +  bgkInput.Charges[3]) / 3
-                    # Write the result
-                    insertResult(rank, tag, reqID, bgkOutput, ResultProvenance.FAKE, cgDB)
-                else:
-                    raise Exception('Using Unsupported Solver Code')
+                # Write the result
+                with stats.timer('resultInsert'):
+                    insertResult(rank, tag, reqID, getFakeResult(taskArgs, packetType), ResultProvenance.FAKE, cgDB)
             elif modeSwitch == ALInterfaceMode.ANALYTIC:
-                if packetType == SolverCode.BGK:
-                    if taskArgs.Density[2] != 0.0 or taskArgs.Density[3] != 0.0:
-                        raise Exception('Using Analytic ICF with more than two species')
-                    (cond, visc, diffCoeff) = ICFAnalytical_solution(taskArgs.Density, taskArgs.Charges, taskArgs.Temperature)
-                    bgkOutput = BGKOutputs(Viscosity=visc, ThermalConductivity=cond, DiffCoeff=diffCoeff)
-                    # Write the result
-                    insertResult(rank, tag, reqID, bgkOutput, ResultProvenance.ANALYTIC, cgDB)
-                else:
-                    raise Exception('Using Unsupported Analytic Solution')
+                # Write the result
+                with stats.timer('analytic'):
+                    analyticResult = getAnalyticModeResult(taskArgs, packetType)
+                with stats.timer('resultInsert'):
+                    insertResult(rank, tag, reqID, analyticResult, ResultProvenance.ANALYTIC, cgDB)
             elif modeSwitch == ALInterfaceMode.KILL:
                 keepSpinning = False
+                if shard is not None:
+                    shard.killed.set()
+        #Answer anything waiting on jobs that finished
+        if inFlight is not None:
+            with stats.timer('fanOut'):
+                fanOutFinishedFGSJobs(configStruct, inFlight, fgDB, cgDB)
+        #Commit this iteration's results together, and make sure they are all in before the last merge
+        with stats.timer('resultInsert'):
+            cgDB.flushInserts(not keepSpinning)
         #And empty out the task queue....
+        didWork = len(taskQueue) > 0
         del(taskQueue[:])
         #And now merge and purge buffer tables
-        #First we want to copy the fast local results to the right table of the shared db
-        mergeBufferTable(SolverCode.BGK, cgDB)
-        #And then copy in the coarse grain results
-        pullGlobalResultsToFastDBPython(SolverCode.BGK, cgDB, fgDB)
+        #First we want to copy the fast local results to the right table of the shared db,
+        #which can wait until we are done if readers look at both tables through a view
+        if mergeMode == ResultMergeMode.COPY or not keepSpinning:
+            with stats.timer('merge'):
+                mergeBufferTable(SolverCode.BGK, cgDB)
+        #And then copy in the coarse grain results, which only the coordinator does if sharded
+        if shard is None:
+            with stats.timer('pull'):
+                pullGlobalResultsToFastDB(SolverCode.BGK, cgDB, fgDB)
+        #Save our place
+        if keepSpinning and time.monotonic() - lastCheckpoint >= checkpointInterval:
+            saveServiceCheckpoint(configStruct, reqArray, scanHWM, dbCache, interpModel, GNDcnt)
+            lastCheckpoint = time.monotonic()
+        #And sleep if we are idle
+        if keepSpinning:
+            with stats.timer('idle'):
+                idleHandle.wait(didWork)
+        stats.endIteration()
     print("Loop Done")
+    saveServiceCheckpoint(configStruct, reqArray, scanHWM, dbCache, interpModel, GNDcnt)
+    stats.close()
+    if trainer is not None:
+        trainer.close()
+    idleHandle.close()
     #Close Database Connection
     cgDB.closeDB()
     fgDB.closeDB()
+    print("Database connections (opened, reused): " + str(getConnectionCounts()))
+    print("DB cache (entries, hits, misses, evictions): " + str(dbCache.getCounts()))
+    if gndFilter is not None:
+        print("GND filter (rows, passed, skipped): " + str(gndFilter.getCounts()))
 
 if __name__ == "__main__":
     configStruct = processGlueCodeArguments()
@@ -1143,4 +2097,11 @@ if __name__ == "__main__":
     uname =  getpass.getuser()
     # We will not pass in uname via the json file
 
-    pollAndProcessFGSRequests(configStruct, uname)
+    if configStruct['ServiceSettings']['ServiceShards'] > 1:
+        from alShardedService import shardedPollAndProcessFGSRequests
+        shardedPollAndProcessFGSRequests(configStruct, uname)
+    elif configStruct['ServiceSettings']['ServiceEngine'] == ServiceEngine.ASYNCIO:
+        from alAsyncService import asyncPollAndProcessFGSRequests
+        asyncPollAndProcessFGSRequests(configStruct, uname)
+    else:
+        pollAndProcessFGSRequests(configStruct, uname)
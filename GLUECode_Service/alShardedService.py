@@ -0,0 +1,178 @@
+import copy
+import queue
+import multiprocessing
+from glueCodeTypes import ALInterfaceMode, SolverCode, SchedulerInterface, ServiceEngine
+from alDBHandlers import getDBHandle
+from alTrainers import ModelTrainer
+from alCheckpoint import packModel, unpackModel
+from alInterface import pollAndProcessFGSRequests, getGNDCount, mergeBufferTable, pullGlobalResultsToFastDB
+
+class ServiceShard:
+    """Portion of the service run by one worker process of a sharded service
+
+    Each worker serves a disjoint range of ranks. Retraining and pulling fine grain
+    results is left to the coordinator, which publishes new models to every worker
+    """
+    def __init__(self, shardIndex, firstRank, endRank, killed, jobLock, modelQueue):
+        """Constructor for ServiceShard
+
+        Args:
+            shardIndex (int): Index of the worker
+            firstRank (int): First rank served by the worker
+            endRank (int): One past the last rank served by the worker
+            killed (multiprocessing.Event): Set once any worker receives a KILL request
+            jobLock (multiprocessing.Lock): Held while checking the scheduler and launching a job, or None
+            modelQueue (multiprocessing.Queue): Serialized models published by the coordinator
+        """
+        self.shardIndex = shardIndex
+        self.firstRank = firstRank
+        self.endRank = endRank
+        self.killed = killed
+        self.jobLock = jobLock
+        self.modelQueue = modelQueue
+    def pollModel(self, block=False):
+        """Get newest model published by the coordinator
+
+        Args:
+            block (bool, optional): Wait for a model unless the service is killed. Defaults to False.
+
+        Returns:
+            InterpModelWrapper: Function object for active learner, or None if there is no new model
+        """
+        modelBytes = None
+        while block and modelBytes is None and not self.killed.is_set():
+            try:
+                modelBytes = self.modelQueue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        # Only the newest model matters
+        try:
+            while True:
+                modelBytes = self.modelQueue.get_nowait()
+        except queue.Empty:
+            pass
+        return unpackModel(modelBytes)
+
+def getShardRankRange(firstRank, endRank, numShards, shardIndex):
+    """Get contiguous range of ranks served by a worker
+
+    Args:
+        firstRank (int): First rank served by the service
+        endRank (int): One past the last rank served by the service
+        numShards (int): Number of workers
+        shardIndex (int): Index of the worker
+
+    Returns:
+        tuple: First rank and one past the last rank served by the worker
+    """
+    # Sizes differ by at most one rank
+    numRanks = endRank - firstRank
+    return (firstRank + (shardIndex * numRanks) // numShards, firstRank + ((shardIndex + 1) * numRanks) // numShards)
+
+def getShardConfig(configStruct, shardIndex):
+    """Get configuration of a worker
+
+    Workers write their own checkpoints and stats so the paths get the worker index appended
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        shardIndex (int): Index of the worker
+
+    Returns:
+        dict: Configuration data for the worker
+    """
+    shardConfig = copy.deepcopy(configStruct)
+    serviceSettings = shardConfig['ServiceSettings']
+    if serviceSettings['CheckpointURL'] is not None:
+        serviceSettings['CheckpointURL'] = serviceSettings['CheckpointURL'] + "." + str(shardIndex)
+    serviceSettings['StatsURL'] = serviceSettings['StatsURL'] + "." + str(shardIndex)
+    return shardConfig
+
+def shardedPollAndProcessFGSRequests(configStruct, uname):
+    """Service loop of GLUE Code split across worker processes
+
+    Starts `ServiceShards` workers running `pollAndProcessFGSRequests` on disjoint ranges of
+    ranks, and coordinates them until one of them receives a KILL request. The coordinator
+    retrains the active learning model and publishes it to the workers, and pulls fine grain
+    results so that this happens once rather than once per worker. Workers share a lock for
+    launching jobs so that they stay within the job limit of the scheduler together
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+        uname (str): UID of user running GLUE Code
+
+    Raises:
+        Exception: Use of unsupported service engine or failure of a worker
+    """
+    serviceSettings = configStruct['ServiceSettings']
+    if serviceSettings['ServiceEngine'] != ServiceEngine.SYNC:
+        raise Exception('Sharded Service Requires Synchronous Service Engine')
+    defaultMode = configStruct['glueCodeMode']
+    packetType = configStruct['solverCode']
+    GNDthreshold = configStruct['ActiveLearningVariables']['GNDthreshold']
+    firstRank = -configStruct['ActiveLearningVariables']['NumberOfRequestingActiveLearners']
+    endRank = configStruct['ExpectedMPIRanks']
+    # Every worker needs at least one rank
+    numShards = min(serviceSettings['ServiceShards'], endRank - firstRank)
+
+    #Set up database handles
+    cgDB = getDBHandle(configStruct['DatabaseSettings']['CoarseGrainDB'], True)
+    fgDBSettings = configStruct['DatabaseSettings']['FineGrainDB']
+    fgDB = getDBHandle(fgDBSettings)
+    # Results of jobs that finished while the service was down need to be there before workers resume
+    pullGlobalResultsToFastDB(SolverCode.BGK, cgDB, fgDB)
+
+    # Spawned as forking a process that already runs threads can deadlock the child
+    mpContext = multiprocessing.get_context("spawn")
+    killed = mpContext.Event()
+    # The blocking scheduler waits for each job to finish anyway
+    jobLock = None
+    if configStruct['SchedulerInterface'] != SchedulerInterface.BLOCKING:
+        jobLock = mpContext.Lock()
+    shards = []
+    workers = []
+    for shardIndex in range(numShards):
+        (shardFirst, shardEnd) = getShardRankRange(firstRank, endRank, numShards, shardIndex)
+        shard = ServiceShard(shardIndex, shardFirst, shardEnd, killed, jobLock, mpContext.Queue())
+        worker = mpContext.Process(target=pollAndProcessFGSRequests, args=(getShardConfig(configStruct, shardIndex), uname, shard))
+        print("Starting Worker " + str(shardIndex) + " for ranks " + str(shardFirst) + " to " + str(shardEnd - 1))
+        worker.start()
+        shards.append(shard)
+        workers.append(worker)
+
+    trainer = ModelTrainer(packetType, configStruct['alBackend'], fgDBSettings, serviceSettings['RetrainWorkers'])
+    GNDcnt = 0
+    failedWorkers = []
+    print("Starting Coordinator")
+    while not killed.is_set():
+        # Workers only stop on their own when killed
+        failedWorkers = [shard.shardIndex for (shard, worker) in zip(shards, workers) if not worker.is_alive()]
+        if len(failedWorkers) > 0:
+            killed.set()
+            break
+        if defaultMode == ALInterfaceMode.ACTIVELEARNER:
+            #Logic to not hammer DB/learner with unnecessary retraining requests
+            nuGNDcnt = getGNDCount(fgDB, packetType)
+            if (nuGNDcnt - GNDcnt) > GNDthreshold or GNDcnt == 0:
+                if trainer.submit(nuGNDcnt):
+                    GNDcnt = nuGNDcnt
+            nuModel = trainer.poll()
+            if nuModel is not None:
+                modelBytes = packModel(nuModel)
+                for shard in shards:
+                    shard.modelQueue.put(modelBytes)
+        pullGlobalResultsToFastDB(SolverCode.BGK, cgDB, fgDB)
+        killed.wait(serviceSettings['IdleMaxSleep'])
+    print("Coordinator Done")
+    for worker in workers:
+        worker.join()
+    failedWorkers += [shard.shardIndex for (shard, worker) in zip(shards, workers) if worker.exitcode != 0 and shard.shardIndex not in failedWorkers]
+    # Workers may have written results after our last pass
+    mergeBufferTable(SolverCode.BGK, cgDB)
+    pullGlobalResultsToFastDB(SolverCode.BGK, cgDB, fgDB)
+    trainer.close()
+    #Close Database Connection
+    cgDB.closeDB()
+    fgDB.closeDB()
+    if len(failedWorkers) > 0:
+        raise Exception('Service Workers ' + str(sorted(failedWorkers)) + ' Failed')
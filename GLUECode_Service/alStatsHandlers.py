@@ -0,0 +1,246 @@
+import os
+import time
+import threading
+from glueCodeTypes import StatsMode, DatabaseMode
+from alDBHandlers import getDBHandle
+
+class StageTimer:
+    """Context manager adding the time spent in a block to a stage of a StatsHandle
+    """
+    def __init__(self, statsHandle, stage):
+        """Constructor for StageTimer
+
+        Args:
+            statsHandle (StatsHandle): Object to record timings to
+            stage (str): Name of stage being timed
+        """
+        self.statsHandle = statsHandle
+        self.stage = stage
+        self.startTime = 0.0
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+    def __exit__(self, excType, excValue, traceback):
+        self.statsHandle.record(self.stage, time.perf_counter() - self.startTime)
+        return False
+
+class NullTimer:
+    """Context manager that does nothing, used when stats are disabled
+    """
+    def __enter__(self):
+        return self
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+class StatsHandle:
+    """Base Class to collect per stage timings of the service loop
+
+    Stages accumulate time and calls within an iteration. At the end of each
+    iteration these are folded into totals for the current interval and
+    cumulative totals, and every `StatsInterval` seconds the interval is
+    written out by the implementation and reset. The 'iteration' stage holds
+    the wall time of whole iterations
+    """
+    def __init__(self, serviceSettings: dict, tag: str):
+        """Constructor for StatsHandle
+
+        Args:
+            serviceSettings (dict): ServiceSettings block of configuration
+            tag (str): Identifier for this set of data
+        """
+        self.tag = tag
+        self.interval = serviceSettings['StatsInterval']
+        self.lastWrite = time.monotonic()
+        self.iterStart = time.perf_counter()
+        self.iterations = 0
+        self.totalIterations = 0
+        # Stage to [calls, seconds] for the current iteration
+        self.iterStats = {}
+        # Stage to [calls, seconds, max seconds in an iteration] for the current interval
+        self.intervalStats = {}
+        # Stage to [calls, seconds] since the service started
+        self.totalStats = {}
+        # Stages may be recorded from other threads than the one ending iterations
+        self.lock = threading.RLock()
+    def timer(self, stage: str):
+        """Get context manager timing a block as part of a stage
+
+        Args:
+            stage (str): Name of stage being timed
+
+        Returns:
+            Context manager that records the time spent in the block
+        """
+        return StageTimer(self, stage)
+    def record(self, stage: str, seconds: float=0.0):
+        """Add a call to a stage
+
+        Args:
+            stage (str): Name of stage
+            seconds (float, optional): Time spent in call. Defaults to 0.0 for events that are only counted.
+        """
+        with self.lock:
+            stats = self.iterStats.get(stage)
+            if stats is None:
+                self.iterStats[stage] = [1, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+    def endIteration(self):
+        """Fold timings of the iteration into the interval and write the interval if it is due
+        """
+        with self.lock:
+            self.iterations += 1
+            iterEnd = time.perf_counter()
+            self.record('iteration', iterEnd - self.iterStart)
+            self.iterStart = iterEnd
+            for (stage, (calls, seconds)) in self.iterStats.items():
+                intervalStats = self.intervalStats.get(stage)
+                if intervalStats is None:
+                    self.intervalStats[stage] = [calls, seconds, seconds]
+                else:
+                    intervalStats[0] += calls
+                    intervalStats[1] += seconds
+                    intervalStats[2] = max(intervalStats[2], seconds)
+            self.iterStats.clear()
+            now = time.monotonic()
+            if now - self.lastWrite >= self.interval:
+                self.flush()
+                self.lastWrite = now
+    def flush(self):
+        """Write timings of the current interval and reset it
+        """
+        with self.lock:
+            if self.iterations == 0:
+                return
+            self.totalIterations += self.iterations
+            rows = []
+            timestamp = time.time()
+            for (stage, (calls, seconds, maxSeconds)) in sorted(self.intervalStats.items()):
+                totalStats = self.totalStats.setdefault(stage, [0, 0.0])
+                totalStats[0] += calls
+                totalStats[1] += seconds
+                rows.append((self.tag, timestamp, stage, self.iterations, calls, seconds, maxSeconds, self.totalIterations, totalStats[0], totalStats[1]))
+            self.writeRows(rows)
+            self.iterations = 0
+            self.intervalStats.clear()
+    def writeRows(self, rows: list):
+        """Write rows of interval timings
+
+        Args:
+            rows (list): Tuples of (tag, timestamp, stage, iterations, calls, seconds,
+                max seconds in an iteration, total iterations, total calls, total seconds)
+
+        Raises:
+            Exception: Raises exception if not overriden through polymorphism
+        """
+        raise Exception("Use of Abstract Base Class for StatsHandle")
+    def close(self):
+        """Write any remaining timings and release resources
+        """
+        self.flush()
+
+class NullStatsHandle(StatsHandle):
+    """Implementation of StatsHandle that records nothing
+    """
+    def __init__(self):
+        """Constructor for NullStatsHandle
+        """
+        self.nullTimer = NullTimer()
+    def timer(self, stage):
+        return self.nullTimer
+    def record(self, stage, seconds=0.0):
+        pass
+    def endIteration(self):
+        pass
+    def close(self):
+        pass
+
+class FileStatsHandle(StatsHandle):
+    """Implementation of StatsHandle appending interval timings to a CSV file
+    """
+    def __init__(self, serviceSettings, tag, statsURL):
+        """Constructor for FileStatsHandle
+
+        Args:
+            serviceSettings (dict): ServiceSettings block of configuration
+            tag (str): Identifier for this set of data
+            statsURL (str): Path of CSV file
+        """
+        StatsHandle.__init__(self, serviceSettings, tag)
+        writeHeader = not os.path.exists(statsURL)
+        # Line buffered so the file is current whenever an interval is written
+        self.statsFile = open(statsURL, 'a', buffering=1)
+        if writeHeader:
+            self.statsFile.write("TAG,TIMESTAMP,STAGE,ITERATIONS,CALLS,SECONDS,MAXITERSECONDS,TOTALITERATIONS,TOTALCALLS,TOTALSECONDS\n")
+    def writeRows(self, rows):
+        """Append rows of interval timings to CSV file
+
+        Args:
+            rows (list): Tuples of interval timings
+        """
+        self.statsFile.write("".join(",".join(str(value) for value in row) + "\n" for row in rows))
+    def close(self):
+        """Write any remaining timings and close CSV file
+        """
+        StatsHandle.close(self)
+        self.statsFile.close()
+
+class SQLiteStatsHandle(StatsHandle):
+    """Implementation of StatsHandle inserting interval timings into a SQLite table
+
+    Uses its own database so that writing stats does not contend with requests and results
+    """
+    def __init__(self, serviceSettings, tag, statsURL):
+        """Constructor for SQLiteStatsHandle
+
+        Args:
+            serviceSettings (dict): ServiceSettings block of configuration
+            tag (str): Identifier for this set of data
+            statsURL (str): Path of SQLite database
+        """
+        StatsHandle.__init__(self, serviceSettings, tag)
+        self.dbHandle = getDBHandle({"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": statsURL}, True)
+        self.dbHandle.openCursor()
+        self.dbHandle.execute("CREATE TABLE IF NOT EXISTS SERVICESTATS(TAG TEXT, TIMESTAMP REAL, STAGE TEXT, ITERATIONS INT, CALLS INT, SECONDS REAL, MAXITERSECONDS REAL, TOTALITERATIONS INT, TOTALCALLS INT, TOTALSECONDS REAL);")
+        self.dbHandle.commit()
+        self.dbHandle.closeCursor()
+    def writeRows(self, rows):
+        """Insert rows of interval timings into SERVICESTATS table
+
+        Args:
+            rows (list): Tuples of interval timings
+        """
+        self.dbHandle.openCursor()
+        self.dbHandle.executemany("INSERT INTO SERVICESTATS VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", rows)
+        self.dbHandle.commit()
+        self.dbHandle.closeCursor()
+    def close(self):
+        """Write any remaining timings and close SQLite database
+        """
+        StatsHandle.close(self)
+        self.dbHandle.closeDB()
+
+def getStatsHandle(configStruct):
+    """Factory to provide desired StatsHandle implementation
+
+    Args:
+        configStruct: Dictionary containing configuration data for simulation
+
+    Raises:
+        Exception: If unsupported stats mode is selected
+
+    Returns:
+        An object implementing the StatsHandle base class for the specified mode
+    """
+    serviceSettings = configStruct['ServiceSettings']
+    tag = configStruct['tag']
+    statsMode = serviceSettings['StatsMode']
+    if statsMode == StatsMode.NONE:
+        return NullStatsHandle()
+    elif statsMode == StatsMode.FILE:
+        return FileStatsHandle(serviceSettings, tag, serviceSettings['StatsURL'])
+    elif statsMode == StatsMode.SQLITE:
+        return SQLiteStatsHandle(serviceSettings, tag, serviceSettings['StatsURL'])
+    else:
+        raise Exception('Using Unsupported Stats Mode')
@@ -0,0 +1,125 @@
+import time
+import multiprocessing
+import concurrent.futures
+from alDBHandlers import getDBHandle
+
+def trainInterpModelFromSettings(packetType, alBackend, dbSettings, logName):
+    """Get interpolation model using a database handle owned by the caller's process
+
+    Args:
+        packetType (SolverCode): Enum corresponding to simulation
+        alBackend (LearnerBackend): Machine learning backend to use with active learning
+        dbSettings (dict): Configuration of the database to train from
+        logName (str): Path of training log files without extension
+
+    Returns:
+        InterpModelWrapper: Function object for active learner
+    """
+    # Imported here as alInterface imports this module
+    from alInterface import trainInterpModel
+    dbHandle = getDBHandle(dbSettings)
+    interpModel = trainInterpModel(packetType, alBackend, dbHandle, logName)
+    dbHandle.closeDB()
+    return interpModel
+
+class ModelTrainer:
+    """Retrains interpolation models in background processes
+
+    The service keeps answering requests with its current model while training
+    runs and swaps in the new model once `poll()` returns it. If several retrains
+    finish out of order only models trained on more GND data than the current one are used.
+    Workers are spawned rather than forked as forking a process that already runs
+    threads can deadlock the child. Each retrain logs to alLog.<retrain number>.out
+    and .err so that concurrent retrains do not overwrite each other's logs
+    """
+    def __init__(self, packetType, alBackend, dbSettings, maxRetrains):
+        """Constructor for ModelTrainer
+
+        Args:
+            packetType (SolverCode): Enum corresponding to simulation
+            alBackend (LearnerBackend): Machine learning backend to use with active learning
+            dbSettings (dict): Configuration of the database to train from
+            maxRetrains (int): Maximum number of concurrent retrains. 0 trains inline
+        """
+        self.packetType = packetType
+        self.alBackend = alBackend
+        self.dbSettings = dbSettings
+        self.maxRetrains = maxRetrains
+        self.executor = None
+        if maxRetrains > 0:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=maxRetrains, mp_context=multiprocessing.get_context("spawn"))
+        # Entries of the form (future, GND count, start time)
+        self.pending = []
+        # Newest model that has not been handed out yet
+        self.readyModel = None
+        # GND count of the newest model
+        self.modelGNDCount = -1
+        # Number of retrains started, used to name their logs
+        self.retrains = 0
+    def submit(self, gndCount):
+        """Start retraining unless the maximum number of retrains are already running
+
+        Args:
+            gndCount (int): Number of GND entries the model will be trained on
+
+        Returns:
+            bool: True if a retrain was started
+        """
+        if self.executor is not None and len(self.pending) >= self.maxRetrains:
+            return False
+        logName = 'alLog.' + str(self.retrains)
+        self.retrains += 1
+        if self.executor is None:
+            startTime = time.monotonic()
+            model = trainInterpModelFromSettings(self.packetType, self.alBackend, self.dbSettings, logName)
+            self.finishRetrain(model, gndCount, startTime)
+            return True
+        future = self.executor.submit(trainInterpModelFromSettings, self.packetType, self.alBackend, self.dbSettings, logName)
+        self.pending.append((future, gndCount, time.monotonic()))
+        return True
+    def finishRetrain(self, model, gndCount, startTime):
+        """Keep newly trained model if it is newer than the current one
+
+        Args:
+            model (InterpModelWrapper): Newly trained model
+            gndCount (int): Number of GND entries the model was trained on
+            startTime (float): Monotonic time the retrain started
+        """
+        elapsed = time.monotonic() - startTime
+        if gndCount > self.modelGNDCount:
+            print("Swapping in model trained on " + str(gndCount) + " GND entries after " + "{:.2f}".format(elapsed) + " seconds")
+            self.readyModel = model
+            self.modelGNDCount = gndCount
+        else:
+            print("Discarding stale model trained on " + str(gndCount) + " GND entries")
+    def poll(self, block=False):
+        """Collect finished retrains
+
+        Args:
+            block (bool, optional): Wait for a retrain to finish if no new model is ready. Defaults to False.
+
+        Raises:
+            Exception: Retraining raised an exception
+
+        Returns:
+            InterpModelWrapper: Newest model if one finished since the last poll, otherwise None
+        """
+        if block and self.readyModel is None and len(self.pending) > 0:
+            concurrent.futures.wait([entry[0] for entry in self.pending], return_when=concurrent.futures.FIRST_COMPLETED)
+        stillPending = []
+        for (future, gndCount, startTime) in self.pending:
+            if future.done():
+                self.finishRetrain(future.result(), gndCount, startTime)
+            else:
+                stillPending.append((future, gndCount, startTime))
+        self.pending = stillPending
+        model = self.readyModel
+        self.readyModel = None
+        return model
+    def close(self):
+        """Cancel queued retrains and release worker processes
+
+        Retrains that already started are allowed to finish before the interpreter exits
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,9 +1,10 @@
 import numpy as np
 import os
 from glueCodeTypes import ALInterfaceMode, SolverCode, BGKInputs, BGKMassesInputs
-from alInterface import  getAllGNDData, queueFGSJob
+from alInterface import  getAllGNDData, queueFGSJob, getResultCache
 import getpass
 from alDBHandlers import getDBHandle
+from alStatsHandlers import NullStatsHandle
 from glueArgParser import processGlueCodeArguments
 
 def genTrainingData(configStruct, uname, dbHandle):
@@ -21,22 +22,24 @@ def genTrainingData(configStruct, uname, dbHandle):
     reqid = 0
     pythonScriptDir = os.path.dirname(os.path.realpath(__file__))
     trainingDir = os.path.join(pythonScriptDir, "training")
-    dbCache = []
+    dbCache = getResultCache(configStruct)
     fgDBSettings = configStruct['DatabaseSettings']['FineGrainDB']
     fgDB = getDBHandle(fgDBSettings)
+    # Only the service loop records stage timings
+    stats = NullStatsHandle()
     if code == SolverCode.BGK:
         csv = os.path.join(trainingDir, "bgk.csv")
         trainingEntries = np.loadtxt(csv)
         for row in trainingEntries:
             inArgs = BGKInputs(Temperature=row[0], Density=[row[1], row[2], 0.0, 0.0], Charges=[row[3], row[4], 0.0, 0.0])
-            queueFGSJob(configStruct, uname, reqid, inArgs, 0, ALInterfaceMode.FGS, dbHandle, fgDB, dbCache)
+            queueFGSJob(configStruct, uname, reqid, inArgs, 0, ALInterfaceMode.FGS, dbHandle, fgDB, dbCache, stats)
             reqid += 1
     elif code == SolverCode.BGKMASSES:
         csv = os.path.join(trainingDir, "bgk_masses.csv")
         trainingEntries = np.loadtxt(csv)
         for row in trainingEntries:
             inArgs = BGKMassesInputs(Temperature=row[0], Density=[row[1], row[2], 0.0, 0.0], Charges=[row[3], row[4], 0.0, 0.0], Masses=[row[5], row[6], 0.0, 0.0])
-            queueFGSJob(configStruct, uname, reqid, inArgs, 0, ALInterfaceMode.FGS, dbHandle, fgDB, dbCache)
+            queueFGSJob(configStruct, uname, reqid, inArgs, 0, ALInterfaceMode.FGS, dbHandle, fgDB, dbCache, stats)
             reqid += 1
     else:
         raise Exception('Using Unsupported Solver Code')
@@ -1,7 +1,7 @@
 import argparse
 import json
 import getpass
-from glueCodeTypes import ALInterfaceMode, SolverCode, LearnerBackend, SchedulerInterface, ProvisioningInterface, DatabaseMode
+from glueCodeTypes import ALInterfaceMode, SolverCode, LearnerBackend, SchedulerInterface, ProvisioningInterface, DatabaseMode, RequestScanMode, IdleStrategy, ServiceEngine, StatsMode, ResultMergeMode, GNDLookupMode
 
 def processGlueCodeArguments():
     """Process command line arguments to GLUE code
@@ -46,4 +46,35 @@ def processGlueCodeArguments():
         DatabaseMode(
             configStruct['DatabaseSettings']['FineGrainDB']['DatabaseMode']
         )
+    # Service settings are optional so fill in defaults
+    if 'ServiceSettings' not in configStruct:
+        configStruct['ServiceSettings'] = {}
+    serviceSettings = configStruct['ServiceSettings']
+    serviceSettings['RequestScanMode'] = RequestScanMode(serviceSettings.get('RequestScanMode', RequestScanMode.PERRANK))
+    serviceSettings['IdleStrategy'] = IdleStrategy(serviceSettings.get('IdleStrategy', IdleStrategy.DATAVERSION))
+    serviceSettings['IdleMinSleep'] = float(serviceSettings.get('IdleMinSleep', 0.001))
+    serviceSettings['IdleMaxSleep'] = float(serviceSettings.get('IdleMaxSleep', 0.1))
+    serviceSettings['IdlePollInterval'] = float(serviceSettings.get('IdlePollInterval', 0.002))
+    serviceSettings['ServiceEngine'] = ServiceEngine(serviceSettings.get('ServiceEngine', ServiceEngine.SYNC))
+    serviceSettings['AsyncQueueSize'] = int(serviceSettings.get('AsyncQueueSize', 1024))
+    serviceSettings['AsyncTaskWorkers'] = int(serviceSettings.get('AsyncTaskWorkers', 4))
+    serviceSettings['AsyncJobSubmitters'] = int(serviceSettings.get('AsyncJobSubmitters', 1))
+    serviceSettings['CoalesceFGSJobs'] = bool(serviceSettings.get('CoalesceFGSJobs', True))
+    serviceSettings['FGSJobTimeout'] = float(serviceSettings.get('FGSJobTimeout', 3600.0))
+    serviceSettings['RetrainWorkers'] = int(serviceSettings.get('RetrainWorkers', 1))
+    serviceSettings['StatsMode'] = StatsMode(serviceSettings.get('StatsMode', StatsMode.NONE))
+    if serviceSettings['StatsMode'] == StatsMode.SQLITE:
+        serviceSettings['StatsURL'] = serviceSettings.get('StatsURL', 'glueStats.db')
+    else:
+        serviceSettings['StatsURL'] = serviceSettings.get('StatsURL', 'glueStats.csv')
+    serviceSettings['StatsInterval'] = float(serviceSettings.get('StatsInterval', 10.0))
+    serviceSettings['CheckpointURL'] = serviceSettings.get('CheckpointURL', None)
+    serviceSettings['CheckpointInterval'] = float(serviceSettings.get('CheckpointInterval', 60.0))
+    serviceSettings['ServiceShards'] = int(serviceSettings.get('ServiceShards', 1))
+    serviceSettings['ResultMergeMode'] = ResultMergeMode(serviceSettings.get('ResultMergeMode', ResultMergeMode.COPY))
+    serviceSettings['GNDLookupMode'] = GNDLookupMode(serviceSettings.get('GNDLookupMode', GNDLookupMode.SCAN))
+    serviceSettings['DBCacheEntries'] = int(serviceSettings.get('DBCacheEntries', 16384))
+    serviceSettings['GNDBloomFilter'] = bool(serviceSettings.get('GNDBloomFilter', False))
+    serviceSettings['GNDFilterFalsePositiveRate'] = float(serviceSettings.get('GNDFilterFalsePositiveRate', 0.01))
+    serviceSettings['GNDMissCacheLifetime'] = float(serviceSettings.get('GNDMissCacheLifetime', 0.0))
     return configStruct
@@ -0,0 +1,605 @@
+import math
+import time
+import itertools
+import collections
+import numpy as np
+from glueCodeTypes import BGKInputs, BGKMassesInputs
+from ICF_Utils import icfComparator, icfBatchComparator
+
+def getInputValues(inArgs):
+    """Flatten fine grain simulation arguments into a list of values
+
+    Args:
+        inArgs: Arguments for fine grain simulation
+
+    Raises:
+        Exception: Using Unsupported fine grain simulation arguments type
+
+    Returns:
+        list: Input values in the same order as the GND table columns
+    """
+    if isinstance(inArgs, BGKInputs):
+        return [inArgs.Temperature] + list(inArgs.Density) + list(inArgs.Charges)
+    elif isinstance(inArgs, BGKMassesInputs):
+        return [inArgs.Temperature] + list(inArgs.Density) + list(inArgs.Charges) + list(inArgs.Masses)
+    else:
+        raise Exception('Using Unsupported Solver Code')
+
+def getMatchBuckets(value, width, margin):
+    """Get bucket of a log-scaled input and neighboring buckets that may hold inputs matching it
+
+    Args:
+        value (float): Input value
+        width (float): Width of buckets in log space
+        margin (float): Largest distance of inputs that match in log space
+
+    Returns:
+        list: Bucket of the input first, then neighboring buckets within `margin` of it
+    """
+    if value == 0.0:
+        return [None]
+    if width == math.inf:
+        return [(value > 0.0, 0)]
+    scaled = math.log(abs(value)) / width
+    bucket = math.floor(scaled)
+    buckets = [(value > 0.0, bucket)]
+    if (scaled - bucket) * width <= margin:
+        buckets.append((value > 0.0, bucket - 1))
+    if (bucket + 1 - scaled) * width <= margin:
+        buckets.append((value > 0.0, bucket + 1))
+    return buckets
+
+class ResultCache:
+    """Bounded cache of results found in the GND table, dropping the least recently used
+
+    Entries are kept in buckets of log-scaled inputs several times as wide as the
+    relative error, and confirmed with `icfComparator`. A request looks in its own
+    bucket and, for every input close enough to the edge of its bucket for a match
+    to be on the other side, in the neighboring one too. Entries further away, which
+    `icfComparator` lets through as it only bounds the error one way, and entries
+    that are zero where the request is not or the other way around never match.
+    Inputs of entries are also kept in an array so that buckets with many entries,
+    as with large relative errors, are checked in batches with `icfBatchComparator`
+    """
+    def __init__(self, relError, maxEntries, bucketScale=8.0, minBatchCandidates=256):
+        """Constructor for ResultCache
+
+        Args:
+            relError (float): Relative error threshold for matching requests
+            maxEntries (int): Number of entries to keep
+            bucketScale (float, optional): Width of buckets over largest distance of a match in log space. Defaults to 8.0.
+            minBatchCandidates (int, optional): Number of candidates checked one by one before checking them in batches. Defaults to 256.
+        """
+        self.relError = relError
+        self.maxEntries = maxEntries
+        # Largest distance of inputs that match in log space
+        self.margin = -math.log1p(-relError) if relError < 1.0 else math.inf
+        self.width = bucketScale * self.margin
+        self.minBatchCandidates = minBatchCandidates
+        # Slot to (bucket key, inArgs, result), least recently used first
+        self.entries = collections.OrderedDict()
+        # Temperature, densities, and charges of the entry in each slot, as icfComparator sees them
+        self.values = np.empty((max(maxEntries, 0), 9))
+        self.freeSlots = list(range(max(maxEntries, 0)))
+        # Bucket key to slots of its entries
+        self.buckets = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    def __len__(self):
+        return len(self.entries)
+    def getBuckets(self, value):
+        """Get buckets an input and those that match it are in
+
+        Args:
+            value (float): Input value
+
+        Returns:
+            list: Bucket of the input first, then neighboring buckets that may hold matches
+        """
+        return getMatchBuckets(value, self.width, self.margin)
+    def lookup(self, inArgs):
+        """Get result of a cached request matching a request
+
+        Args:
+            inArgs: Arguments for fine grain simulation
+
+        Returns:
+            Result if found. None otherwise
+        """
+        values = getInputValues(inArgs)
+        keys = itertools.product(*[self.getBuckets(value) for value in values])
+        slots = itertools.chain.from_iterable(self.buckets.get(key, []) for key in keys)
+        found = None
+        # Matches tend to come early, so only check later candidates in ever larger batches
+        for slot in itertools.islice(slots, self.minBatchCandidates):
+            if icfComparator(inArgs, self.entries[slot][1], self.relError):
+                found = slot
+                break
+        batchSize = self.minBatchCandidates
+        while found is None:
+            batchSlots = list(itertools.islice(slots, batchSize))
+            if len(batchSlots) == 0:
+                break
+            (reqIndices, candIndices) = icfBatchComparator(values[:9], self.values[batchSlots], self.relError)
+            if len(candIndices) > 0:
+                found = batchSlots[candIndices[0]]
+            batchSize *= 2
+        if found is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(found)
+        self.hits += 1
+        return self.entries[found][2]
+    def add(self, inArgs, result):
+        """Cache result of a request, dropping the least recently used entry if full
+
+        Args:
+            inArgs: Arguments for fine grain simulation
+            result: Result of fine grain simulation
+        """
+        if self.maxEntries <= 0:
+            return
+        if len(self.entries) >= self.maxEntries:
+            (slot, (entryKey, entryArgs, entryResult)) = self.entries.popitem(last=False)
+            bucket = self.buckets[entryKey]
+            bucket.remove(slot)
+            if len(bucket) == 0:
+                del self.buckets[entryKey]
+            self.freeSlots.append(slot)
+            self.evictions += 1
+        values = getInputValues(inArgs)
+        key = tuple([self.getBuckets(value)[0] for value in values])
+        slot = self.freeSlots.pop()
+        self.values[slot] = values[:9]
+        self.entries[slot] = (key, inArgs, result)
+        self.buckets.setdefault(key, []).append(slot)
+    def items(self):
+        """Get cached requests and results
+
+        Returns:
+            list: (inArgs, result) of every entry, least recently used first
+        """
+        return [(entryArgs, result) for (entryKey, entryArgs, result) in self.entries.values()]
+    def getCounts(self):
+        """Get number of entries, hits, misses, and evictions so far
+
+        Returns:
+            tuple: Entries, hits, misses, and evictions
+        """
+        return (len(self.entries), self.hits, self.misses, self.evictions)
+
+class InFlightTable:
+    """Fine grain jobs that have been launched but have not returned a result
+
+    Requests that match a running job within the relative error attach to it
+    instead of launching a duplicate job, and are answered when it finishes.
+    Jobs are kept in buckets of log-scaled inputs like those of `ResultCache`,
+    so a request looks in its own bucket and the neighboring ones it may have
+    a match in. Jobs that have not returned a result within the timeout are
+    taken to have failed and can be expired so their requests are retried
+    """
+    def __init__(self, relError, timeout=0.0, bucketScale=8.0):
+        """Constructor for InFlightTable
+
+        Args:
+            relError (float): Relative error threshold for matching requests
+            timeout (float, optional): Seconds after which a job is taken to have failed. 0 waits forever. Defaults to 0.0.
+            bucketScale (float, optional): Width of buckets over largest distance of a match in log space. Defaults to 8.0.
+        """
+        self.relError = relError
+        self.timeout = timeout
+        # Largest distance of inputs that match in log space
+        self.margin = -math.log1p(-relError) if relError < 1.0 else math.inf
+        self.width = bucketScale * self.margin
+        # Bucket key to list of entries of the form [inArgs, (leader rank, leader reqID), waiters, launch time]
+        self.buckets = {}
+        # (leader rank, leader reqID) to (bucket key, entry)
+        self.leaders = {}
+        # Highest fine grain result ROWID already checked
+        self.resultHWM = 0
+    def __len__(self):
+        return len(self.leaders)
+    def attach(self, inArgs, glueMode, rank, reqID):
+        """Attach request to a running job with matching inputs if there is one
+
+        Args:
+            inArgs: Arguments for fine grain simulation
+            glueMode (ALInterfaceMode): Type of fine grain simulation requested
+            rank: Identifier of job originator. Commonly MPI rank
+            reqID: Monotonically increasing ID to use as job ID to look up result later
+
+        Returns:
+            bool: True if the request will be answered by a running job
+        """
+        buckets = [getMatchBuckets(value, self.width, self.margin) for value in getInputValues(inArgs)]
+        for key in itertools.product(*buckets):
+            for entry in self.buckets.get((glueMode, key), []):
+                if icfComparator(inArgs, entry[0], self.relError):
+                    entry[2].append((rank, reqID))
+                    return True
+        return False
+    def add(self, inArgs, glueMode, rank, reqID):
+        """Record that a job was launched for a request
+
+        Args:
+            inArgs: Arguments for fine grain simulation
+            glueMode (ALInterfaceMode): Type of fine grain simulation launched
+            rank: Identifier of job originator. Commonly MPI rank
+            reqID: Monotonically increasing ID to use as job ID to look up result later
+        """
+        key = (glueMode, tuple(getMatchBuckets(value, self.width, self.margin)[0] for value in getInputValues(inArgs)))
+        entry = [inArgs, (rank, reqID), [], time.monotonic()]
+        self.buckets.setdefault(key, []).append(entry)
+        self.leaders[(rank, reqID)] = (key, entry)
+    def remove(self, rank, reqID):
+        """Remove job from table
+
+        Args:
+            rank: Identifier of job originator. Commonly MPI rank
+            reqID: Monotonically increasing ID to use as job ID to look up result later
+
+        Returns:
+            list: Entry of the job, or None if it was not in flight
+        """
+        if (rank, reqID) not in self.leaders:
+            return None
+        (key, entry) = self.leaders.pop((rank, reqID))
+        bucket = self.buckets[key]
+        bucket.remove(entry)
+        if len(bucket) == 0:
+            del self.buckets[key]
+        return entry
+    def complete(self, rank, reqID):
+        """Remove job from table once its result has arrived
+
+        Args:
+            rank: Identifier of job originator. Commonly MPI rank
+            reqID: Monotonically increasing ID to use as job ID to look up result later
+
+        Returns:
+            list: (rank, reqID) of every request waiting on the job, or None if it was not in flight
+        """
+        entry = self.remove(rank, reqID)
+        if entry is None:
+            return None
+        return entry[2]
+    def expire(self, now=None):
+        """Remove jobs that have been running for longer than the timeout
+
+        Args:
+            now (float, optional): Current `time.monotonic()`. Defaults to None to read the clock.
+
+        Returns:
+            list: (inArgs, glueMode, requests) of every expired job, where requests holds
+                (rank, reqID) of the request it was launched for followed by those waiting on it
+        """
+        if self.timeout <= 0.0 or len(self.leaders) == 0:
+            return []
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        for (leader, (key, entry)) in list(self.leaders.items()):
+            if now - entry[3] >= self.timeout:
+                self.remove(*leader)
+                expired.append((entry[0], key[0], [leader] + entry[2]))
+        return expired
+
+class GNDCache:
+    """In-memory copy of a GND table to look up results within a relative error
+
+    An input x of a request matches an input g of a row if |x - g| / g < relError,
+    the same predicate as the SQL lookup, and zero inputs of a request match
+    anything. Rows are found with KD-trees of log-scaled inputs, one for each set
+    of nonzero inputs requests come with, as inputs that match lie in a fixed
+    interval around the request in log space. Candidates are then confirmed with
+    the predicate itself. New rows are checked by brute force until there are
+    enough of them to be worth rebuilding the trees for
+    """
+    def __init__(self, relError, minRebuildRows=1024):
+        """Constructor for GNDCache
+
+        Args:
+            relError (float): Relative error threshold for matching requests
+            minRebuildRows (int, optional): Number of new rows before trees are rebuilt, which
+                grows with the size of the cache. Defaults to 1024.
+        """
+        self.relError = relError
+        self.minRebuildRows = minRebuildRows
+        # Rows in the trees, oldest first
+        self.inputs = np.empty((0, 0))
+        self.outputs = np.empty((0, 0))
+        # Rows added since the trees were built, oldest first
+        self.newInputs = []
+        self.newOutputs = []
+        self.numNew = 0
+        # Nonzero inputs of requests to (KD-tree, rows in it, rows to always check)
+        self.trees = {}
+        # Highest GND ROWID added
+        self.rowHWM = 0
+        # Interval of log(g / x) that matches, widened a little so rounding never drops a match
+        self.logLower = -math.log1p(relError)
+        self.logUpper = -math.log1p(-relError) if relError < 1.0 else math.inf
+        self.logRadius = (self.logUpper - self.logLower) / 2.0 * (1.0 + 1e-9) + 1e-12
+    def __len__(self):
+        return len(self.inputs) + self.numNew
+    def add(self, rowHWM, inputs, outputs):
+        """Add rows read from the GND table
+
+        Args:
+            rowHWM (int): Highest GND ROWID read
+            inputs (numpy.ndarray): Inputs of each row, in GND table order
+            outputs (numpy.ndarray): Outputs of each row
+        """
+        self.rowHWM = rowHWM
+        if len(inputs) == 0:
+            return
+        self.newInputs.append(inputs)
+        self.newOutputs.append(outputs)
+        self.numNew += len(inputs)
+        if self.numNew >= max(self.minRebuildRows, len(self.inputs) // 8):
+            self.inputs = np.concatenate([self.inputs.reshape(-1, inputs.shape[1])] + self.newInputs)
+            self.outputs = np.concatenate([self.outputs.reshape(-1, outputs.shape[1])] + self.newOutputs)
+            self.newInputs = []
+            self.newOutputs = []
+            self.numNew = 0
+            self.trees = {}
+    def getTree(self, nonzero):
+        """Get KD-tree over inputs requests have nonzero, building it if needed
+
+        Args:
+            nonzero (tuple): Whether each input of requests is nonzero
+
+        Returns:
+            tuple: KD-tree, or None if no row fits in one, rows in the tree, and rows to always check
+        """
+        if nonzero not in self.trees:
+            from scipy.spatial import cKDTree
+            columns = self.inputs[:, np.array(nonzero)]
+            # Only positive inputs have a place in log space. Zero ones never match, while
+            # negative ones always pass the predicate so are checked every time
+            inTree = np.nonzero(np.all(columns > 0.0, axis=1))[0]
+            alwaysCheck = np.nonzero(np.any(columns < 0.0, axis=1))[0]
+            tree = None
+            if len(inTree) > 0 and self.logUpper < math.inf:
+                tree = cKDTree(np.log(columns[inTree]))
+            self.trees[nonzero] = (tree, inTree, alwaysCheck)
+        return self.trees[nonzero]
+    def matches(self, values, inputs):
+        """Check which rows match a request
+
+        Args:
+            values (numpy.ndarray): Inputs of request
+            inputs (numpy.ndarray): Inputs of rows
+
+        Returns:
+            numpy.ndarray: Whether each row matches
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            within = np.abs(values - inputs) / inputs < self.relError
+        return np.all(within | (values == 0.0), axis=1)
+    def lookup(self, values):
+        """Find newest row matching a request
+
+        Args:
+            values (list): Inputs of request, in GND table order
+
+        Returns:
+            numpy.ndarray: Outputs of matching row, or None if no row matches
+        """
+        values = np.asarray(values, dtype=np.float64)
+        # Newer rows win, as they would reading the table in order
+        for (inputs, outputs) in zip(reversed(self.newInputs), reversed(self.newOutputs)):
+            found = np.nonzero(self.matches(values, inputs))[0]
+            if len(found) > 0:
+                return outputs[found[-1]]
+        if len(self.inputs) == 0:
+            return None
+        nonzero = tuple(values != 0.0)
+        if not any(nonzero):
+            return self.outputs[-1]
+        (tree, inTree, alwaysCheck) = self.getTree(nonzero)
+        candidates = alwaysCheck
+        if self.logUpper == math.inf:
+            # Every positive input is close enough, so the trees cannot narrow anything down
+            candidates = np.arange(len(self.inputs))
+        elif tree is not None and np.all(values[np.array(nonzero)] > 0.0):
+            center = np.log(values[np.array(nonzero)]) + (self.logLower + self.logUpper) / 2.0
+            candidates = np.concatenate([inTree[tree.query_ball_point(center, self.logRadius, p=np.inf)], alwaysCheck]).astype(np.int64)
+        found = candidates[self.matches(values, self.inputs[candidates])]
+        if len(found) == 0:
+            return None
+        return self.outputs[found.max()]
+
+class GNDFilter:
+    """Bloom filter of GND inputs to skip lookups that cannot find a row
+
+    Inputs of rows are put in buckets of log-scaled values several times as wide as
+    the range of inputs that match, with the same predicate as the SQL lookup, and
+    the buckets of each row are added to a Bloom filter. Requests only constrain their
+    nonzero inputs, so there is a filter for each set of nonzero inputs requests come
+    with, filled from the whole GND table the next time it is read after such a
+    request is first seen. A request can only match a row if its bucket, or a
+    neighboring one within the range that matches, is in the filter. Requests may
+    match anything if there is no filter for them yet, or if a row has a negative
+    input they constrain, as those always pass the predicate
+    """
+    def __init__(self, relError, falsePositiveRate=0.01, bucketScale=8.0, minCapacity=1 << 16):
+        """Constructor for GNDFilter
+
+        Args:
+            relError (float): Relative error threshold for matching requests
+            falsePositiveRate (float, optional): Rate at which requests that cannot match are let through. Defaults to 0.01.
+            bucketScale (float, optional): Width of buckets over width of the range that matches in log space. Defaults to 8.0.
+            minCapacity (int, optional): Number of rows filters are sized for at least. Defaults to 1 << 16.
+        """
+        self.relError = relError
+        self.numHashes = max(1, round(-math.log2(falsePositiveRate)))
+        self.bitsPerRow = -math.log(falsePositiveRate) / math.log(2.0) ** 2
+        self.minCapacity = minCapacity
+        # Number of rows filters are sized for, which are rebuilt larger past it
+        self.capacity = 0
+        self.numBits = 0
+        # Interval of log(g / x) that matches, widened a little so rounding never drops a match
+        self.logLower = -math.log1p(relError) - 1e-9
+        self.logUpper = -math.log1p(-relError) + 1e-9 if relError < 1.0 else math.inf
+        self.width = bucketScale * (self.logUpper - self.logLower)
+        # Nonzero inputs of requests to bits of their filter packed in bytes, or None if they may match anything
+        self.filters = {}
+        # Nonzero inputs of requests that have no filter yet
+        self.wanted = set()
+        self.numRows = 0
+        # Highest GND ROWID added
+        self.rowHWM = 0
+        self.skips = 0
+        self.passes = 0
+    def needsRebuild(self):
+        """Check if filters have to be rebuilt from the whole GND table
+
+        Returns:
+            bool: True if requests are waiting on a filter or rows outgrew the filters
+        """
+        return len(self.wanted) > 0 or self.numRows > self.capacity
+    def rebuild(self, rowHWM, inputs):
+        """Replace every filter with one of all rows read from the GND table
+
+        Args:
+            rowHWM (int): Highest GND ROWID read
+            inputs (numpy.ndarray): Inputs of each row, in GND table order
+        """
+        masks = set(self.filters) | self.wanted
+        self.wanted = set()
+        self.capacity = max(self.minCapacity, 2 * len(inputs))
+        self.numBits = math.ceil(self.capacity * self.bitsPerRow)
+        self.filters = dict([(mask, np.zeros((self.numBits + 7) // 8, dtype=np.uint8)) for mask in masks])
+        self.numRows = 0
+        self.add(rowHWM, inputs)
+    def add(self, rowHWM, inputs):
+        """Add rows read from the GND table
+
+        Args:
+            rowHWM (int): Highest GND ROWID read
+            inputs (numpy.ndarray): Inputs of each row, in GND table order
+        """
+        self.rowHWM = rowHWM
+        self.numRows += len(inputs)
+        if len(inputs) == 0:
+            return
+        for (mask, bits) in self.filters.items():
+            if bits is None:
+                continue
+            columns = inputs[:, np.array(mask, dtype=bool)]
+            if np.any(columns < 0.0):
+                self.filters[mask] = None
+                continue
+            # Rows with a zero or missing input a request constrains never match
+            columns = columns[np.all(columns > 0.0, axis=1)]
+            buckets = np.floor(np.log(columns) / self.width).astype(np.int64)
+            positions = self.getPositions(buckets).ravel()
+            np.bitwise_or.at(bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+    def getPositions(self, buckets):
+        """Get bits of the filter that stand for buckets
+
+        Args:
+            buckets (numpy.ndarray): Bucket of each constrained input, one row per entry
+
+        Returns:
+            numpy.ndarray: Positions of bits of each entry
+        """
+        hashes = np.full(len(buckets), 0x9E3779B97F4A7C15, dtype=np.uint64)
+        for column in np.ascontiguousarray(buckets, dtype=np.int64).view(np.uint64).T:
+            hashes = (hashes ^ column) * np.uint64(0xBF58476D1CE4E5B9)
+            hashes ^= hashes >> np.uint64(31)
+        # Further hashes are derived from the two halves of the first
+        steps = (hashes >> np.uint64(32)) | np.uint64(1)
+        probes = np.arange(self.numHashes, dtype=np.uint64)
+        return (hashes[:, None] + probes * steps[:, None]) % np.uint64(self.numBits)
+    def mayMatch(self, values):
+        """Check if a request may match a row added to the filter
+
+        Args:
+            values (list): Inputs of request, in GND table order
+
+        Returns:
+            bool: False if no row added to the filter matches the request
+        """
+        nonzero = tuple([value != 0.0 for value in values])
+        if nonzero not in self.filters:
+            self.wanted.add(nonzero)
+            return True
+        bits = self.filters[nonzero]
+        if bits is None:
+            return True
+        buckets = []
+        for value in values:
+            if value == 0.0:
+                continue
+            if value < 0.0 or math.isnan(value):
+                return True
+            if self.width == math.inf:
+                buckets.append([0])
+            else:
+                logValue = math.log(value)
+                lower = math.floor((logValue + self.logLower) / self.width)
+                upper = math.floor((logValue + self.logUpper) / self.width)
+                buckets.append(range(lower, upper + 1))
+        probes = np.array(list(itertools.product(*buckets)), dtype=np.int64).reshape(-1, len(buckets))
+        positions = self.getPositions(probes)
+        isSet = (bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        if np.any(np.all(isSet, axis=1)):
+            self.passes += 1
+            return True
+        self.skips += 1
+        return False
+    def getCounts(self):
+        """Get number of rows, requests let through, and requests skipped so far
+
+        Returns:
+            tuple: Rows, requests let through, and requests skipped
+        """
+        return (self.numRows, self.passes, self.skips)
+
+class MissCache:
+    """Inputs of requests that were just looked up without a match
+
+    Requests with the same inputs are taken to miss as well until the entry expires,
+    so rows written in the meantime are only found after that
+    """
+    def __init__(self, lifetime):
+        """Constructor for MissCache
+
+        Args:
+            lifetime (float): Seconds an entry is kept
+        """
+        self.lifetime = lifetime
+        # Inputs to when they expire, oldest first
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+    def __len__(self):
+        return len(self.entries)
+    def contains(self, values):
+        """Check if a request with the same inputs missed recently
+
+        Args:
+            values (list): Inputs of request
+
+        Returns:
+            bool: True if the inputs missed less than `lifetime` seconds ago
+        """
+        now = time.monotonic()
+        while len(self.entries) > 0 and next(iter(self.entries.values())) <= now:
+            self.entries.popitem(last=False)
+        if tuple(values) in self.entries:
+            self.hits += 1
+            return True
+        return False
+    def add(self, values):
+        """Record that a request missed
+
+        Args:
+            values (list): Inputs of request
+        """
+        key = tuple(values)
+        # Keep entries in order of expiry
+        self.entries.pop(key, None)
+        self.entries[key] = time.monotonic() + self.lifetime
@@ -43,6 +43,34 @@ class DatabaseMode(IntEnum):
     MYSQL = 1
     HDF5 = 2
 
+class RequestScanMode(IntEnum):
+    PERRANK = 0
+    BATCHED = 1
+
+class IdleStrategy(IntEnum):
+    SPIN = 0
+    BACKOFF = 1
+    DATAVERSION = 2
+    INOTIFY = 3
+
+class ServiceEngine(IntEnum):
+    SYNC = 0
+    ASYNCIO = 1
+
+class StatsMode(IntEnum):
+    NONE = 0
+    FILE = 1
+    SQLITE = 2
+
+class ResultMergeMode(IntEnum):
+    COPY = 0
+    VIEW = 1
+
+class GNDLookupMode(IntEnum):
+    SCAN = 0
+    RTREE = 1
+    MEMORY = 2
+
 # BGKInputs
 #  Temperature: float
 #  Density: float[4]
@@ -23,3 +23,56 @@ def getSQLArrGenString(fName, dType, length):
     for i in range(length):
         retStr += fName + "_" + str(i) + " " + tString + ", "
     return retStr
+
+def getSyncCursorTableString():
+    """Generate SQL string creating the table of sync cursors
+
+    Each row holds the ROWID of the last row of a table in another database
+    that has been copied into this one
+
+    Returns:
+        str: Query string to create the table if it does not exist
+    """
+    return "CREATE TABLE IF NOT EXISTS SYNCCURSORS(SRCURL TEXT NOT NULL, SRCTABLE TEXT NOT NULL, HWM INT NOT NULL, PRIMARY KEY(SRCURL, SRCTABLE));"
+
+def getRTreeIndexStrings(table, columns, negativeSpansAll=False):
+    """Generate SQL strings maintaining an R*Tree index over columns of a table
+
+    Each row gets a point box in the index named `<table>_RTREE`, which triggers
+    keep up to date for every writer of the table. Range queries on the index then
+    find the rows with values in range. Some lookups take negative values to match
+    anything, so the box of a negative value can instead span every value
+
+    Args:
+        table (str): Name of table to index
+        columns (list): Names of columns to index
+        negativeSpansAll (bool, optional): Give negative values a box spanning every value. Defaults to False.
+
+    Raises:
+        Exception: Passed in more columns than an R*Tree supports
+
+    Returns:
+        list: Query strings to create the index and its triggers if they do not exist, and to add rows missing from it
+    """
+    if len(columns) > 5:
+        raise Exception('Requested Too Many R*Tree Dimensions')
+    index = table + "_RTREE"
+    def getBox(value):
+        if negativeSpansAll:
+            # Bounds are stored as 32 bit floats
+            return "CASE WHEN " + value + "<0 THEN -1e38 ELSE " + value + " END, CASE WHEN " + value + "<0 THEN 1e38 ELSE " + value + " END"
+        return value + ", " + value
+    bounds = ", ".join([column + "_LO, " + column + "_HI" for column in columns])
+    newPoints = ", ".join([getBox("NEW." + column) for column in columns])
+    points = ", ".join([getBox(column) for column in columns])
+    idxStrings = ["CREATE VIRTUAL TABLE IF NOT EXISTS " + index + " USING rtree(ID, " + bounds + ");",
+                  # Replaced rather than kept so that the boxes it inserts follow negativeSpansAll
+                  "DROP TRIGGER IF EXISTS " + index + "_INSERT;",
+                  "CREATE TRIGGER " + index + "_INSERT AFTER INSERT ON " + table + " BEGIN INSERT INTO " + index + " VALUES(NEW.ROWID, " + newPoints + "); END;",
+                  "CREATE TRIGGER IF NOT EXISTS " + index + "_DELETE AFTER DELETE ON " + table + " BEGIN DELETE FROM " + index + " WHERE ID=OLD.ROWID; END;",
+                  "INSERT INTO " + index + " SELECT ROWID, " + points + " FROM " + table + " WHERE ROWID>(SELECT IFNULL(MAX(ID), 0) FROM " + index + ");"]
+    if negativeSpansAll:
+        # Indexes built without it hold point boxes for negative values
+        for column in columns:
+            idxStrings.append("UPDATE " + index + " SET " + column + "_LO=-1e38, " + column + "_HI=1e38 WHERE " + column + "_LO<0 AND " + column + "_HI<0;")
+    return idxStrings
@@ -1,6 +1,6 @@
 from glueCodeTypes import SolverCode
 from glueArgParser import processGlueCodeArguments
-from glueSQLHelpers import getSQLArrGenString
+from glueSQLHelpers import getSQLArrGenString, getSyncCursorTableString
 from alDBHandlers import getDBHandle
 
 
@@ -25,6 +25,8 @@ def initSQLTables(configStruct):
     resString = ""
     resFString = ""
     gndString = ""
+    indexStrings = []
+    viewString = None
     if packetType == SolverCode.BGK:
         dropReqString = "DROP TABLE IF EXISTS BGKREQS;"
         dropResString = "DROP TABLE IF EXISTS BGKRESULTS;"
@@ -51,6 +53,12 @@ def initSQLTables(configStruct):
         logString += "INVERSION REAL, VISCOSITY REAL, THERMAL_CONDUCT REAL, "
         logString += getSQLArrGenString("DIFFCOEFF", float, 10)
         logString += "OUTVERSION REAL);"
+        # Lets readers see results that are not merged yet
+        viewString = "CREATE VIEW IF NOT EXISTS BGKALLRESULTS AS SELECT * FROM BGKRESULTS UNION ALL SELECT * FROM BGKFASTRESULTS;"
+        # Requests and results are always looked up by tag, rank and request ID
+        indexStrings = ["CREATE INDEX IF NOT EXISTS BGKREQS_TAG_RANK_REQ ON BGKREQS(TAG, RANK, REQ);",
+                        "CREATE INDEX IF NOT EXISTS BGKRESULTS_TAG_RANK_REQ ON BGKRESULTS(TAG, RANK, REQ);",
+                        "CREATE INDEX IF NOT EXISTS BGKFASTRESULTS_TAG_RANK_REQ ON BGKFASTRESULTS(TAG, RANK, REQ);"]
     else:
         raise Exception('Using Unsupported Solver Code')
 
@@ -60,6 +68,9 @@ def initSQLTables(configStruct):
         db.execute(dropReqString)
         db.execute(dropResString)
         db.execute(dropResFString)
+        db.execute("DROP VIEW IF EXISTS BGKALLRESULTS;")
+        # Cursors into the dropped result tables no longer mean anything
+        db.execute("DROP TABLE IF EXISTS SYNCCURSORS;")
         db.commit()
 
         db.execute(reqString)
@@ -67,6 +78,10 @@ def initSQLTables(configStruct):
         db.execute(gndString)
         db.execute(logString)
         db.execute(resFString)
+        db.execute(getSyncCursorTableString())
+        db.execute(viewString)
+        for indexString in indexStrings:
+            db.execute(indexString)
 
         db.commit()
         db.closeCursor()
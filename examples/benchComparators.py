@@ -0,0 +1,67 @@
+from glueCodeTypes import BGKInputs
+from ICF_Utils import icfComparator, icfBatchComparator
+import sys
+import time
+import numpy as np
+
+def getRandomInputs(rng, numRows):
+    """Draw inputs spread over the ranges simulations ask for, with the last two species left out
+
+    Returns:
+        numpy.ndarray: Temperature, densities, and charges of each row
+    """
+    inputs = np.zeros((numRows, 9))
+    inputs[:, 0] = 10 ** rng.uniform(0, 3, numRows)
+    inputs[:, 1:3] = 10 ** rng.uniform(22, 25, (numRows, 2))
+    inputs[:, 5:7] = [1.0, 2.0]
+    return inputs
+
+def toBGKInputs(row):
+    """Make fine grain simulation arguments of a row of inputs
+    """
+    return BGKInputs(Temperature=row[0], Density=row[1:5].tolist(), Charges=row[5:9].tolist())
+
+def timeScalar(requests, candidates, relError):
+    """Compare every request against every candidate one pair at a time
+
+    Returns:
+        tuple: Seconds taken and number of matching pairs
+    """
+    requestArgs = [toBGKInputs(row) for row in requests]
+    candidateArgs = [toBGKInputs(row) for row in candidates]
+    start = time.perf_counter()
+    numMatches = 0
+    for lhs in requestArgs:
+        for rhs in candidateArgs:
+            numMatches += icfComparator(lhs, rhs, relError)
+    return (time.perf_counter() - start, numMatches)
+
+def timeBatch(requests, candidates, relError):
+    """Compare every request against every candidate at once
+
+    Returns:
+        tuple: Seconds taken and number of matching pairs
+    """
+    start = time.perf_counter()
+    (reqIndices, candIndices) = icfBatchComparator(requests, candidates, relError)
+    return (time.perf_counter() - start, len(reqIndices))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print("benchComparators.py [${Requests}x${Candidates} ...]")
+        exit(1)
+    sizes = [tuple(int(size) for size in arg.split("x")) for arg in sys.argv[1:]] or [(1, 1000), (1, 16384), (100, 1000), (100, 16384), (1000, 16384)]
+    rng = np.random.default_rng(0)
+    relError = 1e-4
+    print("REQUESTS,CANDIDATES,SCALAR_S,BATCH_S,MATCHES")
+    for (numRequests, numCandidates) in sizes:
+        candidates = getRandomInputs(rng, numCandidates)
+        # Half are close to a candidate, half are not
+        requests = getRandomInputs(rng, numRequests)
+        numClose = numRequests // 2
+        requests[:numClose] = candidates[rng.integers(0, numCandidates, numClose)] * (1.0 + rng.uniform(-relError, relError, (numClose, 9)))
+        (scalarTime, scalarMatches) = timeScalar(requests, candidates, relError)
+        (batchTime, batchMatches) = timeBatch(requests, candidates, relError)
+        if scalarMatches != batchMatches:
+            raise Exception('Batched comparator found ' + str(batchMatches) + ' matches instead of ' + str(scalarMatches))
+        print(str(numRequests) + "," + str(numCandidates) + "," + "%.4f" % scalarTime + "," + "%.4f" % batchTime + "," + str(batchMatches))
@@ -0,0 +1,116 @@
+from initTables import initSQLTables
+from glueCodeTypes import SolverCode, DatabaseMode, GNDLookupMode, BGKInputs
+from alDBHandlers import getDBHandle
+from alInterface import createGNDIndex, getGNDStringAndTuple, getGNDCache, updateGNDCache, getGNDFilter, updateGNDFilter
+from glueCaches import getInputValues
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+def getRandomInputs(rng):
+    """Draw inputs spread over the ranges simulations ask for
+    """
+    return BGKInputs(Temperature=10 ** rng.uniform(0, 3), Density=[10 ** rng.uniform(22, 25) for i in range(4)], Charges=[1.0, 2.0, 3.0, 4.0])
+
+def fillGND(dbURL, numRows, rng):
+    """Create tables as the service does and fill the GND table with numRows rows
+
+    Returns:
+        list: Inputs of every row
+    """
+    dbSettings = {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": dbURL}
+    configStruct = {"solverCode": SolverCode.BGK, "DatabaseSettings": {"CoarseGrainDB": dbSettings, "FineGrainDB": dbSettings}}
+    initSQLTables(configStruct)
+    inputs = [getRandomInputs(rng) for i in range(numRows)]
+    dbHandle = sqlite3.connect(dbURL)
+    rows = [(inArgs.Temperature,) + tuple(inArgs.Density) + tuple(inArgs.Charges) + (2.2,) + (1.0,) * 12 + (2.2,) for inArgs in inputs]
+    dbHandle.executemany("INSERT INTO BGKGND VALUES(" + ", ".join(["?"] * 23) + ");", rows)
+    dbHandle.commit()
+    dbHandle.close()
+    createGNDIndex(getDBHandle(dbSettings), SolverCode.BGK)
+    return inputs
+
+def timeMemoryLookups(dbURL, queries):
+    """Time GND lookups in an in-memory copy of the GND table
+
+    Returns:
+        tuple: Mean seconds per lookup, number of lookups that found a row, and seconds to load the table
+    """
+    configStruct = {"ICFParameters": {"RelativeError": 1e-4}, "ServiceSettings": {"GNDLookupMode": GNDLookupMode.MEMORY}}
+    start = time.perf_counter()
+    gndCache = getGNDCache(configStruct)
+    updateGNDCache(gndCache, getDBHandle({"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": dbURL}), SolverCode.BGK)
+    loadTime = time.perf_counter() - start
+    # The first lookup builds the KD-tree
+    gndCache.lookup(getInputValues(queries[0]))
+    numHits = 0
+    start = time.perf_counter()
+    for inArgs in queries:
+        numHits += gndCache.lookup(getInputValues(inArgs)) is not None
+    lookupTime = (time.perf_counter() - start) / len(queries)
+    return (lookupTime, numHits, loadTime)
+
+def timeFilteredLookups(dbURL, queries):
+    """Time GND lookups that first check a Bloom filter of the GND table and then scan it
+
+    Returns:
+        tuple: Mean seconds per lookup, number of lookups that found a row, and seconds to load the filter
+    """
+    configStruct = {"ICFParameters": {"RelativeError": 1e-4}, "ServiceSettings": {"GNDLookupMode": GNDLookupMode.SCAN, "GNDBloomFilter": True, "GNDFilterFalsePositiveRate": 0.01}}
+    gndFilter = getGNDFilter(configStruct)
+    # The service builds the filter once it has seen requests with these nonzero inputs
+    gndFilter.mayMatch(getInputValues(queries[0]))
+    start = time.perf_counter()
+    updateGNDFilter(gndFilter, getDBHandle({"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": dbURL}), SolverCode.BGK)
+    loadTime = time.perf_counter() - start
+    dbHandle = sqlite3.connect(dbURL)
+    numHits = 0
+    start = time.perf_counter()
+    for inArgs in queries:
+        if gndFilter.mayMatch(getInputValues(inArgs)):
+            (selString, selTup) = getGNDStringAndTuple(inArgs, configStruct)
+            numHits += len(dbHandle.execute(selString, selTup).fetchall()) > 0
+    lookupTime = (time.perf_counter() - start) / len(queries)
+    dbHandle.close()
+    return (lookupTime, numHits, loadTime)
+
+def timeLookups(dbURL, queries, lookupMode):
+    """Time GND lookups as done by the service on a cache miss
+
+    Returns:
+        tuple: Mean seconds per lookup and number of lookups that found a row
+    """
+    configStruct = {"ICFParameters": {"RelativeError": 1e-4}, "ServiceSettings": {"GNDLookupMode": lookupMode}}
+    dbHandle = sqlite3.connect(dbURL)
+    numHits = 0
+    start = time.perf_counter()
+    for inArgs in queries:
+        (selString, selTup) = getGNDStringAndTuple(inArgs, configStruct)
+        numHits += len(dbHandle.execute(selString, selTup).fetchall()) > 0
+    lookupTime = (time.perf_counter() - start) / len(queries)
+    dbHandle.close()
+    return (lookupTime, numHits)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print("benchGNDLookups.py [${Rows} ...]")
+        exit(1)
+    tableSizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000, 300000]
+    rng = random.Random(0)
+    print("ROWS,MODE,LOOKUP_US,HITS,LOAD_S")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for numRows in tableSizes:
+            dbURL = os.path.join(tmpDir, "bench" + str(numRows) + ".db")
+            inputs = fillGND(dbURL, numRows, rng)
+            # Half hit rows that are there, half miss
+            queries = rng.sample(inputs, 100) + [getRandomInputs(rng) for i in range(100)]
+            for lookupMode in [GNDLookupMode.SCAN, GNDLookupMode.RTREE]:
+                (lookupTime, numHits) = timeLookups(dbURL, queries, lookupMode)
+                print(str(numRows) + "," + lookupMode.name + "," + "%.1f" % (lookupTime * 1e6) + "," + str(numHits) + ",")
+            (lookupTime, numHits, loadTime) = timeMemoryLookups(dbURL, queries)
+            print(str(numRows) + ",MEMORY," + "%.1f" % (lookupTime * 1e6) + "," + str(numHits) + "," + "%.2f" % loadTime)
+            (lookupTime, numHits, loadTime) = timeFilteredLookups(dbURL, queries)
+            print(str(numRows) + ",SCAN+FILTER," + "%.1f" % (lookupTime * 1e6) + "," + str(numHits) + "," + "%.2f" % loadTime)
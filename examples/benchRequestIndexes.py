@@ -0,0 +1,64 @@
+from initTables import initSQLTables
+from glueCodeTypes import SolverCode, DatabaseMode
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+def fillTables(dbURL, numRows, numRanks):
+    """Create tables as the service does and fill requests and results with numRows rows each
+    """
+    dbSettings = {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": dbURL}
+    configStruct = {"solverCode": SolverCode.BGK, "DatabaseSettings": {"CoarseGrainDB": dbSettings, "FineGrainDB": dbSettings}}
+    initSQLTables(configStruct)
+    dbHandle = sqlite3.connect(dbURL)
+    reqsPerRank = numRows // numRanks
+    reqRows = [("TAG", rank, req, 100.0, 1.0, 1.0, 0.0, 0.0, 1.0, 2.0, 0.0, 0.0, 4) for rank in range(numRanks) for req in range(reqsPerRank)]
+    dbHandle.executemany("INSERT INTO BGKREQS VALUES(" + ", ".join(["?"] * 13) + ");", reqRows)
+    resRows = [("TAG", rank, req) + (1.0,) * 12 + (1,) for rank in range(numRanks) for req in range(reqsPerRank)]
+    dbHandle.executemany("INSERT INTO BGKRESULTS VALUES(" + ", ".join(["?"] * 16) + ");", resRows)
+    dbHandle.commit()
+    return (dbHandle, reqsPerRank)
+
+def timeLookups(dbHandle, numRanks, reqsPerRank, numLookups):
+    """Time the service's scan for new requests and the library's lookup of a result
+
+    Returns:
+        tuple: Mean seconds per request scan and per result lookup
+    """
+    rng = random.Random(0)
+    lookups = [(rng.randrange(numRanks), rng.randrange(reqsPerRank)) for i in range(numLookups)]
+    start = time.perf_counter()
+    for (rank, req) in lookups:
+        # As getSelString with the last few requests being new
+        dbHandle.execute("SELECT * FROM BGKREQS WHERE RANK=? AND REQ>? AND TAG=?;", (rank, reqsPerRank - 4, "TAG")).fetchall()
+    scanTime = (time.perf_counter() - start) / numLookups
+    start = time.perf_counter()
+    for (rank, req) in lookups:
+        # As getResultSQLString in the C++ library
+        dbHandle.execute("SELECT * FROM BGKRESULTS WHERE REQ=? AND TAG=? AND RANK=?;", (req, "TAG", rank)).fetchall()
+    lookupTime = (time.perf_counter() - start) / numLookups
+    return (scanTime, lookupTime)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print("benchRequestIndexes.py [${Rows} ...]")
+        exit(1)
+    tableSizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000, 1000000]
+    numRanks = 64
+    print("ROWS,INDEXED,SCAN_US,LOOKUP_US")
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for numRows in tableSizes:
+            dbURL = os.path.join(tmpDir, "bench" + str(numRows) + ".db")
+            (dbHandle, reqsPerRank) = fillTables(dbURL, numRows, numRanks)
+            # Fewer lookups on big unindexed tables as each is a full table scan
+            numLookups = max(20, min(2000, 20000000 // numRows))
+            (scanTime, lookupTime) = timeLookups(dbHandle, numRanks, reqsPerRank, numLookups)
+            print(str(numRows) + ",1," + "%.1f" % (scanTime * 1e6) + "," + "%.1f" % (lookupTime * 1e6))
+            for table in ["BGKREQS", "BGKRESULTS", "BGKFASTRESULTS"]:
+                dbHandle.execute("DROP INDEX " + table + "_TAG_RANK_REQ;")
+            (scanTime, lookupTime) = timeLookups(dbHandle, numRanks, reqsPerRank, numLookups)
+            print(str(numRows) + ",0," + "%.1f" % (scanTime * 1e6) + "," + "%.1f" % (lookupTime * 1e6))
+            dbHandle.close()
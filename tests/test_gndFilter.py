@@ -0,0 +1,121 @@
+import numpy as np
+import glueCaches
+from glueCaches import GNDFilter, MissCache
+
+relError = 1e-3
+
+def getRandomRows(rng, numRows):
+    # Temperature, two densities, and two charges as in BGK GND entries
+    rows = np.zeros((numRows, 9))
+    rows[:, 0] = 10 ** rng.uniform(0, 3, numRows)
+    rows[:, 1:3] = 10 ** rng.uniform(22, 25, (numRows, 2))
+    rows[:, 5:7] = [1.0, 2.0]
+    return rows
+
+def sqlMatches(values, rows):
+    """Same predicate as the SQL lookup, where negative GND inputs always pass and zero ones never do"""
+    match = np.ones(len(rows), dtype=bool)
+    for (i, value) in enumerate(values):
+        if value != 0.0:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                match &= (rows[:, i] < 0.0) | ((rows[:, i] > 0.0) & (np.abs(value - rows[:, i]) / rows[:, i] < relError))
+    return np.any(match)
+
+def getRequests(rng, rows, numRequests):
+    # Half just inside or outside the matching range of a row, on either side, half anywhere
+    numClose = numRequests // 2
+    picked = rows[rng.integers(0, len(rows), numClose)]
+    requests = picked + picked * rng.choice([-1.0, 1.0], (numClose, 9)) * relError * rng.uniform(0.9, 1.1, (numClose, 9))
+    return np.concatenate([requests, getRandomRows(rng, numRequests - numClose)])
+
+def fillFilter(gndFilter, requests, rows):
+    # Requests are let through until the filter for their nonzero inputs is built
+    for values in requests:
+        assert gndFilter.mayMatch(list(values))
+    assert gndFilter.needsRebuild()
+    gndFilter.rebuild(len(rows), rows)
+    assert not gndFilter.needsRebuild()
+
+def test_noFalseNegatives():
+    rng = np.random.default_rng(0)
+    rows = getRandomRows(rng, 2000)
+    requests = getRequests(rng, rows, 2000)
+    gndFilter = GNDFilter(relError)
+    fillFilter(gndFilter, requests[:1], rows)
+    isMatch = np.array([sqlMatches(values, rows) for values in requests])
+    mayMatch = np.array([gndFilter.mayMatch(list(values)) for values in requests])
+    assert np.all(mayMatch[isMatch])
+    assert 0 < np.sum(isMatch) < len(requests)
+    # Requests far from every row are nearly all skipped, unlike those just outside the range of one
+    assert np.sum(mayMatch[1000:] & ~isMatch[1000:]) < 0.05 * np.sum(~isMatch[1000:])
+
+def test_addedRowsAreFound():
+    rng = np.random.default_rng(1)
+    rows = getRandomRows(rng, 1000)
+    gndFilter = GNDFilter(relError)
+    fillFilter(gndFilter, rows[:1], rows[:500])
+    gndFilter.add(1000, rows[500:])
+    assert gndFilter.getCounts()[0] == 1000
+    for values in getRequests(rng, rows[500:], 500):
+        assert gndFilter.mayMatch(list(values)) or not sqlMatches(values, rows)
+
+def test_rebuildsWhenRowsOutgrowFilter():
+    rng = np.random.default_rng(2)
+    rows = getRandomRows(rng, 300)
+    gndFilter = GNDFilter(relError, minCapacity=100)
+    fillFilter(gndFilter, rows[:1], rows[:100])
+    gndFilter.add(300, rows[100:])
+    assert gndFilter.needsRebuild()
+    gndFilter.rebuild(300, rows)
+    assert gndFilter.capacity >= 300
+    for values in getRequests(rng, rows, 300):
+        assert gndFilter.mayMatch(list(values)) or not sqlMatches(values, rows)
+
+def test_negativeAndZeroInputs():
+    rng = np.random.default_rng(3)
+    rows = getRandomRows(rng, 100)
+    request = list(getRandomRows(rng, 1)[0] * 3.0)
+    # A zero density is not constrained, so it gets its own filter
+    zeroRequest = list(request)
+    zeroRequest[2] = 0.0
+    gndFilter = GNDFilter(relError)
+    fillFilter(gndFilter, [request, zeroRequest], rows)
+    assert not gndFilter.mayMatch(request) and not gndFilter.mayMatch(zeroRequest)
+    # Negative GND inputs pass the predicate for any request
+    negative = np.array([request])
+    negative[0, 0] = -1.0
+    gndFilter.add(101, negative)
+    assert gndFilter.mayMatch(request) and sqlMatches(request, np.concatenate([rows, negative]))
+
+def test_missCacheExpires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(glueCaches.time, "monotonic", lambda: now[0])
+    missCache = MissCache(5.0)
+    missCache.add([1.0, 2.0])
+    now[0] = 103.0
+    missCache.add([3.0, 4.0])
+    assert missCache.contains([1.0, 2.0]) and missCache.contains([3.0, 4.0])
+    assert not missCache.contains([1.0, 2.5])
+    now[0] = 105.0
+    assert not missCache.contains([1.0, 2.0])
+    assert missCache.contains([3.0, 4.0])
+    assert len(missCache) == 1
+    now[0] = 108.0
+    assert not missCache.contains([3.0, 4.0])
+    assert len(missCache) == 0
+    assert missCache.hits == 3
+
+def test_missCacheReAddExtendsLifetime(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(glueCaches.time, "monotonic", lambda: now[0])
+    missCache = MissCache(5.0)
+    missCache.add([1.0])
+    missCache.add([2.0])
+    now[0] = 4.0
+    missCache.add([1.0])
+    now[0] = 6.0
+    # The entry added again is now the last to expire, and expiring the other does not drop it
+    assert not missCache.contains([2.0])
+    assert missCache.contains([1.0])
+    now[0] = 9.0
+    assert not missCache.contains([1.0])
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from glueCodeTypes import BGKInputs, SolverCode, DatabaseMode, GNDLookupMode
+from alDBHandlers import getDBHandle
+from initTables import initSQLTables
+from glueSQLHelpers import getRTreeIndexStrings
+from alInterface import createGNDIndex, getGNDStringAndTuple, getGroundishTruthVersion, bgkGNDIndexColumns
+
+relError = 1e-2
+
+@pytest.fixture
+def fgDB(tmp_path):
+    dbSettings = {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": str(tmp_path / "fg.db")}
+    initSQLTables({"solverCode": SolverCode.BGK, "DatabaseSettings": {"CoarseGrainDB": dbSettings, "FineGrainDB": dbSettings}})
+    dbHandle = getDBHandle(dbSettings)
+    yield dbHandle
+    dbHandle.closeDB()
+
+def getRequests(rng, numRequests):
+    requests = []
+    for i in range(numRequests):
+        density = list(10 ** rng.uniform(22, 23, 2)) + [0.0, 0.0]
+        if i % 4 == 0:
+            # Unconstrained density
+            density[1] = 0.0
+        requests.append(BGKInputs(Temperature=10 ** rng.uniform(1, 2), Density=density, Charges=[1.0, 2.0, 0.0, 0.0]))
+    return requests
+
+def fillGND(fgDB, rng, requests):
+    """Rows near requests with some inputs replaced by negative or zero values, and of other versions"""
+    version = getGroundishTruthVersion(SolverCode.BGK)
+    rows = []
+    for i in range(2000):
+        request = requests[rng.integers(0, len(requests))]
+        inputs = np.array([request.Temperature] + request.Density + request.Charges)
+        inputs[:5] *= 1.0 + rng.uniform(-2.0 * relError, 2.0 * relError, 5)
+        replaced = rng.random(9) < 0.1
+        inputs[replaced] = rng.choice([-1.0, 0.0, -1e24], np.sum(replaced))
+        inVersion = version if rng.random() < 0.95 else version - 1
+        rows.append(tuple(inputs) + (inVersion,) + tuple(rng.random(12)) + (version,))
+    fgDB.openCursor()
+    fgDB.executemany("INSERT INTO BGKGND VALUES(" + ", ".join(["?"] * 23) + ");", rows)
+    fgDB.commit()
+    fgDB.closeCursor()
+
+def lookup(fgDB, request, lookupMode):
+    configStruct = {"ICFParameters": {"RelativeError": relError}, "ServiceSettings": {"GNDLookupMode": lookupMode}}
+    (selString, selTup) = getGNDStringAndTuple(request, configStruct)
+    fgDB.openCursor()
+    rows = fgDB.execute(selString, selTup).fetchall()
+    fgDB.closeCursor()
+    return rows
+
+def checkSameAsScan(fgDB, requests):
+    numMatches = 0
+    for request in requests:
+        scanRows = lookup(fgDB, request, GNDLookupMode.SCAN)
+        assert lookup(fgDB, request, GNDLookupMode.RTREE) == scanRows
+        numMatches += len(scanRows)
+    return numMatches
+
+def countNegativeMatches(fgDB, requests):
+    numMatches = 0
+    for request in requests:
+        for row in lookup(fgDB, request, GNDLookupMode.SCAN):
+            numMatches += any(value < 0.0 for value in row[:9])
+    return numMatches
+
+def test_rtreeMatchesScan(fgDB):
+    rng = np.random.default_rng(0)
+    requests = getRequests(rng, 200)
+    # Rows written before the index exists and after, through its triggers
+    fillGND(fgDB, rng, requests)
+    createGNDIndex(fgDB, SolverCode.BGK)
+    fillGND(fgDB, rng, requests)
+    assert checkSameAsScan(fgDB, requests) > 0
+    assert countNegativeMatches(fgDB, requests) > 0
+
+def test_rtreeIndexFromBeforeNegativeBoxes(fgDB):
+    rng = np.random.default_rng(1)
+    requests = getRequests(rng, 100)
+    fillGND(fgDB, rng, requests)
+    # Index and triggers as created before negative inputs spanned every value
+    fgDB.openCursor()
+    for idxString in getRTreeIndexStrings("BGKGND", bgkGNDIndexColumns):
+        fgDB.execute(idxString)
+    fgDB.commit()
+    fgDB.closeCursor()
+    createGNDIndex(fgDB, SolverCode.BGK)
+    fillGND(fgDB, rng, requests)
+    assert checkSameAsScan(fgDB, requests) > 0
+    assert countNegativeMatches(fgDB, requests) > 0
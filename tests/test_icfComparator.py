@@ -0,0 +1,50 @@
+import numpy as np
+from glueCodeTypes import BGKInputs
+from ICF_Utils import icfComparator, icfBatchComparator
+
+def toBGKInputs(row):
+    return BGKInputs(Temperature=row[0], Density=list(row[1:5]), Charges=list(row[5:9]))
+
+def getScalarMatches(lhs, rhs, epsilon):
+    lhsArgs = [toBGKInputs(row) for row in lhs]
+    rhsArgs = [toBGKInputs(row) for row in rhs]
+    matches = [(i, j) for (i, lhsArg) in enumerate(lhsArgs) for (j, rhsArg) in enumerate(rhsArgs) if icfComparator(lhsArg, rhsArg, epsilon)]
+    return ([i for (i, j) in matches], [j for (i, j) in matches])
+
+def getRandomInputs(rng, numRows):
+    # Two of four species present and some candidates near each other, as well as zeros and negative inputs
+    inputs = np.zeros((numRows, 9))
+    inputs[:, 0] = 10 ** rng.uniform(0, 3, numRows)
+    inputs[:, 1:3] = 10 ** rng.uniform(22, 25, (numRows, 2))
+    inputs[:, 5:7] = [1.0, 2.0]
+    inputs[rng.random(numRows) < 0.1, 2] = 0.0
+    inputs[rng.random(numRows) < 0.05, 0] *= -1.0
+    return inputs
+
+def test_batchMatchesScalar():
+    rng = np.random.default_rng(0)
+    epsilon = 1e-2
+    for (numRequests, numCandidates) in [(1, 1), (1, 200), (50, 200), (200, 50)]:
+        candidates = getRandomInputs(rng, numCandidates)
+        requests = getRandomInputs(rng, numRequests)
+        # Half of the requests are close to a candidate, on either side of it
+        numClose = numRequests // 2
+        requests[:numClose] = candidates[rng.integers(0, numCandidates, numClose)] * (1.0 + rng.uniform(-2 * epsilon, 2 * epsilon, (numClose, 9)))
+        (reqIndices, candIndices) = icfBatchComparator(requests, candidates, epsilon)
+        assert (list(reqIndices), list(candIndices)) == getScalarMatches(requests, candidates, epsilon)
+
+def test_chunkingDoesNotChangeMatches():
+    rng = np.random.default_rng(1)
+    candidates = getRandomInputs(rng, 100)
+    requests = candidates[rng.integers(0, 100, 300)] * (1.0 + rng.uniform(-0.02, 0.02, (300, 9)))
+    (reqIndices, candIndices) = icfBatchComparator(requests, candidates, 1e-2)
+    for chunkElements in (1, 900, 10000):
+        (chunkedReqs, chunkedCands) = icfBatchComparator(requests, candidates, 1e-2, chunkElements)
+        assert np.array_equal(chunkedReqs, reqIndices) and np.array_equal(chunkedCands, candIndices)
+
+def test_singleRequestAndEmptyInputs():
+    inputs = np.array([100.0, 1e24, 2e24, 0.0, 0.0, 1.0, 2.0, 0.0, 0.0])
+    (reqIndices, candIndices) = icfBatchComparator(inputs, inputs, 1e-3)
+    assert list(reqIndices) == [0] and list(candIndices) == [0]
+    (reqIndices, candIndices) = icfBatchComparator(np.empty((0, 9)), inputs, 1e-3)
+    assert len(reqIndices) == 0 and len(candIndices) == 0
@@ -0,0 +1,113 @@
+import pytest
+from glueCodeTypes import ALInterfaceMode, BGKInputs, BGKOutputs, SolverCode, DatabaseMode, ResultProvenance
+from glueCaches import InFlightTable
+from alDBHandlers import getDBHandle
+from initTables import initSQLTables
+from alInterface import addInFlightFGSJob, fanOutFinishedFGSJobs, insertResultSlow, requeueExpiredFGSJobs
+
+relError = 1e-3
+
+def makeInputs(temperature, scale=1.0):
+    return BGKInputs(Temperature=temperature, Density=[1e24 * scale, 2e24 * scale, 0.0, 0.0], Charges=[1.0, 2.0, 0.0, 0.0])
+
+def makeResult(viscosity):
+    return BGKOutputs(Viscosity=viscosity, ThermalConductivity=2.0, DiffCoeff=[3.0] * 10)
+
+def test_attachToMatchingJob():
+    inFlight = InFlightTable(relError)
+    inFlight.add(makeInputs(100.0), ALInterfaceMode.FGS, 0, 1)
+    assert inFlight.attach(makeInputs(100.0 * (1.0 + 0.5 * relError)), ALInterfaceMode.FGS, 1, 2)
+    assert not inFlight.attach(makeInputs(100.0 * (1.0 + 10.0 * relError)), ALInterfaceMode.FGS, 1, 3)
+    assert not inFlight.attach(makeInputs(100.0), ALInterfaceMode.FASTFGS, 1, 4)
+    assert inFlight.complete(0, 1) == [(1, 2)]
+    assert len(inFlight) == 0
+    assert inFlight.complete(0, 1) is None
+
+def test_attachAcrossBucketEdge():
+    inFlight = InFlightTable(relError)
+    # Walk a job across a bucket edge and check that a request just below it still matches
+    for step in range(64):
+        temperature = 100.0 * (1.0 + step * relError)
+        inFlight.add(makeInputs(temperature), ALInterfaceMode.FGS, 0, step)
+        assert inFlight.attach(makeInputs(temperature * (1.0 - 0.9 * relError)), ALInterfaceMode.FGS, 1, step)
+        assert inFlight.complete(0, step) == [(1, step)]
+
+def test_expire():
+    inFlight = InFlightTable(relError, timeout=10.0)
+    inFlight.add(makeInputs(100.0), ALInterfaceMode.FGS, 0, 1)
+    inFlight.attach(makeInputs(100.0), ALInterfaceMode.FGS, 1, 2)
+    launchTime = inFlight.leaders[(0, 1)][1][3]
+    assert inFlight.expire(launchTime + 5.0) == []
+    assert inFlight.expire(launchTime + 10.0) == [(makeInputs(100.0), ALInterfaceMode.FGS, [(0, 1), (1, 2)])]
+    assert len(inFlight) == 0
+    assert not inFlight.attach(makeInputs(100.0), ALInterfaceMode.FGS, 1, 3)
+
+def test_neverExpireWithoutTimeout():
+    inFlight = InFlightTable(relError)
+    inFlight.add(makeInputs(100.0), ALInterfaceMode.FGS, 0, 1)
+    assert inFlight.expire(inFlight.leaders[(0, 1)][1][3] + 1e9) == []
+
+def test_requeueExpiredFGSJobs():
+    inFlight = InFlightTable(relError, timeout=1e-9)
+    inFlight.add(makeInputs(100.0), ALInterfaceMode.FASTFGS, 0, 1)
+    inFlight.attach(makeInputs(100.0), ALInterfaceMode.FASTFGS, 1, 2)
+    taskQueue = []
+    requeueExpiredFGSJobs(inFlight, taskQueue)
+    assert taskQueue == [(0, 1, ALInterfaceMode.FASTFGS, makeInputs(100.0)), (1, 2, ALInterfaceMode.FASTFGS, makeInputs(100.0))]
+
+@pytest.fixture
+def glueDBs(tmp_path):
+    configStruct = {
+        "solverCode": SolverCode.BGK,
+        "tag": "TEST",
+        "DatabaseSettings": {
+            "CoarseGrainDB": {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": str(tmp_path / "cg.db")},
+            "FineGrainDB": {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": str(tmp_path / "fg.db")},
+        },
+    }
+    initSQLTables(configStruct)
+    cgDB = getDBHandle(configStruct["DatabaseSettings"]["CoarseGrainDB"], True)
+    fgDB = getDBHandle(configStruct["DatabaseSettings"]["FineGrainDB"])
+    yield (configStruct, cgDB, fgDB)
+    cgDB.closeDB()
+    fgDB.closeDB()
+
+def writeFGSResult(fgDB, rank, reqID, result):
+    insertResultSlow(rank, "TEST", reqID, result, ResultProvenance.FGS, fgDB)
+    fgDB.flushInserts(True)
+
+def getFastResults(cgDB):
+    cgDB.flushInserts(True)
+    cgDB.openCursor()
+    rows = cgDB.execute("SELECT RANK, REQ, VISCOSITY FROM BGKFASTRESULTS ORDER BY RANK, REQ;").fetchall()
+    cgDB.closeCursor()
+    return rows
+
+def test_fanOutResultWrittenAfterAdd(glueDBs):
+    (configStruct, cgDB, fgDB) = glueDBs
+    # Results older than the first job are skipped
+    writeFGSResult(fgDB, 5, 5, makeResult(5.0))
+    inFlight = InFlightTable(relError)
+    addInFlightFGSJob(configStruct, inFlight, fgDB, makeInputs(100.0), ALInterfaceMode.FGS, 0, 1)
+    assert inFlight.attach(makeInputs(100.0), ALInterfaceMode.FGS, 1, 2)
+    # A blocking launch writes the leader's result before returning, after the job was added
+    writeFGSResult(fgDB, 0, 1, makeResult(7.0))
+    fanOutFinishedFGSJobs(configStruct, inFlight, fgDB, cgDB)
+    assert len(inFlight) == 0
+    assert getFastResults(cgDB) == [(1, 2, 7.0)]
+
+def test_fanOutKeepsHWMWhileJobsRun(glueDBs):
+    (configStruct, cgDB, fgDB) = glueDBs
+    inFlight = InFlightTable(relError)
+    addInFlightFGSJob(configStruct, inFlight, fgDB, makeInputs(100.0), ALInterfaceMode.FGS, 0, 1)
+    inFlight.attach(makeInputs(100.0), ALInterfaceMode.FGS, 1, 2)
+    writeFGSResult(fgDB, 0, 3, makeResult(3.0))
+    fanOutFinishedFGSJobs(configStruct, inFlight, fgDB, cgDB)
+    # A job added while others run must not move the mark past results they wait on
+    addInFlightFGSJob(configStruct, inFlight, fgDB, makeInputs(200.0), ALInterfaceMode.FGS, 0, 4)
+    inFlight.attach(makeInputs(200.0), ALInterfaceMode.FGS, 1, 5)
+    writeFGSResult(fgDB, 0, 4, makeResult(4.0))
+    writeFGSResult(fgDB, 0, 1, makeResult(1.0))
+    fanOutFinishedFGSJobs(configStruct, inFlight, fgDB, cgDB)
+    assert len(inFlight) == 0
+    assert getFastResults(cgDB) == [(1, 2, 1.0), (1, 5, 4.0)]
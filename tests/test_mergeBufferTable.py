@@ -0,0 +1,68 @@
+import sqlite3
+import pytest
+from glueCodeTypes import SolverCode, DatabaseMode, ResultProvenance
+from alDBHandlers import getDBHandle
+from initTables import initSQLTables
+from alInterface import mergeBufferTable
+
+def makeRow(rank, reqID):
+    return ("TAG", rank, reqID, reqID + 0.5, 2.0) + tuple(float(reqID * 10 + i) for i in range(10)) + (int(ResultProvenance.FGS),)
+
+@pytest.fixture
+def cgDB(tmp_path):
+    dbSettings = {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": str(tmp_path / "cg.db")}
+    initSQLTables({"solverCode": SolverCode.BGK, "DatabaseSettings": {"CoarseGrainDB": dbSettings, "FineGrainDB": dbSettings}})
+    dbHandle = getDBHandle(dbSettings, True)
+    yield dbHandle
+    dbHandle.closeDB()
+
+def insertRows(dbURL, table, rows):
+    connection = sqlite3.connect(dbURL)
+    connection.executemany("INSERT INTO " + table + " VALUES(" + ", ".join(["?"] * 16) + ");", rows)
+    connection.commit()
+    connection.close()
+
+def getRows(dbURL, table):
+    connection = sqlite3.connect(dbURL)
+    rows = connection.execute("SELECT * FROM " + table + " ORDER BY ROWID;").fetchall()
+    connection.close()
+    return rows
+
+def test_movesRowsInOrder(cgDB):
+    merged = [makeRow(0, reqID) for reqID in range(3)]
+    insertRows(cgDB.dbURL, "BGKRESULTS", merged)
+    fast = [makeRow(rank, reqID) for reqID in range(3, 6) for rank in (1, 0)]
+    insertRows(cgDB.dbURL, "BGKFASTRESULTS", fast[:4])
+    # Rows still buffered by the handle are flushed and moved too
+    for row in fast[4:]:
+        cgDB.bufferInsert("BGKFASTRESULTS", row)
+    mergeBufferTable(SolverCode.BGK, cgDB)
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == merged + fast
+    assert getRows(cgDB.dbURL, "BGKFASTRESULTS") == []
+    # Nothing pending leaves both tables alone
+    mergeBufferTable(SolverCode.BGK, cgDB)
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == merged + fast
+
+def test_leavesRowsPastTopForNextMerge(cgDB, monkeypatch):
+    # Lets another connection commit while the merge reads
+    connection = sqlite3.connect(cgDB.dbURL)
+    connection.execute("PRAGMA journal_mode=WAL;")
+    connection.close()
+    first = [makeRow(0, reqID) for reqID in range(4)]
+    late = [makeRow(1, reqID) for reqID in range(2)]
+    insertRows(cgDB.dbURL, "BGKFASTRESULTS", first)
+    realExecute = cgDB.execute
+    def execute(query, args=None):
+        result = realExecute(query, args)
+        if query.startswith("SELECT MAX(ROWID)"):
+            # Another writer adds rows once the merge knows how far to go
+            insertRows(cgDB.dbURL, "BGKFASTRESULTS", late)
+        return result
+    monkeypatch.setattr(cgDB, "execute", execute)
+    mergeBufferTable(SolverCode.BGK, cgDB)
+    monkeypatch.setattr(cgDB, "execute", realExecute)
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == first
+    assert getRows(cgDB.dbURL, "BGKFASTRESULTS") == late
+    mergeBufferTable(SolverCode.BGK, cgDB)
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == first + late
+    assert getRows(cgDB.dbURL, "BGKFASTRESULTS") == []
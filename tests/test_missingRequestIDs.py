@@ -0,0 +1,80 @@
+import random
+import pytest
+from glueCodeTypes import SolverCode
+from alInterface import MissingRequestIDs, getSelString
+
+def test_addMergesAdjacentRanges():
+    missing = MissingRequestIDs()
+    missing.addRange(3, 5)
+    missing.addRange(6, 8)
+    missing.addRange(10, 10)
+    assert missing.intervals() == [(3, 8), (10, 10)]
+    assert len(missing) == 7
+    assert 8 in missing and 9 not in missing and 10 in missing
+
+def test_addIgnoresEmptyRange():
+    missing = MissingRequestIDs([(1, 2)])
+    missing.addRange(5, 4)
+    assert missing.intervals() == [(1, 2)]
+    assert len(missing) == 2
+
+def test_addOutOfOrder():
+    missing = MissingRequestIDs([(4, 6)])
+    with pytest.raises(Exception):
+        missing.addRange(6, 9)
+    with pytest.raises(Exception):
+        missing.addRange(0, 1)
+
+def test_removeSplitsAndShrinks():
+    missing = MissingRequestIDs([(0, 9)])
+    missing.remove(4)
+    assert missing.intervals() == [(0, 3), (5, 9)]
+    missing.remove(0)
+    missing.remove(9)
+    assert missing.intervals() == [(1, 3), (5, 8)]
+    missing.remove(2)
+    missing.remove(1)
+    missing.remove(3)
+    assert missing.intervals() == [(5, 8)]
+    assert len(missing) == 4
+
+def test_removeNotMissing():
+    missing = MissingRequestIDs([(2, 3)])
+    for reqID in (1, 4):
+        with pytest.raises(Exception):
+            missing.remove(reqID)
+    missing.remove(2)
+    with pytest.raises(Exception):
+        missing.remove(2)
+
+def test_matchesSet():
+    rng = random.Random(0)
+    missing = MissingRequestIDs()
+    expected = set()
+    nextID = 0
+    for step in range(2000):
+        if expected and rng.random() < 0.6:
+            reqID = rng.choice(sorted(expected))
+            missing.remove(reqID)
+            expected.discard(reqID)
+        else:
+            lo = nextID + rng.randint(0, 3)
+            hi = lo + rng.randint(0, 5)
+            missing.addRange(lo, hi)
+            expected.update(range(lo, hi + 1))
+            nextID = hi + 1
+        assert len(missing) == len(expected)
+        intervals = missing.intervals()
+        assert set(reqID for (lo, hi) in intervals for reqID in range(lo, hi + 1)) == expected
+        # Sorted, disjoint, and merged wherever they touch
+        for ((lo, hi), (nextLo, nextHi)) in zip(intervals, intervals[1:]):
+            assert lo <= hi < nextLo - 1
+    for reqID in range(nextID + 2):
+        assert (reqID in missing) == (reqID in expected)
+
+def test_selStringListsIntervals():
+    missing = MissingRequestIDs([(1, 2), (5, 5)])
+    selString = getSelString(SolverCode.BGK, 7, missing)
+    assert "REQ BETWEEN 1 AND 2 OR REQ BETWEEN 5 AND 5 OR REQ>7" in selString
+    selString = getSelString(SolverCode.BGK, 7, missing, maxRanges=1)
+    assert "REQ BETWEEN 1 AND 2 OR REQ>=5" in selString
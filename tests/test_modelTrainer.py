@@ -0,0 +1,22 @@
+import sys
+import alInterface
+from glueCodeTypes import SolverCode, LearnerBackend, DatabaseMode
+from alTrainers import ModelTrainer
+
+def test_retrainsLogSeparately(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    def fakeGetInterpModel(packetType, alBackend, dbHandle):
+        fakeGetInterpModel.calls += 1
+        print("training " + str(fakeGetInterpModel.calls))
+        print("warning " + str(fakeGetInterpModel.calls), file=sys.stderr)
+        return fakeGetInterpModel.calls
+    fakeGetInterpModel.calls = 0
+    monkeypatch.setattr(alInterface, "getInterpModel", fakeGetInterpModel)
+    trainer = ModelTrainer(SolverCode.BGK, LearnerBackend.FAKE, {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": str(tmp_path / "fg.db")}, 0)
+    assert trainer.submit(10)
+    assert trainer.poll() == 1
+    assert trainer.submit(20)
+    assert trainer.poll() == 2
+    for retrain in (0, 1):
+        assert (tmp_path / ("alLog." + str(retrain) + ".out")).read_text() == "training " + str(retrain + 1) + "\n"
+        assert (tmp_path / ("alLog." + str(retrain) + ".err")).read_text() == "warning " + str(retrain + 1) + "\n"
@@ -0,0 +1,72 @@
+import random
+from glueCodeTypes import BGKInputs
+from glueCaches import ResultCache
+
+relError = 1e-3
+
+def makeInputs(temperature, density=1e24):
+    return BGKInputs(Temperature=temperature, Density=[density, 2e24, 0.0, 0.0], Charges=[1.0, 2.0, 0.0, 0.0])
+
+def test_evictsLeastRecentlyUsed():
+    cache = ResultCache(relError, 3)
+    for temperature in (10.0, 20.0, 30.0):
+        cache.add(makeInputs(temperature), temperature)
+    # Looking an entry up makes it the most recently used
+    assert cache.lookup(makeInputs(10.0)) == 10.0
+    cache.add(makeInputs(40.0), 40.0)
+    assert len(cache) == 3
+    assert cache.lookup(makeInputs(20.0)) is None
+    assert [result for (inArgs, result) in cache.items()] == [30.0, 10.0, 40.0]
+    assert cache.getCounts() == (3, 1, 1, 1)
+
+def test_staysBoundedAndReusesSlots():
+    cache = ResultCache(relError, 16)
+    for i in range(1000):
+        cache.add(makeInputs(10.0 * 1.01 ** i), i)
+        assert len(cache) == min(i + 1, 16)
+    assert len(cache.freeSlots) == 0
+    assert sorted(result for (inArgs, result) in cache.items()) == list(range(984, 1000))
+    for i in range(984, 1000):
+        assert cache.lookup(makeInputs(10.0 * 1.01 ** i)) == i
+    assert cache.lookup(makeInputs(10.0)) is None
+
+def test_disabled():
+    cache = ResultCache(relError, 0)
+    cache.add(makeInputs(10.0), 10.0)
+    assert len(cache) == 0
+    assert cache.lookup(makeInputs(10.0)) is None
+
+def test_matchesAcrossBucketEdges():
+    cache = ResultCache(relError, 1024)
+    # Entries spread over several buckets, each looked up from just above and just below
+    for step in range(256):
+        temperature = 100.0 * (1.0 + 0.25 * step * relError)
+        cache.add(makeInputs(temperature), step)
+    for step in range(256):
+        temperature = 100.0 * (1.0 + 0.25 * step * relError)
+        for scale in (1.0 - 0.9 * relError, 1.0 + 0.9 * relError):
+            assert cache.lookup(makeInputs(temperature * scale)) is not None
+
+def test_farAndZeroInputsMiss():
+    cache = ResultCache(relError, 16)
+    cache.add(makeInputs(100.0), 1)
+    assert cache.lookup(makeInputs(100.0 * (1.0 + 10.0 * relError))) is None
+    assert cache.lookup(makeInputs(100.0 * (1.0 - 10.0 * relError))) is None
+    assert cache.lookup(makeInputs(100.0, density=0.0)) is None
+    cache.add(makeInputs(100.0, density=0.0), 2)
+    assert cache.lookup(makeInputs(100.0, density=0.0)) == 2
+    assert cache.lookup(makeInputs(-100.0)) is None
+
+def test_batchedLookupMatchesScalar():
+    # A large relative error puts many entries in each bucket so lookups go through the batched comparator
+    rng = random.Random(0)
+    batched = ResultCache(0.2, 4096, minBatchCandidates=1)
+    scalar = ResultCache(0.2, 4096, minBatchCandidates=1 << 30)
+    for i in range(4096):
+        inArgs = makeInputs(rng.uniform(10.0, 1000.0), rng.uniform(1e24, 1e25))
+        batched.add(inArgs, i)
+        scalar.add(inArgs, i)
+    for i in range(500):
+        inArgs = makeInputs(rng.uniform(5.0, 2000.0), rng.uniform(5e23, 2e25))
+        assert batched.lookup(inArgs) == scalar.lookup(inArgs)
+    assert batched.getCounts() == scalar.getCounts()
@@ -0,0 +1,111 @@
+import sqlite3
+import pytest
+from glueCodeTypes import SolverCode, DatabaseMode
+from alDBHandlers import getDBHandle
+from initTables import initSQLTables
+from alInterface import pullGlobalResultsToFastDBPython, pullGlobalResultsToFastDBAttach
+
+pullFns = [pullGlobalResultsToFastDBPython, pullGlobalResultsToFastDBAttach]
+
+def makeRow(rank, reqID, tag="TAG"):
+    return (tag, rank, reqID, reqID + 0.5, 2.0) + tuple(float(reqID * 10 + i) for i in range(10)) + (1,)
+
+@pytest.fixture
+def glueDBs(tmp_path):
+    cgSettings = {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": str(tmp_path / "cg.db")}
+    fgSettings = {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": str(tmp_path / "fg.db")}
+    initSQLTables({"solverCode": SolverCode.BGK, "DatabaseSettings": {"CoarseGrainDB": cgSettings, "FineGrainDB": fgSettings}})
+    cgDB = getDBHandle(cgSettings, True)
+    fgDB = getDBHandle(fgSettings)
+    yield (cgDB, fgDB, cgSettings)
+    cgDB.closeDB()
+    fgDB.closeDB()
+
+def insertRows(dbURL, table, rows):
+    connection = sqlite3.connect(dbURL)
+    connection.executemany("INSERT INTO " + table + " VALUES(" + ", ".join(["?"] * 16) + ");", rows)
+    connection.commit()
+    connection.close()
+
+def getRows(dbURL, table):
+    connection = sqlite3.connect(dbURL)
+    rows = connection.execute("SELECT * FROM " + table + " ORDER BY ROWID;").fetchall()
+    connection.close()
+    return rows
+
+@pytest.mark.parametrize("pullFn", pullFns)
+def test_copiesEachRowOnce(glueDBs, pullFn):
+    (cgDB, fgDB, cgSettings) = glueDBs
+    first = [makeRow(0, reqID) for reqID in range(5)]
+    insertRows(fgDB.dbURL, "BGKRESULTS", first)
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == first
+    second = [makeRow(1, reqID) for reqID in range(3)]
+    insertRows(fgDB.dbURL, "BGKRESULTS", second)
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == first + second
+
+@pytest.mark.parametrize("pullFn", pullFns)
+def test_skipsRowsAlreadyThere(glueDBs, pullFn):
+    (cgDB, fgDB, cgSettings) = glueDBs
+    rows = [makeRow(0, reqID) for reqID in range(4)] + [makeRow(0, 1, tag="OTHER")]
+    insertRows(fgDB.dbURL, "BGKRESULTS", rows)
+    insertRows(cgDB.dbURL, "BGKRESULTS", [rows[1]])
+    insertRows(cgDB.dbURL, "BGKFASTRESULTS", [rows[2]])
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == [rows[1], rows[0], rows[3], rows[4]]
+    assert getRows(cgDB.dbURL, "BGKFASTRESULTS") == [rows[2]]
+
+@pytest.mark.parametrize("pullFn", pullFns)
+def test_skipsUnchangedSource(glueDBs, pullFn, monkeypatch):
+    (cgDB, fgDB, cgSettings) = glueDBs
+    insertRows(fgDB.dbURL, "BGKRESULTS", [makeRow(0, 0)])
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    # Nothing new, so the write lock is never taken, which waiting for our own writes comes before
+    waits = []
+    monkeypatch.setattr(cgDB, "waitForWrites", lambda: waits.append(1))
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    assert waits == []
+    insertRows(fgDB.dbURL, "BGKRESULTS", [makeRow(0, 1)])
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    assert waits == [1]
+    assert len(getRows(cgDB.dbURL, "BGKRESULTS")) == 2
+
+@pytest.mark.parametrize("pullFn", pullFns)
+def test_rechecksHoldingWriteLock(glueDBs, pullFn, monkeypatch):
+    (cgDB, fgDB, cgSettings) = glueDBs
+    rows = [makeRow(0, reqID) for reqID in range(3)]
+    insertRows(fgDB.dbURL, "BGKRESULTS", rows)
+    otherDB = getDBHandle(cgSettings, True)
+    rollbacks = []
+    realRollback = cgDB.rollback
+    def otherSync():
+        # Another service syncs between our first look at the cursor and taking the write lock
+        pullFn(SolverCode.BGK, otherDB, fgDB)
+    def countRollback():
+        rollbacks.append(1)
+        realRollback()
+    monkeypatch.setattr(cgDB, "waitForWrites", otherSync)
+    monkeypatch.setattr(cgDB, "rollback", countRollback)
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    otherDB.closeDB()
+    assert rollbacks == [1]
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == rows
+
+@pytest.mark.parametrize("pullFn", pullFns)
+def test_recopiesRecreatedSource(glueDBs, pullFn):
+    (cgDB, fgDB, cgSettings) = glueDBs
+    first = [makeRow(0, reqID) for reqID in range(5)]
+    insertRows(fgDB.dbURL, "BGKRESULTS", first)
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    # The fine grain table is recreated with fewer rows than the cursor has seen
+    connection = sqlite3.connect(fgDB.dbURL)
+    createString = connection.execute("SELECT sql FROM sqlite_master WHERE name='BGKRESULTS';").fetchone()[0]
+    connection.executescript("DROP TABLE BGKRESULTS; " + createString + ";")
+    connection.close()
+    second = [makeRow(2, reqID) for reqID in range(2)]
+    insertRows(fgDB.dbURL, "BGKRESULTS", second)
+    pullFn(SolverCode.BGK, cgDB, fgDB)
+    assert getRows(cgDB.dbURL, "BGKRESULTS") == first + second
@@ -0,0 +1,73 @@
+import sqlite3
+import threading
+import time
+import pytest
+from glueCodeTypes import SolverCode, DatabaseMode, ResultProvenance
+from alDBHandlers import WriteBehindWriter
+from initTables import initSQLTables
+
+def makeRow(rank, reqID):
+    return ("TAG", rank, reqID, reqID + 0.5, 2.0) + tuple(float(reqID * 10 + i) for i in range(10)) + (int(ResultProvenance.FGS),)
+
+@pytest.fixture
+def dbSettings(tmp_path):
+    # A short busy timeout makes the writer see lock errors instead of waiting them out
+    dbSettings = {"DatabaseMode": DatabaseMode.SQLITE, "DatabaseURL": str(tmp_path / "cg.db"), "Pragmas": {"busy_timeout": 50}}
+    initSQLTables({"solverCode": SolverCode.BGK, "DatabaseSettings": {"CoarseGrainDB": dbSettings, "FineGrainDB": dbSettings}})
+    return dbSettings
+
+def getRows(dbURL, table):
+    connection = sqlite3.connect(dbURL)
+    rows = connection.execute("SELECT * FROM " + table + " ORDER BY ROWID;").fetchall()
+    connection.close()
+    return rows
+
+def joinWithin(writer, seconds):
+    # Returns the exception raised by join, failing if join is still waiting
+    outcome = {}
+    def join():
+        try:
+            writer.join()
+        except Exception as ex:
+            outcome["error"] = ex
+    joiner = threading.Thread(target=join, daemon=True)
+    joiner.start()
+    joiner.join(seconds)
+    assert not joiner.is_alive()
+    return outcome.get("error")
+
+def test_retriesBatchUntilLockIsReleased(dbSettings):
+    writer = WriteBehindWriter(dbSettings, 2)
+    attempts = []
+    realInsertRows = writer.dbHandle.insertRows
+    def insertRows(tableRows):
+        attempts.append(time.monotonic())
+        return realInsertRows(tableRows)
+    writer.dbHandle.insertRows = insertRows
+    locker = sqlite3.connect(dbSettings["DatabaseURL"], isolation_level=None)
+    locker.execute("BEGIN IMMEDIATE;")
+    rows = [makeRow(0, reqID) for reqID in range(3)]
+    writer.put({"BGKFASTRESULTS": rows})
+    time.sleep(0.5)
+    # Nothing goes through while the lock is held, but the batch is still waiting
+    assert len(attempts) > 1
+    assert getRows(dbSettings["DatabaseURL"], "BGKFASTRESULTS") == []
+    locker.execute("COMMIT;")
+    locker.close()
+    assert joinWithin(writer, 10.0) is None
+    assert getRows(dbSettings["DatabaseURL"], "BGKFASTRESULTS") == rows
+    writer.close()
+
+def test_raisesErrorsThatAreNotLocks(dbSettings):
+    writer = WriteBehindWriter(dbSettings, 1)
+    writer.put({"NOSUCHTABLE": [makeRow(0, 0)]})
+    # Later batches are dropped rather than left for join to wait on
+    writer.batches.put({"BGKFASTRESULTS": [makeRow(0, 1)]})
+    error = joinWithin(writer, 10.0)
+    assert "Write Behind Insert" in str(error)
+    assert isinstance(error.__cause__, sqlite3.OperationalError)
+    with pytest.raises(Exception, match="Write Behind Insert"):
+        writer.put({"BGKFASTRESULTS": [makeRow(0, 2)]})
+    assert getRows(dbSettings["DatabaseURL"], "BGKFASTRESULTS") == []
+    with pytest.raises(Exception, match="Write Behind Insert"):
+        writer.close()